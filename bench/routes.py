@@ -0,0 +1,535 @@
+"""
+Route-level benchmark for the blog.
+
+Seeds the testbed datastore with a configurable volume of synthetic users,
+posts, comments and likes, then drives every route in main.app through
+webtest, recording for each scenario:
+
+    - p50, p95 and mean latency
+    - datastore and memcache RPCs per request, by call
+    - bytes rendered per request
+
+Run from the project directory, with the App Engine SDK on your PYTHONPATH:
+
+    python -m bench.routes --posts 10000 --comments 1000000 \\
+        --output bench_results.json --baseline previous_results.json
+
+Results are written as JSON. Given a baseline (the output of a previous run),
+scenarios whose p95 latency or datastore RPCs grew are also reported on
+stdout, and the exit status is 1
+"""
+
+import argparse
+import cProfile
+import io
+import json
+import random
+import sys
+import time
+import webtest
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb as db
+from google.appengine.ext import testbed
+from main import app
+from model.comment import Comment
+from model.like import LikeCounterShard
+from model.post import Post
+from model.transfer import (TransferChunk, TransferJob, serialize,
+                            start_export, start_import)
+from model.user import User
+from util.auth import create_user_cookie
+from util.profiling import save_profile
+import settings
+
+BATCH_SIZE = 500
+
+
+class RPCCounter(object):
+    """
+    An apiproxy hook that tallies RPCs, by service and call
+    """
+
+    def __init__(self):
+        self.calls = {}
+
+    def count(self, service, call, request, response):
+        name = '%s.%s' % (service, call)
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def snapshot(self):
+        return dict(self.calls)
+
+
+class Fixture(object):
+    """
+    The identifiers of the seeded data that scenarios refer to
+
+    Attributes:
+        users: The usernames of the seeded users
+        post_ids: The identifiers of the seeded posts, most liked (and most
+            commented on) first
+        comments: (post_id, comment_id, submitter) for a comment on each of
+            the most commented on posts
+    """
+
+    def __init__(self, users, post_ids, comments):
+        self.users = users
+        self.post_ids = post_ids
+        self.comments = comments
+
+    @property
+    def hot_post_id(self):
+        return self.post_ids[0]
+
+    @property
+    def author(self):
+        return self.users[0]
+
+    @property
+    def reader(self):
+        return self.users[1]
+
+
+def _skewed(total, count, skew):
+    # Split total between count items in proportion to 1 / rank ** skew
+    weights = [1.0 / (rank ** skew) for rank in range(1, count + 1)]
+    scale = total / sum(weights)
+    return [int(weight * scale) for weight in weights]
+
+
+def _put_in_batches(entities):
+    for start in range(0, len(entities), BATCH_SIZE):
+        db.put_multi(entities[start:start + BATCH_SIZE])
+
+
+def seed(users, posts, comments, max_likes, skew):
+    """
+    Seed the datastore with synthetic data. Likes and comments are
+    distributed across posts with a power-law skew, so that a few posts are
+    very popular
+
+    Args:
+        users: The number of users to create (at least 2)
+        posts: The number of posts to create
+        comments: The total number of comments to create
+        max_likes: The number of likes of the most liked post
+        skew: The exponent of the power law
+
+    Returns:
+        A Fixture
+    """
+    usernames = ['bench-user-%d' % n for n in range(max(users, 2))]
+    _put_in_batches([User(id=username, password='password')
+                     for username in usernames])
+
+    like_counts = [int(max_likes / (rank ** skew))
+                   for rank in range(1, posts + 1)]
+    comment_counts = _skewed(comments, posts, skew)
+    content = ' '.join(['Lorem ipsum dolor sit amet.'] * 40)
+
+    post_entities = [Post(title='Post %d' % rank,
+                          content=content,
+                          submitter=usernames[rank % len(usernames)],
+                          likes=like_counts[rank] + 1,
+                          comment_count=comment_counts[rank])
+                     for rank in range(posts)]
+    _put_in_batches(post_entities)
+    post_ids = [post.key.integer_id() for post in post_entities]
+
+    shards = []
+    for post_id, likes in zip(post_ids, like_counts):
+        if likes:
+            shard_key = LikeCounterShard.keys_for(post_id)[0]
+            shards.append(LikeCounterShard(key=shard_key, count=likes))
+    _put_in_batches(shards)
+
+    sample_comments = []
+    for post_id, count in zip(post_ids, comment_counts):
+        batch = [Comment.create(post_id, content='Comment %d' % n,
+                                submitter=usernames[n % len(usernames)])
+                 for n in range(count)]
+        _put_in_batches(batch)
+        if batch and len(sample_comments) < 10:
+            sample_comments.append((post_id, batch[0].key.integer_id(),
+                                    batch[0].submitter))
+
+    return Fixture(usernames, post_ids, sample_comments)
+
+
+def _new_post(fixture):
+    return Post(title='Disposable', content='Disposable',
+                submitter=fixture.author).put().integer_id()
+
+
+def _new_comment(fixture):
+    comment = Comment.create(fixture.hot_post_id, content='Disposable',
+                             submitter=fixture.author)
+    comment.put()
+    return comment.key.integer_id()
+
+
+def _sample_export(fixture):
+    # An export, as JSON Lines, of the hot post and the sample comments
+    entities = [Post.get_by_id(fixture.hot_post_id)] + [
+        Comment.get_for_post(post_id, comment_id)
+        for post_id, comment_id, submitter in fixture.comments]
+    return u''.join(unicode(serialize(entity)) + u'\n'
+                    for entity in entities)
+
+
+def _finished_export(fixture):
+    job = TransferJob(direction='export', status='done', chunks=1)
+    job.put()
+    TransferChunk(key=job.chunk_key(1), data=_sample_export(fixture)).put()
+    return job.key.integer_id()
+
+
+def _new_import(fixture):
+    source = io.BytesIO(_sample_export(fixture).encode('utf-8'))
+    return start_import(source).key.integer_id()
+
+
+def _new_profile(fixture):
+    profiler = cProfile.Profile()
+    start = time.time()
+    profiler.runcall(Post.get_by_id, fixture.hot_post_id)
+    return save_profile(profiler, '/posts/<post_id:\\d+>',
+                        '/posts/%d' % fixture.hot_post_id,
+                        time.time() - start)
+
+
+# Each scenario is (name, route template, method, build), where build is
+# called with the Fixture and the iteration number, untimed, and returns
+# (url, POST params or None, signed in username or None)
+SCENARIOS = [
+    ('front page', '/', 'GET',
+     lambda f, i: ('/', None, None)),
+    ('front page, signed in', '/', 'GET',
+     lambda f, i: ('/', None, f.reader)),
+    ('front page, most discussed', '/', 'GET',
+     lambda f, i: ('/?sort=discussed', None, None)),
+    ('front page, recently active', '/', 'GET',
+     lambda f, i: ('/?sort=active', None, None)),
+    ('front page, hot', '/', 'GET',
+     lambda f, i: ('/?sort=hot', None, None)),
+    ('new post form', '/posts/new', 'GET',
+     lambda f, i: ('/posts/new', None, f.author)),
+    ('create post', '/posts', 'POST',
+     lambda f, i: ('/posts', {'title': 'New %d' % i, 'content': 'New'},
+                   f.author)),
+    ('post page, hot post', '/posts/<post_id:\\d+>', 'GET',
+     lambda f, i: ('/posts/%d' % f.hot_post_id, None, f.reader)),
+    ('post page, anonymous', '/posts/<post_id:\\d+>', 'GET',
+     lambda f, i: ('/posts/%d' % f.post_ids[i % len(f.post_ids)], None,
+                   None)),
+    ('edit post form', '/posts/<post_id:\\d+>/edit', 'GET',
+     lambda f, i: ('/posts/%d/edit' % f.post_ids[0], None, f.author)),
+    ('edit post', '/posts/<post_id:\\d+>/edit', 'POST',
+     lambda f, i: ('/posts/%d/edit' % f.post_ids[0],
+                   {'title': 'Edited %d' % i, 'content': 'Edited'},
+                   f.author)),
+    ('delete post', '/posts/<post_id:\\d+>/delete', 'GET',
+     lambda f, i: ('/posts/%d/delete' % _new_post(f), None, f.author)),
+    ('like post', '/posts/<post_id:\\d+>/like', 'GET',
+     lambda f, i: ('/posts/%d/like' % f.hot_post_id, None,
+                   f.users[2 + i % (len(f.users) - 2)]
+                   if len(f.users) > 2 else f.reader)),
+    ('search', '/search', 'GET',
+     lambda f, i: ('/search?q=lorem+ipsum', None, None)),
+    ('feed', '/feed.atom', 'GET',
+     lambda f, i: ('/feed.atom', None, None)),
+    ('author feed', '/users/<user_id:[^/]+>/feed.atom', 'GET',
+     lambda f, i: ('/users/%s/feed.atom' % f.author, None, None)),
+    ('api posts', '/api/v1/posts', 'GET',
+     lambda f, i: ('/api/v1/posts?fields=id,title,likes', None, None)),
+    ('api post', '/api/v1/posts/<post_id:\\d+>', 'GET',
+     lambda f, i: ('/api/v1/posts/%d' % f.hot_post_id, None, None)),
+    ('api comments', '/api/v1/posts/<post_id:\\d+>/comments', 'GET',
+     lambda f, i: ('/api/v1/posts/%d/comments' % f.hot_post_id, None,
+                   None)),
+    ('api likes', '/api/v1/posts/<post_id:\\d+>/likes', 'GET',
+     lambda f, i: ('/api/v1/posts/%d/likes' % f.hot_post_id, None,
+                   f.reader)),
+    ('author page', '/users/<user_id:[^/]+>', 'GET',
+     lambda f, i: ('/users/%s' % f.author, None, None)),
+    ('author page, comments', '/users/<user_id:[^/]+>', 'GET',
+     lambda f, i: ('/users/%s?show=comments' % f.comments[0][2], None,
+                   None)),
+    ('sign up form', '/users/new', 'GET',
+     lambda f, i: ('/users/new', None, None)),
+    ('sign up', '/users/new', 'POST',
+     lambda f, i: ('/users/new', {'username': 'bench-new-%d' % i,
+                                  'password': 'password'}, None)),
+    ('sign in form', '/users/in', 'GET',
+     lambda f, i: ('/users/in', None, None)),
+    ('sign in', '/users/in', 'POST',
+     lambda f, i: ('/users/in', {'username': f.reader,
+                                 'password': 'password'}, None)),
+    ('sign out', '/users/out', 'GET',
+     lambda f, i: ('/users/out', None, f.reader)),
+    ('welcome', '/users/welcome', 'GET',
+     lambda f, i: ('/users/welcome', None, f.reader)),
+    ('more comments', '/posts/<post_id:\\d+>/comments', 'GET',
+     lambda f, i: ('/posts/%d/comments' % f.hot_post_id, None, None)),
+    ('create comment', '/posts/<post_id:\\d+>/comments', 'POST',
+     lambda f, i: ('/posts/%d/comments' % f.hot_post_id,
+                   {'content': 'New %d' % i}, f.reader)),
+    ('edit comment form', '/posts/<post_id:\\d+>/comments/<comment_id:\\d+>',
+     'GET',
+     lambda f, i: ('/posts/%d/comments/%d' % f.comments[0][:2], None,
+                   f.comments[0][2])),
+    ('edit comment',
+     '/posts/<post_id:\\d+>/comments/<comment_id:\\d+>/edit', 'POST',
+     lambda f, i: ('/posts/%d/comments/%d/edit' % f.comments[0][:2],
+                   {'content': 'Edited %d' % i}, f.comments[0][2])),
+    ('delete comment',
+     '/posts/<post_id:\\d+>/comments/<comment_id:\\d+>/delete', 'GET',
+     lambda f, i: ('/posts/%d/comments/%d/delete' %
+                   (f.hot_post_id, _new_comment(f)), None, f.author)),
+    ('fold likes task', '/tasks/fold-likes', 'POST',
+     lambda f, i: ('/tasks/fold-likes', {'post_id': f.hot_post_id}, None)),
+    ('delete comments task', '/tasks/delete-comments', 'POST',
+     lambda f, i: ('/tasks/delete-comments', {'post_id': _new_post(f)},
+                   None)),
+    ('rescore hot task', '/tasks/rescore-hot', 'POST',
+     lambda f, i: ('/tasks/rescore-hot', {'since': 0}, None)),
+    ('backfill excerpts task', '/tasks/backfill-excerpts', 'POST',
+     lambda f, i: ('/tasks/backfill-excerpts', {}, None)),
+    ('backfill comment stats task', '/tasks/backfill-comment-stats', 'POST',
+     lambda f, i: ('/tasks/backfill-comment-stats', {}, None)),
+    ('migrate likes task', '/tasks/migrate-likes', 'POST',
+     lambda f, i: ('/tasks/migrate-likes', {}, None)),
+    ('migrate comments task', '/tasks/migrate-comments', 'POST',
+     lambda f, i: ('/tasks/migrate-comments', {}, None)),
+    ('reindex posts task', '/tasks/reindex-posts', 'POST',
+     lambda f, i: ('/tasks/reindex-posts', {}, None)),
+    ('reindex comments task', '/tasks/reindex-comments', 'POST',
+     lambda f, i: ('/tasks/reindex-comments', {}, None)),
+    ('export task', '/tasks/export', 'POST',
+     lambda f, i: ('/tasks/export',
+                   {'job_id': start_export().key.integer_id()}, None)),
+    ('import task', '/tasks/import', 'POST',
+     lambda f, i: ('/tasks/import', {'job_id': _new_import(f)}, None)),
+    ('start export', '/admin/export', 'POST',
+     lambda f, i: ('/admin/export', {}, None)),
+    ('start import', '/admin/import', 'POST',
+     lambda f, i: ('/admin/import',
+                   {'file': webtest.Upload(
+                       'export.jsonl', _sample_export(f).encode('utf-8'))},
+                   None)),
+    ('transfer status', '/admin/transfers/<job_id:\\d+>', 'GET',
+     lambda f, i: ('/admin/transfers/%d' % _finished_export(f), None,
+                   None)),
+    ('download export', '/admin/transfers/<job_id:\\d+>/download', 'GET',
+     lambda f, i: ('/admin/transfers/%d/download' % _finished_export(f),
+                   None, None)),
+    ('warmup', '/_ah/warmup', 'GET',
+     lambda f, i: ('/_ah/warmup', None, None)),
+    ('recent profiles', '/admin/profiles', 'GET',
+     lambda f, i: ('/admin/profiles', None, None)),
+    ('profile', '/admin/profiles/<profile_id:[0-9a-f]+>', 'GET',
+     lambda f, i: ('/admin/profiles/%s' % _new_profile(f), None, None)),
+]
+
+
+def uncovered_routes():
+    """
+    Returns:
+        The templates of routes in main.app that no scenario exercises
+    """
+    covered = set(template for name, template, method, build in SCENARIOS)
+    return [route.template for route in app.router.match_routes
+            if route.template not in covered]
+
+
+def _percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    index = max(int(round(fraction * len(sorted_values))) - 1, 0)
+    return sorted_values[index]
+
+
+def run_scenario(testapp, counter, fixture, build, method, iterations, cold):
+    """
+    Time one scenario
+
+    Args:
+        testapp: The webtest.TestApp wrapping main.app
+        counter: The RPCCounter installed on the apiproxy
+        fixture: The Fixture the scenario refers to
+        build: The scenario's build function
+        method: 'GET' or 'POST'
+        iterations: The number of requests to measure
+        cold: If True, memcache is flushed before each request
+
+    Returns:
+        A dict of the scenario's measurements
+    """
+    def request(iteration):
+        # memcache is flushed before the build, so that what the build
+        # stores there (such as a profile) survives
+        if cold:
+            memcache.flush_all()
+        url, params, user = build(fixture, iteration)
+        testapp.reset()
+        if user:
+            testapp.set_cookie('user', create_user_cookie(str(user)))
+        # Each request gets a fresh ndb context cache, as it would in
+        # production
+        db.get_context().clear_cache()
+
+        before = counter.snapshot()
+        start = time.time()
+        if method == 'POST':
+            response = testapp.post(url, params or {}, status='*')
+        else:
+            response = testapp.get(url, status='*')
+        latency = time.time() - start
+        after = counter.snapshot()
+        return response, latency, dict(
+            (call, count - before.get(call, 0))
+            for call, count in after.items())
+
+    # The first request is a warm-up, and is not measured
+    request(iterations)
+
+    latencies = []
+    rendered = 0
+    statuses = {}
+    calls = {}
+    for iteration in range(iterations):
+        response, latency, request_calls = request(iteration)
+        latencies.append(latency)
+        rendered += len(response.body)
+        statuses[response.status_int] = \
+            statuses.get(response.status_int, 0) + 1
+        for call, count in request_calls.items():
+            calls[call] = calls.get(call, 0) + count
+
+    latencies.sort()
+    datastore_calls = dict((call[len('datastore_v3.'):], count)
+                           for call, count in calls.items()
+                           if call.startswith('datastore_v3.') and count)
+    memcache_calls = dict((call[len('memcache.'):], count)
+                          for call, count in calls.items()
+                          if call.startswith('memcache.') and count)
+    return {
+        'requests': iterations,
+        'statuses': dict((str(status), count)
+                         for status, count in statuses.items()),
+        'p50_ms': round(_percentile(latencies, 0.5) * 1000, 3),
+        'p95_ms': round(_percentile(latencies, 0.95) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'datastore_rpcs': float(sum(datastore_calls.values())) / iterations,
+        'datastore_rpcs_by_call': dict(
+            (call, float(count) / iterations)
+            for call, count in datastore_calls.items()),
+        'memcache_rpcs': float(sum(memcache_calls.values())) / iterations,
+        'bytes': rendered // iterations,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Find scenarios that regressed against a previous run
+
+    Args:
+        results: The results of this run
+        baseline: The results of a previous run
+        tolerance: The fractional growth in p95 latency to tolerate
+
+    Returns:
+        A list of strs describing each regression
+    """
+    regressions = []
+    for name, result in sorted(results['scenarios'].items()):
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        if result['datastore_rpcs'] > previous['datastore_rpcs']:
+            regressions.append('%s: datastore RPCs %.1f -> %.1f' % (
+                name, previous['datastore_rpcs'], result['datastore_rpcs']))
+        if result['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append('%s: p95 %.1fms -> %.1fms' % (
+                name, previous['p95_ms'], result['p95_ms']))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--comments', type=int, default=20000)
+    parser.add_argument('--max-likes', type=int, default=5000,
+                        help='likes of the most liked post')
+    parser.add_argument('--skew', type=float, default=1.1,
+                        help='power-law exponent for likes and comments')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--cold', action='store_true',
+                        help='flush memcache before every request')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline',
+                        help='results of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='fractional p95 growth to tolerate')
+    args = parser.parse_args(argv)
+    random.seed(args.seed)
+
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub(
+        consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1))
+    bed.init_memcache_stub()
+    bed.init_taskqueue_stub()
+
+    start = time.time()
+    fixture = seed(args.users, args.posts, args.comments, args.max_likes,
+                   args.skew)
+    seconds_to_seed = time.time() - start
+
+    counter = RPCCounter()
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+        'bench_rpc_counter', counter.count)
+    testapp = webtest.TestApp(app)
+
+    results = {
+        'config': dict(vars(args),
+                       comment_entity_groups=settings.COMMENT_ENTITY_GROUPS,
+                       comment_ancestor_queries=(
+                           settings.COMMENT_ANCESTOR_QUERIES),
+                       seconds_to_seed=round(seconds_to_seed, 1)),
+        'uncovered_routes': uncovered_routes(),
+        'scenarios': {},
+    }
+    for name, template, method, build in SCENARIOS:
+        result = run_scenario(testapp, counter, fixture, build, method,
+                              args.iterations, args.cold)
+        result.update(route=template, method=method)
+        results['scenarios'][name] = result
+        print('%-32s p50 %8.2fms  p95 %8.2fms  %5.1f datastore RPCs  '
+              '%7d bytes' % (name, result['p50_ms'], result['p95_ms'],
+                             result['datastore_rpcs'], result['bytes']))
+
+    bed.deactivate()
+
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+
+    for template in results['uncovered_routes']:
+        print('No scenario exercises %s' % template)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline),
+                                  args.tolerance)
+        for regression in regressions:
+            print('Regression: %s' % regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
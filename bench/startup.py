@@ -0,0 +1,159 @@
+"""
+Cold start measurement for the blog.
+
+Measures, in a fresh interpreter, how long a new instance spends before it
+can serve its first request: importing the frameworks and the application
+(STARTUP_PHASES, in order, each timed as the modules it adds), then loading
+every template. Each run uses a new process, so nothing is already imported;
+the median of several runs is reported.
+
+The application is configured as in production, and the templates are
+precompiled first (as they are before deploying), so the templates are
+imported from template_compiled/ as a deployed instance imports them. If
+template_compiled/ did not already exist, it is removed again afterwards.
+
+Run from the project directory, with the App Engine SDK on your PYTHONPATH:
+
+    python -m bench.startup --runs 5 --budget 1000
+
+The timings are printed (or written as JSON with --json), and the exit status
+is 1 if the total exceeds the budget
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+# The phases of a cold start, as (name, modules imported), in the order that
+# main imports them
+STARTUP_PHASES = [
+    ('webapp2', ['webapp2']),
+    ('jinja2', ['jinja2']),
+    ('ndb', ['google.appengine.ext.ndb', 'google.appengine.api.memcache',
+             'google.appengine.api.taskqueue']),
+    ('models', ['model.post', 'model.comment', 'model.like', 'model.user',
+                'model.search', 'model.transfer']),
+    ('templates environment', ['util.templates']),
+    ('handlers', ['handler.posts', 'handler.comments', 'handler.users',
+                  'handler.feeds', 'handler.search', 'handler.api',
+                  'handler.tasks', 'handler.admin', 'handler.warmup']),
+    ('main', ['main']),
+]
+
+# The cold start budget, in milliseconds, for importing main and loading
+# every template
+BUDGET_MS = 1000
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_COMPILED_TEMPLATE_DIR = os.path.join(_PROJECT_DIR, 'template_compiled')
+
+# The SERVER_SOFTWARE that the child process runs with, so that settings
+# takes it to be a production instance
+_SERVER_SOFTWARE = 'Google App Engine/bench'
+
+# Run in the child process. A memcache stub is registered (untimed) once the
+# application is imported, in case any template falls back to the memcached
+# bytecode cache
+_CHILD = """
+import json, sys, time
+timings = []
+for name, modules in %r:
+    start = time.time()
+    for module in modules:
+        __import__(module)
+    timings.append((name, (time.time() - start) * 1000))
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api.memcache import memcache_stub
+apiproxy_stub_map.apiproxy.RegisterStub('memcache',
+                                        memcache_stub.MemcacheServiceStub())
+from util.templates import load_templates
+start = time.time()
+load_templates()
+timings.append(('load templates', (time.time() - start) * 1000))
+sys.stdout.write(json.dumps(timings))
+"""
+
+
+def precompile_templates():
+    """
+    Compile every template into template_compiled/, as is done before
+    deploying
+    """
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call([sys.executable, '-m', 'util.templates'],
+                              cwd=_PROJECT_DIR, stdout=devnull)
+
+
+def measure_once():
+    """
+    Time one cold start, in a new Python process
+
+    Returns:
+        A list of (phase, milliseconds), in order
+    """
+    env = dict(os.environ, SERVER_SOFTWARE=_SERVER_SOFTWARE)
+    with open(os.devnull, 'w') as devnull:
+        output = subprocess.check_output(
+            [sys.executable, '-c', _CHILD % (STARTUP_PHASES,)],
+            cwd=_PROJECT_DIR, env=env, stderr=devnull)
+    return [(name, ms) for name, ms in json.loads(output)]
+
+
+def measure(runs=3):
+    """
+    Time several cold starts
+
+    Args:
+        runs: The number of cold starts to time
+
+    Returns:
+        A dict with 'phases', the median milliseconds of each phase as a list
+        of (phase, milliseconds), and 'total_ms', the median total
+    """
+    precompiled = os.path.isdir(_COMPILED_TEMPLATE_DIR)
+    precompile_templates()
+    try:
+        samples = [measure_once() for _ in range(runs)]
+    finally:
+        if not precompiled:
+            shutil.rmtree(_COMPILED_TEMPLATE_DIR)
+
+    def median(values):
+        return sorted(values)[len(values) // 2]
+
+    phases = [(name, round(median([sample[n][1] for sample in samples]), 1))
+              for n, (name, ms) in enumerate(samples[0])]
+    total = median([sum(ms for name, ms in sample) for sample in samples])
+    return {'phases': phases, 'total_ms': round(total, 1)}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=BUDGET_MS,
+                        help='maximum total milliseconds')
+    parser.add_argument('--json', action='store_true',
+                        help='write the results as JSON')
+    args = parser.parse_args(argv)
+
+    results = measure(args.runs)
+    results['budget_ms'] = args.budget
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, ms in results['phases']:
+            print('%-24s %8.1fms' % (name, ms))
+        print('%-24s %8.1fms (budget %.0fms)' % ('total', results['total_ms'],
+                                                 args.budget))
+
+    if results['total_ms'] > args.budget:
+        print('Cold start exceeds its budget')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
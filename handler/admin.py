@@ -0,0 +1,124 @@
+"""
+Handlers for administrators' tools.
+
+Every URL under /admin is restricted to administrators in app.yaml
+"""
+import json
+import webapp2
+from google.appengine.api import taskqueue
+import model.transfer as transfer
+import util.profiling as profiling
+
+
+class ProfilesHandler(webapp2.RequestHandler):
+    """
+    Lists the most recent request profiles (see util.profiling), newest
+    first, as JSON
+    """
+
+    def get(self):
+        self.response.content_type = 'application/json'
+        self.response.out.write(json.dumps(profiling.recent_profiles()))
+
+
+class ProfileHandler(webapp2.RequestHandler):
+    """
+    Downloads a request profile, in the format that pstats loads, e.g.
+
+        python -c "import pstats; pstats.Stats('request.prof').print_stats()"
+
+    The optional 'format=text' query parameter responds with a pstats report
+    instead, sorted by the optional 'sort' query parameter (default
+    'cumulative')
+
+    The GET method expects kwargs 'profile_id'
+    """
+
+    def get(self, profile_id):
+        data = profiling.load_profile(profile_id)
+        if data is None:
+            self.abort(404)
+
+        if self.request.get('format') == 'text':
+            self.response.content_type = 'text/plain'
+            self.response.out.write(profiling.format_profile(
+                data, self.request.get('sort') or 'cumulative'))
+        else:
+            self.response.content_type = 'application/octet-stream'
+            self.response.headers['Content-Disposition'] = (
+                'attachment; filename="%s.prof"' % profile_id)
+            self.response.out.write(data)
+
+
+class ExportHandler(webapp2.RequestHandler):
+    """
+    Starts an export of every post, comment, user and like as JSON Lines
+    (see model.transfer), and responds with the new job's status as JSON.
+    The export runs on the task queue; once its status is 'done' it can be
+    downloaded from /admin/transfers/<job_id>/download
+    """
+
+    def post(self):
+        job = transfer.start_export()
+        taskqueue.add(url='/tasks/export',
+                      params={'job_id': job.key.integer_id()})
+        self.response.status = 202
+        self.response.content_type = 'application/json'
+        self.response.out.write(json.dumps(job.to_status()))
+
+
+class ImportHandler(webapp2.RequestHandler):
+    """
+    Starts an import of JSON Lines, as written by an export, from the
+    uploaded file in the 'file' form field, and responds with the new job's
+    status as JSON. The import runs on the task queue
+    """
+
+    def post(self):
+        upload = self.request.POST.get('file')
+        if upload is None or not hasattr(upload, 'file'):
+            self.abort(400)
+
+        job = transfer.start_import(upload.file)
+        taskqueue.add(url='/tasks/import',
+                      params={'job_id': job.key.integer_id()})
+        self.response.status = 202
+        self.response.content_type = 'application/json'
+        self.response.out.write(json.dumps(job.to_status()))
+
+
+class TransferHandler(webapp2.RequestHandler):
+    """
+    Responds with the status of an export or import as JSON
+
+    The GET method expects kwargs 'job_id'
+    """
+
+    def get(self, job_id):
+        job = transfer.TransferJob.get_by_id(int(job_id))
+        if not job:
+            self.abort(404)
+
+        self.response.content_type = 'application/json'
+        self.response.out.write(json.dumps(job.to_status()))
+
+
+class DownloadExportHandler(webapp2.RequestHandler):
+    """
+    Streams a finished export as JSON Lines, a chunk at a time
+
+    The GET method expects kwargs 'job_id'. Responds 409 if the export is
+    still running
+    """
+
+    def get(self, job_id):
+        job = transfer.TransferJob.get_by_id(int(job_id))
+        if not job or job.direction != 'export':
+            self.abort(404)
+        if job.status != 'done':
+            self.abort(409)
+
+        self.response.content_type = 'application/x-ndjson'
+        self.response.headers['Content-Disposition'] = (
+            'attachment; filename="blog-export-%s.jsonl"' % job_id)
+        self.response.app_iter = transfer.iter_export(job)
@@ -0,0 +1,245 @@
+"""
+Handlers for the read-only JSON API, served under /api/v1/.
+
+Responses are compact JSON objects, and carry ETags so that clients can
+revalidate them with If-None-Match. Datetimes are given in ISO 8601 format,
+in UTC. Errors are answered with an object holding an 'error' message.
+
+Listings are paged with cursors: a response's 'next' member, when not null,
+is passed back in the 'cursor' query parameter to fetch the following page.
+
+The optional 'fields' query parameter is a comma separated list of the
+members to include in each post or comment, so that clients fetch only what
+they display. Post listings that ask only for fields in
+Post.SUMMARY_PROPERTIES are read with a projection query, so post content is
+never loaded
+"""
+import json
+from google.appengine.api import memcache
+from webob import exc
+from handler.posts import FRONT_PAGE_NAMESPACE, FRONT_PAGE_ORDERS
+from model.comment import Comment
+from model.like import like_count, user_has_liked
+from model.post import Post
+from util.RequestHandler import AuthAwareRequestHandler
+from util.pagination import fetch_next_page_async
+import util.auth_decorators as check
+import util.cache as cache
+import settings
+
+# The fields that can be requested for posts and comments. Post listings
+# include only the summary fields, which can be projected, unless others are
+# requested
+POST_SUMMARY_FIELDS = ('id',) + Post.SUMMARY_PROPERTIES
+POST_FIELDS = POST_SUMMARY_FIELDS + ('content', 'updated')
+COMMENT_FIELDS = ('id', 'post_id', 'submitter', 'submitted', 'content',
+                  'updated')
+
+_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def _encode_value(value):
+    if hasattr(value, 'strftime'):
+        return value.strftime(_DATETIME_FORMAT)
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+def to_json(data):
+    """
+    Args:
+        data: A JSON serializable value, whose datetimes are naive UTC
+            datetimes
+
+    Returns:
+        The value as compact JSON, as a str
+    """
+    return json.dumps(data, default=_encode_value, separators=(',', ':'),
+                      sort_keys=True)
+
+
+def select_fields(entity, fields):
+    """
+    Args:
+        entity: A Post or Comment, which may be a projection
+        fields: The names of the fields to include
+
+    Returns:
+        A dict of the entity's fields, with its identifier as 'id'
+    """
+    return dict((name, entity.key.id() if name == 'id'
+                 else getattr(entity, name))
+                for name in fields)
+
+
+class ApiHandler(AuthAwareRequestHandler):
+    """
+    Base class for API handlers
+
+    Aborted requests (including those aborted by the decorators in
+    util.auth_decorators) are answered with a JSON error rather than an
+    error page
+    """
+
+    def requested_fields(self, available, default=None):
+        """
+        Parse the request's 'fields' query parameter, aborting with 400 if it
+        names a field that is not available
+
+        Args:
+            available: The names of the fields that can be requested
+            default: The names of the fields to include if none are
+                requested, or None to include every available field
+
+        Returns:
+            A tuple of the requested field names
+        """
+        requested = self.request.get('fields')
+        if not requested:
+            return default or available
+        fields = tuple(name.strip() for name in requested.split(',')
+                       if name.strip())
+        unknown = [name for name in fields if name not in available]
+        if unknown:
+            self.abort(400, detail='Unknown fields: %s' % ', '.join(unknown))
+        return fields
+
+    def requested_limit(self, default):
+        """
+        Parse the request's 'limit' query parameter, aborting with 400 if it
+        is not a whole number from 1 to settings.API_MAX_PAGE_SIZE
+
+        Args:
+            default: The limit if none is given
+
+        Returns:
+            The page size, as an int
+        """
+        limit = self.request.get('limit')
+        if not limit:
+            return default
+        if not limit.isdigit() or \
+                not 1 <= int(limit) <= settings.API_MAX_PAGE_SIZE:
+            self.abort(400, detail='limit must be from 1 to %d' %
+                       settings.API_MAX_PAGE_SIZE)
+        return int(limit)
+
+    def write_json(self, body):
+        """
+        Respond with JSON, or with 304 if the client's copy is current. The
+        body itself is the ETag's validator
+
+        Args:
+            body: The response, as a JSON str
+        """
+        if self.not_modified((body,)):
+            return
+        self.response.content_type = 'application/json'
+        self.response.write(body)
+
+    def handle_exception(self, exception, debug):
+        if not isinstance(exception, exc.HTTPException):
+            raise
+        self.response.set_status(exception.code)
+        self.response.content_type = 'application/json'
+        self.response.write(to_json(
+            {'error': exception.detail or exception.title}))
+
+
+class PostsHandler(ApiHandler):
+    """
+    Lists posts, in pages of settings.FRONT_PAGE_SIZE (or of the optional
+    'limit' query parameter)
+
+    The optional 'sort' query parameter orders them as the front page does
+    (see handler.posts.FRONT_PAGE_ORDERS). Responses are cached alongside the
+    front page, and invalidated with it
+    """
+
+    def get(self):
+        orders = dict(FRONT_PAGE_ORDERS)
+        sort = self.request.get('sort') or FRONT_PAGE_ORDERS[0][0]
+        if sort not in orders:
+            self.abort(400, detail='Unknown sort: %s' % sort)
+        fields = self.requested_fields(POST_FIELDS, POST_SUMMARY_FIELDS)
+        limit = self.requested_limit(settings.FRONT_PAGE_SIZE)
+        cursor = self.request.get('cursor')
+
+        key = cache.versioned_key(FRONT_PAGE_NAMESPACE, 'api', sort, cursor,
+                                  limit, *fields)
+        recent = cache.recently_bumped(FRONT_PAGE_NAMESPACE)
+        if self.not_modified((key, recent)):
+            return
+
+        body = memcache.get(key)
+        if body is None:
+            # Only the summary properties are projected, so that the query
+            # is served by the front page's indexes whichever fields are
+            # requested
+            projected = set(fields) <= set(POST_SUMMARY_FIELDS)
+            query = Post.query(projection=Post.SUMMARY_PROPERTIES
+                               if projected else None)
+            page = fetch_next_page_async(query.order(*orders[sort]), limit,
+                                         cursor).get_result()
+            body = to_json({'posts': [select_fields(post, fields)
+                                      for post in page.items],
+                            'next': page.next_cursor})
+            memcache.set(key, body,
+                         time=settings.RECENT_WRITE_CACHE_SECONDS if recent
+                         else settings.FRONT_PAGE_CACHE_SECONDS)
+
+        self.response.content_type = 'application/json'
+        self.response.write(body)
+
+
+class PostHandler(ApiHandler):
+    """
+    Responds with a single post
+
+    The GET method expects kwargs 'post_id'
+    """
+
+    @check.post_exists
+    def get(self, **kwargs):
+        fields = self.requested_fields(POST_FIELDS)
+        self.write_json(to_json(select_fields(kwargs['post'], fields)))
+
+
+class CommentsHandler(ApiHandler):
+    """
+    Lists the comments on a post, oldest first, in pages of
+    settings.COMMENTS_PAGE_SIZE (or of the optional 'limit' query parameter)
+
+    The GET method expects kwargs 'post_id'
+    """
+
+    @check.post_exists
+    def get(self, **kwargs):
+        fields = self.requested_fields(COMMENT_FIELDS)
+        limit = self.requested_limit(settings.COMMENTS_PAGE_SIZE)
+        page = fetch_next_page_async(
+            Comment.query_for_post(kwargs['post_id']).order(
+                Comment.submitted),
+            limit, self.request.get('cursor')).get_result()
+        self.write_json(to_json(
+            {'comments': [select_fields(comment, fields)
+                          for comment in page.items],
+             'next': page.next_cursor}))
+
+
+class LikesHandler(ApiHandler):
+    """
+    Responds with a post's current like count (including its author's
+    implicit like) and, for signed in users, whether they have liked it. A
+    post's likes field lags behind this count until likes are folded into it
+
+    The GET method expects kwargs 'post_id'
+    """
+
+    @check.post_exists
+    def get(self, **kwargs):
+        post = kwargs['post']
+        user = self.identity.user_id
+        self.write_json(to_json(
+            {'post_id': post.key.id(),
+             'likes': like_count(post) + 1,
+             'liked': user_has_liked(user, post) if user else None}))
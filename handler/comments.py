@@ -1,16 +1,14 @@
 import webapp2
-import os
-from jinja2 import Environment, FileSystemLoader
-from util.jinja_filters import post_age_formatter
 import util.auth_decorators as check
-from model.comment import Comment
+from model.comment import Comment, add_comment, remove_comment
+from handler.posts import invalidate_front_page
+from handler.users import invalidate_author_page
 from model.post import Post
+import model.search as search
 from util.RequestHandler import AuthAwareRequestHandler
-
-
-template_dir = os.path.join(os.path.dirname(__file__), '../template')
-jinja_env = Environment(loader=FileSystemLoader(template_dir), autoescape=True)
-jinja_env.filters['post_age'] = post_age_formatter
+from util.pagination import fetch_next_page_async
+from util.templates import jinja_env
+import settings
 
 
 class CreateCommentHandler(webapp2.RequestHandler):
@@ -20,21 +18,52 @@ class CreateCommentHandler(webapp2.RequestHandler):
     CreateCommentHandler manages POST requests that should submit comments
     to the Comment datastore.
 
-    The POST method expects kwargs 'post_id' and 'user_id'
+    The POST method expects kwargs 'post_id' and 'user_id'. A 404 error is
+    raised in the case that the post does not exist
     """
 
-    @check.post_exists
     @check.user_is_signed_in
     def post(self, **kwargs):
         post_id = kwargs['post_id']
         user_id = kwargs['user_id']
         content = self.request.POST['content']
 
-        Comment(content=content, submitter=user_id, post_id=int(post_id)).put()
+        comment = add_comment(post_id, content=content, submitter=user_id)
+        if not comment:
+            self.abort(404)
 
+        search.index_comments([comment])
+        invalidate_front_page()
+        invalidate_author_page(user_id)
         self.redirect('/posts/' + post_id)
 
 
+class CommentsHandler(AuthAwareRequestHandler):
+    """
+    Handles requests for further pages of a post's comments
+
+    CommentsHandler responds to GET requests with an HTML fragment comprising
+    one page of comments (and a link to the following page, if any), which
+    the post page appends to its list of comments
+
+    The GET method expects kwargs 'post_id', and the cursor for the page in
+    the 'cursor' query parameter
+    """
+
+    def get(self, **kwargs):
+        post_id = kwargs['post_id']
+        comments = fetch_next_page_async(
+            Comment.query_for_post(post_id).order(Comment.submitted),
+            settings.COMMENTS_PAGE_SIZE,
+            self.request.get('cursor')).get_result()
+
+        self.write(jinja_env.get_template('comment-list.html'),
+                   {'post_id': post_id,
+                    'comments': comments.items,
+                    'comments_cursor': comments.next_cursor,
+                    'current_user': self.identity.user_id})
+
+
 class UpdateCommentHandler(AuthAwareRequestHandler):
     """
     Handles editing of comments
@@ -43,6 +72,9 @@ class UpdateCommentHandler(AuthAwareRequestHandler):
     an editable form; POST handles the submission of that form.
 
     Both GET and POST requests expect kwargs 'post_id' and 'comment_id'
+
+    The editable form lists the page of comments that begins with the comment
+    being edited
     """
 
     @check.user_is_signed_in
@@ -52,10 +84,13 @@ class UpdateCommentHandler(AuthAwareRequestHandler):
         post_id = kwargs['post_id']
         comment_id = kwargs['comment_id']
 
-        # Retrieve Post and its Comment(s) from the datastore
-        post = Post.get_by_id(int(post_id))
-        comments_query = Comment.query(Comment.post_id == int(post_id)).order(Comment.submitted)
-        comments = [comment for comment in comments_query]
+        # Retrieve Post and its Comment(s) from the datastore concurrently
+        post_future = Post.get_by_id_async(int(post_id))
+        comments_future = Comment.query_for_post(post_id).filter(
+            Comment.submitted >= kwargs['comment'].submitted).order(
+            Comment.submitted).fetch_async(settings.COMMENTS_PAGE_SIZE)
+        post = post_future.get_result()
+        comments = comments_future.get_result()
 
         self.write(template, {'post': post,
                               'edit_comment_id': int(comment_id),
@@ -66,13 +101,14 @@ class UpdateCommentHandler(AuthAwareRequestHandler):
     @check.user_is_comment_author
     def post(self, **kwargs):
         post_id = kwargs['post_id']
-        comment_id = kwargs['comment_id']
         content = self.request.POST['content']
 
         # Update the comment
-        comment = Comment.get_by_id(int(comment_id))
+        comment = kwargs['comment']
         comment.content = content
         comment.put()
+        search.index_comments([comment])
+        invalidate_author_page(comment.submitter)
 
         self.redirect('/posts/' + post_id)
 
@@ -92,7 +128,9 @@ class DeleteCommentHandler(webapp2.RequestHandler):
     @check.user_is_signed_in
     @check.user_is_comment_author
     def get(self, **kwargs):
-        comment_id = kwargs['comment_id']
         post_id = kwargs['post_id']
-        Comment().get_by_id(int(comment_id)).key.delete()
+        remove_comment(kwargs['comment'])
+        search.unindex_comment(kwargs['comment'])
+        invalidate_front_page()
+        invalidate_author_page(kwargs['comment'].submitter)
         self.redirect('/posts/' + post_id)
@@ -0,0 +1,83 @@
+from datetime import datetime
+from google.appengine.api import memcache
+from model.post import Post
+from model.user import User
+from util.RequestHandler import AuthAwareRequestHandler
+from util.templates import jinja_env
+import util.cache as cache
+import settings
+
+FEED_NAMESPACE = 'feed'
+
+
+def invalidate_feeds():
+    """
+    Discard every cached feed. Should be called after any write that changes
+    a post's title, content or author, or that adds or removes a post
+    """
+    cache.bump_version(FEED_NAMESPACE)
+
+
+class FeedHandler(AuthAwareRequestHandler):
+    """
+    Handles Atom feeds of the newest posts
+
+    FeedHandler responds to GET requests with an Atom feed of the
+    settings.FEED_SIZE most recently submitted posts. If the kwarg 'user_id'
+    is given, only that user's posts are listed (and the feed is 404 if the
+    user does not exist)
+
+    Entries carry each post's excerpt rather than its content, so feeds are
+    read with a projection query. The rendered feed is the same for every
+    reader, so it is cached in memcache until a write calls
+    invalidate_feeds. Its cache key is the feed's ETag, and the time that it
+    was rendered its Last-Modified date, so that pollers holding the current
+    feed are answered with 304 without anything being read but memcache
+    """
+    template = jinja_env.get_template('feed.atom')
+
+    def get(self, user_id=None):
+        key = cache.versioned_key(FEED_NAMESPACE, self.request.host_url,
+                                  user_id or '')
+        recent = cache.recently_bumped(FEED_NAMESPACE)
+        feed = memcache.get(key)
+        if feed is None:
+            feed = self.render_feed(user_id)
+            memcache.set(key, feed,
+                         time=settings.RECENT_WRITE_CACHE_SECONDS if recent
+                         else settings.FEED_CACHE_SECONDS)
+
+        body, rendered = feed
+        if self.not_modified((key, recent), rendered):
+            return
+
+        self.response.content_type = 'application/atom+xml'
+        self.response.charset = 'utf-8'
+        self.response.write(body)
+
+    def render_feed(self, user_id):
+        """
+        Args:
+            user_id: The username whose posts are listed, or None to list
+                every user's posts
+
+        Returns:
+            A tuple (body, rendered) of the feed as a UTF-8 encoded str and
+            the naive UTC datetime at which it was rendered
+        """
+        if user_id is None:
+            query = Post.query(projection=Post.FEED_PROPERTIES)
+        else:
+            if not User.get_by_id(user_id):
+                self.abort(404)
+            query = Post.query_for_submitter(user_id, Post.FEED_PROPERTIES)
+        posts = query.order(-Post.submitted).fetch(settings.FEED_SIZE)
+
+        rendered = datetime.utcnow()
+        body = self.template.render(context={
+            'host': self.request.host_url,
+            'path': self.request.path,
+            'user_id': user_id,
+            'posts': posts,
+            'updated': rendered})
+        return body.encode('utf-8'), rendered
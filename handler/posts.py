@@ -1,36 +1,79 @@
 import webapp2
-import os
-from jinja2 import Environment, FileSystemLoader
+from google.appengine.api import memcache
+from google.appengine.ext import ndb as db
+from jinja2 import Markup
+from handler.feeds import invalidate_feeds
+from handler.users import invalidate_author_page
 from util.RequestHandler import AuthAwareRequestHandler
-from model.post import Post
-from model.comment import Comment
-from util.auth import validate_user_cookie
+from model.post import Post, update_post
+from model.comment import Comment, delete_post
+from model.like import (Like, counted_likes_async, toggle_like,
+                        schedule_like_fold)
+import model.search as search
 import util.auth_decorators as check
-from util.jinja_filters import *
+from util.pagination import fetch_page, fetch_next_page_async
+from util.templates import jinja_env
+import util.cache as cache
+import settings
 
-template_dir = os.path.join(os.path.dirname(__file__), '../template')
-jinja_env = Environment(loader=FileSystemLoader(template_dir), autoescape=True)
-jinja_env.filters['post_age'] = post_age_formatter
-jinja_env.filters['trim'] = trim_to_two_sentences
+FRONT_PAGE_NAMESPACE = 'front-page'
 
+# The orderings that the front page can list posts in, by the name used in
+# its 'sort' query parameter. The first is the default
+FRONT_PAGE_ORDERS = [
+    ('top', (-Post.likes, -Post.submitted)),
+    ('discussed', (-Post.comment_count, -Post.submitted)),
+    ('active', (-Post.last_activity,)),
+    ('hot', (-Post.hot_score,)),
+]
 
-def user_has_liked_post(user_id, post_id):
+
+def invalidate_front_page():
+    """
+    Discard every cached rendering of the front page. Should be called after
+    any write that changes what the front page lists
     """
-    Indicates whether a user has already liked a given post
+    cache.bump_version(FRONT_PAGE_NAMESPACE)
+
+
+@db.tasklet
+def load_post_page(post_id, user_id=None, comments_cursor=None):
+    """
+    Load everything that the page for a post displays. The post, a page of
+    its comments, its like count and the viewer's like are fetched
+    concurrently
 
     Args:
-        user_id: The user id of the user to test against this post, as an int
-            or str
-        post_id: The post id for the post to test this user against, as an int
-            or str
+        post_id: The identifier for the post, as an int or str
+        user_id: The username of the viewer, or None for anonymous viewers
+        comments_cursor: A url-safe cursor for the page of comments to load,
+            or None for the first page
 
     Returns:
-        True if the user with id user_id has 'liked' the post with id post_id
-        False otherwise
+        A Future for a tuple (post, comments, likes, has_liked), where
+        comments is a Page of Comments, likes includes the author's implicit
+        like and has_liked is None for anonymous viewers. post is None if the
+        post does not exist
     """
-    post = Post.get_by_id(int(post_id))
-    if post:
-        return user_id in post.liked_by
+    like_future = (Like.key_for(user_id, post_id).get_async() if user_id
+                   else None)
+    post, comments, counted_likes = yield (
+        Post.get_by_id_async(int(post_id)),
+        fetch_next_page_async(
+            Comment.query_for_post(post_id).order(Comment.submitted),
+            settings.COMMENTS_PAGE_SIZE, comments_cursor),
+        counted_likes_async(post_id))
+
+    if not post:
+        raise db.Return((None, comments, 0, None))
+
+    has_liked = None
+    if user_id:
+        like = yield like_future
+        has_liked = like is not None or user_id in post.liked_by
+
+    likes = counted_likes + len(post.liked_by) + 1
+    raise db.Return((post, comments, likes, has_liked))
 
 
 class FrontPageHandler(AuthAwareRequestHandler):
@@ -39,14 +82,55 @@ class FrontPageHandler(AuthAwareRequestHandler):
 
     FrontPageHandler manages GET requests that expect a response that will
     render a list of blog posts sorted in descending order (first by likes,
-    then by submission date)
+    then by submission date). The optional 'sort' query parameter selects
+    another of FRONT_PAGE_ORDERS instead: 'discussed' (by comment count),
+    'active' (by the time of the latest comment) or 'hot' (by hot score, see
+    model.post.hot_score)
+
+    Posts are listed settings.FRONT_PAGE_SIZE at a time. The optional 'cursor'
+    and 'dir' query parameters select a page, as issued by the page's
+    next/previous links
+
+    The listing is the same for every visitor, so it is rendered once per page
+    and cached in memcache until a write calls invalidate_front_page. Only the
+    surrounding signed in/out chrome is rendered per request. The listing is
+    read with a projection query, so post content is never loaded. The cache
+    key doubles as the page's ETag, so clients that already hold the current
+    listing are answered with 304 before anything is rendered. Pages are
+    streamed
     """
+    stream_response = True
     template = jinja_env.get_template('posts.html')
+    listing_template = jinja_env.get_template('post-list.html')
 
     def get(self):
-        self.write(self.template, {
-            'posts': Post().query().order(-Post.likes, -Post.submitted)
-        })
+        orders = dict(FRONT_PAGE_ORDERS)
+        sort = self.request.get('sort')
+        if sort not in orders:
+            sort = FRONT_PAGE_ORDERS[0][0]
+        cursor = self.request.get('cursor')
+        backwards = self.request.get('dir') == 'prev'
+        key = cache.versioned_key(FRONT_PAGE_NAMESPACE, sort, cursor,
+                                  backwards)
+        recent = cache.recently_bumped(FRONT_PAGE_NAMESPACE)
+        if self.not_modified((key, self.identity.signed_in, recent)):
+            return
+
+        listing = memcache.get(key)
+        if listing is None:
+            query = Post.query(projection=Post.SUMMARY_PROPERTIES)
+            page = fetch_page(
+                query.order(*orders[sort]),
+                query.order(*[order.reversed() for order in orders[sort]]),
+                settings.FRONT_PAGE_SIZE, cursor, backwards)
+            listing = self.listing_template.render(
+                context={'posts': page.items, 'page': page,
+                         'sort': sort})
+            memcache.set(key, listing,
+                         time=settings.RECENT_WRITE_CACHE_SECONDS if recent
+                         else settings.FRONT_PAGE_CACHE_SECONDS)
+
+        self.write(self.template, {'listing': Markup(listing)})
 
 
 class NewPostFormHandler(AuthAwareRequestHandler):
@@ -80,7 +164,7 @@ class PostsHandler(AuthAwareRequestHandler):
     def post(self, **kwargs):
         title = self.request.POST['title']
         content = self.request.POST['content']
-        submitter = self.request.cookies.get('user').split("|")[0]
+        submitter = kwargs['user_id']
 
         # Check that title and content are non-empty and add the data to the
         # datastore; otherwise, re-render the form with errors
@@ -88,6 +172,10 @@ class PostsHandler(AuthAwareRequestHandler):
             new_post = Post(title=title, content=content, submitter=submitter)
             new_post_key = new_post.put()
             new_post_id = new_post_key.id()
+            search.index_posts([new_post])
+            invalidate_front_page()
+            invalidate_feeds()
+            invalidate_author_page(submitter)
             self.redirect('/posts/%d' % new_post_id)
         else:
             template = jinja_env.get_template('new-post.html')
@@ -105,30 +193,45 @@ class PostHandler(AuthAwareRequestHandler):
     posts and comments, depending on the current user
 
     The GET method expects kwargs 'post_id' -- the identifier of the post
-    to present
-    """
+    to present. Comments are shown settings.COMMENTS_PAGE_SIZE at a time; the
+    optional 'cursor' query parameter selects a later page of comments
 
-    @check.post_exists
-    def get(self, **kwargs):
-        template = jinja_env.get_template('post.html')
-        post_id = kwargs['post_id']
-        post = Post.get_by_id(int(post_id))
+    The page's ETag covers the post, the comments shown, the like count and
+    the viewer, so unchanged pages are answered with 304 rather than
+    rendered. Anonymous viewers are also given a Last-Modified date, which
+    like counts only reach when they are folded into the post
 
-        # Retrieve all comments
-        comments_query = Comment.query(
-            Comment.post_id == int(post_id)).order(Comment.submitted)
-        comments = [comment for comment in comments_query]
+    Pages are streamed, so that the top of the page is not held up by
+    rendering long posts and comment threads
+    """
+    stream_response = True
 
-        # Discern anonymous browsers from users
-        cookie = self.request.cookies.get('user')
-        user = None
-        has_liked = None
-        if validate_user_cookie(cookie):
-            user = cookie.split("|")[0]
-            has_liked = user_has_liked_post(user, post_id)
+    def get(self, **kwargs):
+        user = self.identity.user_id
+        post, comments, likes, has_liked = load_post_page(
+            kwargs['post_id'], user, self.request.get('cursor')).get_result()
 
         # If this post exists, render it (otherwise, 404)
-        self.write(template, {'post': post, 'comments': comments,
+        if not post:
+            self.abort(404)
+
+        validators = [post.updated, likes, user, has_liked,
+                      self.request.query_string]
+        validators.extend((comment.key.id(), comment.updated)
+                          for comment in comments.items)
+        last_modified = None
+        if not user:
+            last_modified = max([post.updated or post.submitted] +
+                                [comment.updated or comment.submitted
+                                 for comment in comments.items])
+        if self.not_modified(validators, last_modified):
+            return
+
+        template = jinja_env.get_template('post.html')
+        self.write(template, {'post': post, 'post_id': kwargs['post_id'],
+                              'comments': comments.items,
+                              'comments_cursor': comments.next_cursor,
+                              'likes': likes,
                               'current_user': user,
                               'has_liked': has_liked})
 
@@ -155,29 +258,42 @@ class UpdateHandler(AuthAwareRequestHandler):
     @check.user_is_post_author
     def get(self, **kwargs):
         template = jinja_env.get_template('new-post.html')
-        post = Post().get_by_id(int(kwargs['post_id']))
+        post = kwargs['post']
         self.write(template, {'form': {'title': post.title,
                                        'content': post.content},
                               'new': False,
                               'post_id': kwargs['post_id']
                               })
 
-    @check.post_exists
     @check.user_is_signed_in
-    @check.user_is_post_author
     def post(self, **kwargs):
         post_id = kwargs['post_id']
+        user_id = kwargs['user_id']
         title = self.request.POST['title']
         content = self.request.POST['content']
-
-        # Check that title and content are non empty and add the post to the
-        # datastore; otherwise, rerender the form with validation errors
-        if title != '' and content != '':
+        valid = title != '' and content != ''
+
+        # Rather than being loaded by the post_exists and user_is_post_author
+        # decorators, the post is read (and checked) within the transaction
+        # that writes it, so that it is looked up once
+        if valid:
+            post = update_post(db.Key(Post, int(post_id)), author=user_id,
+                               title=title, content=content)
+        else:
             post = Post.get_by_id(int(post_id))
-            post.title = title
-            post.content = content
-            post.put()
 
+        if not post:
+            self.abort(404)
+        elif post.submitter != user_id:
+            self.redirect('/posts/' + post_id)
+
+        # Redirect to the edited post; otherwise, rerender the form with
+        # validation errors
+        elif valid:
+            search.index_posts([post])
+            invalidate_front_page()
+            invalidate_feeds()
+            invalidate_author_page(post.submitter)
             self.redirect('/posts/' + post_id)
 
         else:
@@ -191,8 +307,10 @@ class DeleteHandler(webapp2.RequestHandler):
     Handles the deletion of posts.
 
     DeleteHandler responds to GET requests by deleting a post with a given
-    identifier (cascading that delete through each comment) from the datastore
-    and redirecting to the main page.
+    identifier from the datastore and redirecting to the main page. The
+    delete is cascaded through the post's comments by a background task (see
+    model.comment.delete_post), so posts with many comments are deleted as
+    quickly as any other
 
     The GET method expects kwargs 'post_id' -- the identifier of the post to
     delete
@@ -202,13 +320,12 @@ class DeleteHandler(webapp2.RequestHandler):
     @check.user_is_signed_in
     @check.user_is_post_author
     def get(self, **kwargs):
-        post_id = kwargs['post_id']
-        Post.get_by_id(int(post_id)).key.delete()
+        delete_post(kwargs['post'])
+        search.unindex_post(kwargs['post_id'])
 
-        # Cascade the delete to all comments associated with the post
-        comments = Comment.query(Comment.post_id == int(post_id))
-        for comment in comments:
-            comment.key.delete()
+        invalidate_front_page()
+        invalidate_feeds()
+        invalidate_author_page(kwargs['post'].submitter)
         self.redirect('/')
 
 
@@ -216,8 +333,10 @@ class LikeHandler(webapp2.RequestHandler):
     """
     Handles the 'liking' of posts
 
-    LikeHandler responds to GET requests by adding a given user to the
-    list of users that have liked a post, then redirecting to the posts' page
+    LikeHandler responds to GET requests by toggling a given user's like of a
+    post, then redirecting to the posts' page. The like is recorded in its own
+    entity and the post's sharded like counter; the post's likes property (and
+    so the front page) catches up when the scheduled fold task runs
 
     The GET method expects kwargs 'post_id' and 'user_id' -- the identifiers of
     the post that has been liked, and the user that liked it
@@ -228,12 +347,7 @@ class LikeHandler(webapp2.RequestHandler):
     @check.user_is_not_post_author
     def get(self, **kwargs):
 
-        post = Post.get_by_id(int(kwargs['post_id']))
-        if not user_has_liked_post(kwargs['user_id'], kwargs['post_id']):
-            post.liked_by.append(kwargs['user_id'])
-            post.put()
-        else:
-            post.liked_by.remove(kwargs['user_id'])
-            post.put()
+        toggle_like(kwargs['user_id'], kwargs['post'])
+        schedule_like_fold(kwargs['post_id'])
 
         self.redirect('/posts/%s' % kwargs['post_id'])
@@ -0,0 +1,41 @@
+from google.appengine.ext import ndb as db
+from model.post import Post
+from model.search import search_query
+from util.RequestHandler import AuthAwareRequestHandler
+from util.pagination import fetch_next_page_async
+from util.templates import jinja_env
+import settings
+
+
+class SearchHandler(AuthAwareRequestHandler):
+    """
+    Handles searches of posts and comments
+
+    SearchHandler responds to GET requests with the posts and comments that
+    contain every word of the 'q' query parameter, settings.SEARCH_PAGE_SIZE
+    at a time. Posts are listed by likes, ahead of comments. The optional
+    'cursor' query parameter selects a later page, as issued by the page's
+    next link
+    """
+
+    def get(self):
+        text = self.request.get('q')
+        query = search_query(text)
+        results = []
+        page = None
+
+        if query:
+            page = fetch_next_page_async(query, settings.SEARCH_PAGE_SIZE,
+                                         self.request.get('cursor')
+                                         ).get_result()
+
+            # Results show the current title of the post that each document
+            # belongs to, and skip documents whose post has been deleted
+            post_ids = list(set(document.post_id for document in page.items))
+            posts = dict(zip(post_ids, db.get_multi(
+                [db.Key(Post, post_id) for post_id in post_ids])))
+            results = [(document, posts[document.post_id])
+                       for document in page.items if posts[document.post_id]]
+
+        self.write(jinja_env.get_template('search.html'),
+                   {'q': text, 'results': results, 'page': page})
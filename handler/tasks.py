@@ -0,0 +1,334 @@
+"""
+Handlers for background jobs that run on the task queue.
+
+Every URL under /tasks is restricted to administrators (and the task queue
+itself) in app.yaml
+"""
+import time
+import webapp2
+from datetime import datetime
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb as db
+from model.comment import Comment, recount_comments, reparent_comments
+from model.like import (Like, LikeCounterShard, counted_likes_async,
+                        like_count, migrate_legacy_likes)
+from model.post import Post, update_post
+import model.search as search
+import model.transfer as transfer
+import settings
+from handler.feeds import invalidate_feeds
+from handler.posts import invalidate_front_page
+from handler.users import invalidate_author_pages
+
+
+class BatchTaskHandler(webapp2.RequestHandler):
+    """
+    Base class for jobs that work through the results of a query in batches
+
+    A GET request starts the job by enqueueing its first task. Each task (a
+    POST request) processes one batch, then enqueues a continuation task that
+    carries the query cursor, so that no single request has to process the
+    whole result set before its deadline. Any other POST parameters are passed
+    along to the continuation task unchanged.
+
+    Subclasses implement query and process, and may override batch_size,
+    keys_only (to work through the keys of the results rather than the
+    entities) and finish
+    """
+    batch_size = 100
+    keys_only = False
+
+    def query(self):
+        """
+        Returns:
+            The ndb.Query whose results this job works through
+        """
+        raise NotImplementedError
+
+    def process(self, batch):
+        """
+        Process one batch of results
+
+        Args:
+            batch: A list of up to batch_size query results
+        """
+        raise NotImplementedError
+
+    def finish(self):
+        """
+        Called once the job has worked through every result. Does nothing
+        unless overridden
+        """
+
+    def get(self):
+        taskqueue.add(url=self.request.path, params=self.request.GET)
+
+    def post(self):
+        cursor = self.request.get('cursor')
+        start_cursor = db.Cursor(urlsafe=cursor) if cursor else None
+        batch, next_cursor, more = self.query().fetch_page(
+            self.batch_size, start_cursor=start_cursor,
+            keys_only=self.keys_only)
+
+        self.process(batch)
+
+        if more and next_cursor:
+            params = dict(self.request.POST)
+            params['cursor'] = next_cursor.urlsafe()
+            taskqueue.add(url=self.request.path, params=params)
+        else:
+            self.finish()
+
+
+class MigrateCommentsHandler(BatchTaskHandler):
+    """
+    Re-parents every Comment that is stored as a root entity under its Post,
+    preserving its identifier. Should be run after
+    settings.COMMENT_ENTITY_GROUPS is enabled, and to completion before
+    settings.COMMENT_ANCESTOR_QUERIES is
+    """
+
+    def query(self):
+        return Comment.query()
+
+    def process(self, batch):
+        reparent_comments(batch)
+
+
+class DeleteCommentsHandler(BatchTaskHandler):
+    """
+    Deletes what belongs to a deleted post, a batch of keys at a time:
+    first every Comment (removing each from the search index), then every
+    Like, then the post's like counter shards. Scheduled by
+    model.comment.delete_post
+
+    POST expects the parameter 'post_id', and the optional parameter 'kind'
+    ('comments', the default, or 'likes')
+    """
+    batch_size = 500
+    keys_only = True
+
+    def query(self):
+        post_id = int(self.request.get('post_id'))
+        if self.request.get('kind') == 'likes':
+            return Like.query(Like.post_id == post_id)
+        return Comment.query_for_post(post_id)
+
+    def process(self, batch):
+        db.delete_multi(batch)
+        if self.request.get('kind') != 'likes':
+            search.unindex_comment_keys(self.request.get('post_id'), batch)
+            invalidate_author_pages()
+
+    def finish(self):
+        post_id = self.request.get('post_id')
+        if self.request.get('kind') != 'likes':
+            taskqueue.add(url=self.request.path,
+                          params={'post_id': post_id, 'kind': 'likes'})
+        else:
+            db.delete_multi(LikeCounterShard.keys_for(post_id))
+
+
+class BackfillExcerptsHandler(BatchTaskHandler):
+    """
+    Re-puts every Post so that posts written before Post.excerpt and
+    Post.hot_score existed gain them (and so appear in listings, which
+    project the excerpt, and in the 'hot' ordering), and so that Post.updated
+    is indexed (and so posts written before it was appear in feeds, which
+    project it). Each post is re-read
+    and put in its own transaction, so that concurrent writes are kept
+    """
+    keys_only = True
+
+    def query(self):
+        return Post.query()
+
+    def process(self, batch):
+        for post_key in batch:
+            update_post(post_key)
+        invalidate_feeds()
+        invalidate_author_pages()
+
+
+class BackfillCommentStatsHandler(BatchTaskHandler):
+    """
+    Recounts Post.comment_count and Post.last_activity from each post's
+    comments, so that posts written before those properties existed gain them
+    (and so appear in listings, which project them)
+    """
+    batch_size = 20
+
+    def query(self):
+        return Post.query()
+
+    def process(self, batch):
+        for post in batch:
+            # Comments cannot be counted inside a transaction (the query is
+            # not an ancestor query), so only the write is transactional
+            recount_comments(post)
+            update_post(post.key, comment_count=post.comment_count,
+                        last_activity=post.last_activity)
+        invalidate_front_page()
+
+
+class FoldLikesHandler(webapp2.RequestHandler):
+    """
+    Copies a post's like count from its sharded counter into Post.likes,
+    which orders the front page. Scheduled by model.like.schedule_like_fold
+
+    POST expects the parameter 'post_id'
+    """
+
+    def post(self):
+        post = Post.get_by_id(int(self.request.get('post_id')))
+        if not post:
+            return
+
+        likes = like_count(post, use_cache=False) + 1
+        if post.likes != likes:
+            post = update_post(post.key, likes=likes)
+            if post:
+                search.index_posts([post])
+                invalidate_front_page()
+
+
+class RescoreHotHandler(BatchTaskHandler):
+    """
+    Reconciles Post.likes, and so Post.hot_score, with the like counters of
+    posts liked or unliked within settings.HOT_RESCORE_WINDOW_SECONDS, which
+    are found by their recently written counter shards. Hot scores are
+    otherwise kept up to date as posts are put; this catches up posts whose
+    likes have not been folded. Each post whose likes have changed is
+    updated in its own transaction, so nothing else about it is reverted
+
+    Run by cron (see cron.yaml). The window is fixed when the job starts, so
+    that every continuation task pages through the same query
+    """
+    keys_only = True
+
+    def get(self):
+        since = int(time.time()) - settings.HOT_RESCORE_WINDOW_SECONDS
+        taskqueue.add(url=self.request.path, params={'since': since})
+
+    def query(self):
+        since = datetime.utcfromtimestamp(int(self.request.get('since')))
+        return LikeCounterShard.query(LikeCounterShard.updated >= since)
+
+    def process(self, batch):
+        post_ids = sorted(set(LikeCounterShard.post_id_for(shard_key)
+                              for shard_key in batch))
+        counts = [counted_likes_async(post_id, use_cache=False)
+                  for post_id in post_ids]
+        posts = db.get_multi([db.Key(Post, post_id) for post_id in post_ids])
+
+        changed = []
+        for post, count in zip(posts, counts):
+            if not post:
+                continue
+            # Likes still in the legacy liked_by list are counted, as by
+            # model.like.like_count
+            likes = count.get_result() + len(post.liked_by) + 1
+            if post.likes != likes:
+                post = update_post(post.key, likes=likes)
+                if post:
+                    changed.append(post)
+
+        if changed:
+            search.index_posts(changed)
+            invalidate_front_page()
+
+
+class MigrateLikesHandler(BatchTaskHandler):
+    """
+    Moves likes recorded in the legacy Post.liked_by lists into Like entities
+    and sharded like counters
+    """
+
+    def query(self):
+        return Post.query()
+
+    def process(self, batch):
+        for post in batch:
+            migrate_legacy_likes(post)
+
+
+class ReindexPostsHandler(BatchTaskHandler):
+    """
+    Rebuilds the search index's document for every Post
+    """
+
+    def query(self):
+        return Post.query()
+
+    def process(self, batch):
+        search.index_posts(batch)
+
+
+class ReindexCommentsHandler(BatchTaskHandler):
+    """
+    Rebuilds the search index's document for every Comment
+    """
+
+    def query(self):
+        return Comment.query()
+
+    def process(self, batch):
+        search.index_comments(batch)
+
+
+class TransferStepHandler(webapp2.RequestHandler):
+    """
+    Base class for the tasks that run TransferJobs a step at a time. Each
+    task runs one step, then enqueues a continuation task if the job has
+    more to do
+
+    POST expects the parameter 'job_id'
+    """
+
+    def step(self, job_id):
+        """
+        Run one step of a job
+
+        Returns:
+            True if the job has more to do
+        """
+        raise NotImplementedError
+
+    def post(self):
+        job_id = self.request.get('job_id')
+        if self.step(job_id):
+            taskqueue.add(url=self.request.path, params={'job_id': job_id})
+
+
+class ExportStepHandler(TransferStepHandler):
+    """
+    Exports one page of entities of a running export
+    """
+
+    def step(self, job_id):
+        return transfer.export_step(job_id)
+
+
+class ImportStepHandler(TransferStepHandler):
+    """
+    Imports one chunk of a running import. Once the import is done, every
+    cached listing is discarded and the search index is rebuilt, so that
+    the imported posts and comments appear in both
+    """
+
+    def step(self, job_id):
+        if transfer.import_step(job_id):
+            return True
+
+        invalidate_front_page()
+        invalidate_feeds()
+        invalidate_author_pages()
+        # Named per job, so that a retried final step reindexes only once
+        for kind in ('posts', 'comments'):
+            try:
+                taskqueue.add(name='reindex-%s-import-%s' % (kind, job_id),
+                              url='/tasks/reindex-%s' % kind)
+            except (taskqueue.TaskAlreadyExistsError,
+                    taskqueue.TombstonedTaskError):
+                pass
+        return False
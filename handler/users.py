@@ -1,12 +1,45 @@
 import webapp2
-import os
+from google.appengine.api import memcache
+from jinja2 import Markup
 import util.auth as auth
+import util.cache as cache
 from util.RequestHandler import AuthAwareRequestHandler
+from util.pagination import fetch_page
+from util.templates import jinja_env
+from model.comment import Comment
+from model.post import Post
 from model.user import User
-from jinja2 import Environment, FileSystemLoader
+import settings
 
-template_dir = os.path.join(os.path.dirname(__file__), '../template')
-jinja_env = Environment(loader=FileSystemLoader(template_dir), autoescape=True)
+AUTHOR_PAGES_NAMESPACE = 'author'
+
+# Usernames that can't be registered, since their author pages would be
+# shadowed by the other routes under /users/
+RESERVED_USERNAMES = frozenset(['new', 'in', 'out', 'welcome'])
+
+
+def _author_namespace(user_id):
+    return '%s:%s' % (AUTHOR_PAGES_NAMESPACE, cache.digest(user_id))
+
+
+def invalidate_author_page(user_id):
+    """
+    Discard every cached rendering of one user's author page. Should be
+    called after any write that changes one of that user's posts or comments
+
+    Args:
+        user_id: The username of the author
+    """
+    cache.bump_version(_author_namespace(user_id))
+
+
+def invalidate_author_pages():
+    """
+    Discard every cached rendering of every author page. Should be called
+    after writes that change the posts or comments of many users at once,
+    such as deleting a post (and so every comment on it)
+    """
+    cache.bump_version(AUTHOR_PAGES_NAMESPACE)
 
 
 class SignUpHandler(AuthAwareRequestHandler):
@@ -25,7 +58,8 @@ class SignUpHandler(AuthAwareRequestHandler):
 
         i) The proposed username is nonempty
         ii) The proposed password is nonempty
-        iii) The proposed username is not already taken
+        iii) The proposed username is not already taken, or reserved (see
+             RESERVED_USERNAMES)
     """
 
     def get(self):
@@ -40,7 +74,7 @@ class SignUpHandler(AuthAwareRequestHandler):
 
         if username == '':
             self.write(template, {'username_blank': True})
-        elif User.get_by_id(username):
+        elif username in RESERVED_USERNAMES or User.get_by_id(username):
             self.write(template, {'username_taken': True,
                                   'username': username})
         elif password == '':
@@ -65,11 +99,9 @@ class WelcomeHandler(AuthAwareRequestHandler):
     def get(self):
 
         template = jinja_env.get_template('welcome.html')
-        user_cookie = self.request.cookies.get('user')
 
-        if user_cookie and len(user_cookie.split('|')) == 2:
-            user = user_cookie.split('|')[0]
-            self.write(template, {'username': user})
+        if self.identity.signed_in:
+            self.write(template, {'username': self.identity.user_id})
         else:
             self.redirect('/users/new')
 
@@ -119,3 +151,65 @@ class SignOutHandler(webapp2.RequestHandler):
     def get(self):
         self.response.delete_cookie('user')
         self.redirect('/users/in')
+
+
+class AuthorHandler(AuthAwareRequestHandler):
+    """
+    Handles the page listing one user's posts or comments, newest first
+
+    AuthorHandler responds to GET requests with the posts of the user
+    identified by the kwarg 'user_id' (404 if no such user exists), or their
+    comments if the 'show' query parameter is 'comments'. Either is listed
+    settings.AUTHOR_PAGE_SIZE at a time; the optional 'cursor' and 'dir'
+    query parameters select a page, as issued by the page's next/previous
+    links
+
+    Listings are read with queries on (submitter, submitted), so each page
+    costs the same however much the user has written, and posts are read
+    with a projection query. As on the front page, each listing is rendered
+    once and cached in memcache, per author, until a write calls
+    invalidate_author_page or invalidate_author_pages, and its cache key
+    doubles as the page's ETag
+    """
+    stream_response = True
+    template = jinja_env.get_template('author.html')
+    listing_template = jinja_env.get_template('author-list.html')
+
+    def get(self, user_id):
+        # Checked before the ETag, so that a client holding the page of a
+        # user who no longer exists is answered with 404 rather than 304
+        if not User.get_by_id(user_id):
+            self.abort(404)
+        show = self.request.get('show')
+        if show != 'comments':
+            show = 'posts'
+        cursor = self.request.get('cursor')
+        backwards = self.request.get('dir') == 'prev'
+        key = cache.versioned_key(
+            _author_namespace(user_id),
+            cache.get_version(AUTHOR_PAGES_NAMESPACE), show, cursor,
+            backwards)
+        recent = cache.recently_bumped(_author_namespace(user_id),
+                                       AUTHOR_PAGES_NAMESPACE)
+        if self.not_modified((key, self.identity.signed_in, recent)):
+            return
+
+        listing = memcache.get(key)
+        if listing is None:
+            if show == 'posts':
+                query = Post.query_for_submitter(user_id)
+                orders = (-Post.submitted, Post.submitted)
+            else:
+                query = Comment.query(Comment.submitter == user_id)
+                orders = (-Comment.submitted, Comment.submitted)
+            page = fetch_page(query.order(orders[0]), query.order(orders[1]),
+                              settings.AUTHOR_PAGE_SIZE, cursor, backwards)
+            listing = self.listing_template.render(
+                context={'user_id': user_id, 'show': show,
+                         'entries': page.items, 'page': page})
+            memcache.set(key, listing,
+                         time=settings.RECENT_WRITE_CACHE_SECONDS if recent
+                         else settings.AUTHOR_PAGE_CACHE_SECONDS)
+
+        self.write(self.template, {'user_id': user_id,
+                                   'listing': Markup(listing)})
@@ -0,0 +1,42 @@
+"""
+The handler for App Engine's warmup requests.
+
+App Engine sends /_ah/warmup to each new instance before routing user
+requests to it (see inbound_services in app.yaml), so the work that would
+otherwise fall on an instance's first user request is done here instead
+"""
+import webapp2
+from util.templates import load_templates
+
+# Pages requested while warming up, so that their cached listings (and the
+# versions of their cache namespaces) are in memcache, and the datastore
+# queries behind them have been run at least once on this instance
+WARMUP_PATHS = ('/', '/feed.atom')
+
+
+class WarmupHandler(webapp2.RequestHandler):
+    """
+    Warms up a new instance: every template is loaded into the shared Jinja
+    environment, and each of WARMUP_PATHS is requested internally. Every
+    handler module has already been imported, by main
+
+    Responds with a plain text summary
+    """
+
+    def get(self):
+        templates = load_templates()
+
+        # self.app is a thread-local proxy, which each internal request
+        # clears when it finishes
+        app = self.request.app
+        statuses = []
+        for path in WARMUP_PATHS:
+            response = webapp2.Request.blank(path).get_response(app)
+            # Rendering a streamed page happens as its body is read
+            response.body
+            statuses.append('%s %d' % (path, response.status_int))
+        app.set_globals(app=app, request=self.request)
+
+        self.response.content_type = 'text/plain'
+        self.response.write('Loaded %d templates\n%s\n' % (
+            templates, '\n'.join(statuses)))
@@ -15,10 +15,15 @@
 # limitations under the License.
 #
 import webapp2
-from handler import posts, users, comments
+from handler import (admin, api, feeds, posts, users, comments, search,
+                     tasks, warmup)
+from util.instrumentation import instrument
+from util.profiling import profiled
+import settings
 
 app = webapp2.WSGIApplication([
     ('/', posts.FrontPageHandler),
+    ('/_ah/warmup', warmup.WarmupHandler),
     ('/posts/new', posts.NewPostFormHandler),
     ('/posts', posts.PostsHandler),
     webapp2.Route('/posts/<post_id:\d+>', handler=posts.PostHandler),
@@ -27,14 +32,50 @@ app = webapp2.WSGIApplication([
     webapp2.Route('/posts/<post_id:\d+>/delete', handler=posts.DeleteHandler),
     webapp2.Route('/posts/<post_id:\d+>/like', handler=posts.LikeHandler),
 
+    ('/search', search.SearchHandler),
+    ('/feed.atom', feeds.FeedHandler),
+
     ('/users/new', users.SignUpHandler),
     ('/users/in', users.SignInHandler),
     ('/users/out', users.SignOutHandler),
     ('/users/welcome', users.WelcomeHandler),
+    webapp2.Route('/users/<user_id:[^/]+>/feed.atom', handler=feeds.FeedHandler),
+    webapp2.Route('/users/<user_id:[^/]+>', handler=users.AuthorHandler),
 
+    webapp2.Route('/posts/<post_id:\d+>/comments', handler=comments.CommentsHandler, methods=['GET']),
     webapp2.Route('/posts/<post_id:\d+>/comments', handler=comments.CreateCommentHandler),
     webapp2.Route('/posts/<post_id:\d+>/comments/<comment_id:\d+>/edit', handler=comments.UpdateCommentHandler),
     webapp2.Route('/posts/<post_id:\d+>/comments/<comment_id:\d+>', handler=comments.UpdateCommentHandler),
-    webapp2.Route('/posts/<post_id:\d+>/comments/<comment_id:\d+>/delete', handler=comments.DeleteCommentHandler)
+    webapp2.Route('/posts/<post_id:\d+>/comments/<comment_id:\d+>/delete', handler=comments.DeleteCommentHandler),
+
+    ('/api/v1/posts', api.PostsHandler),
+    webapp2.Route('/api/v1/posts/<post_id:\d+>', handler=api.PostHandler),
+    webapp2.Route('/api/v1/posts/<post_id:\d+>/comments', handler=api.CommentsHandler),
+    webapp2.Route('/api/v1/posts/<post_id:\d+>/likes', handler=api.LikesHandler),
+
+    ('/tasks/migrate-comments', tasks.MigrateCommentsHandler),
+    ('/tasks/fold-likes', tasks.FoldLikesHandler),
+    ('/tasks/rescore-hot', tasks.RescoreHotHandler),
+    ('/tasks/delete-comments', tasks.DeleteCommentsHandler),
+    ('/tasks/migrate-likes', tasks.MigrateLikesHandler),
+    ('/tasks/backfill-excerpts', tasks.BackfillExcerptsHandler),
+    ('/tasks/backfill-comment-stats', tasks.BackfillCommentStatsHandler),
+    ('/tasks/reindex-posts', tasks.ReindexPostsHandler),
+    ('/tasks/reindex-comments', tasks.ReindexCommentsHandler),
+    ('/tasks/export', tasks.ExportStepHandler),
+    ('/tasks/import', tasks.ImportStepHandler),
+
+    ('/admin/profiles', admin.ProfilesHandler),
+    webapp2.Route('/admin/profiles/<profile_id:[0-9a-f]+>', handler=admin.ProfileHandler),
+    ('/admin/export', admin.ExportHandler),
+    ('/admin/import', admin.ImportHandler),
+    webapp2.Route('/admin/transfers/<job_id:\d+>', handler=admin.TransferHandler),
+    webapp2.Route('/admin/transfers/<job_id:\d+>/download', handler=admin.DownloadExportHandler)
 
 ], debug=True)
+
+if settings.PROFILING:
+    app.router.set_dispatcher(profiled(app.router.dispatch))
+
+if settings.INSTRUMENTATION:
+    app = instrument(app)
@@ -1,10 +1,21 @@
+from google.appengine.api import taskqueue
 from google.appengine.ext import ndb as db
+from datetime import datetime
+from model.post import Post
+import settings
 
 
 class Comment(db.Model):
     """
     Models a Comment on a blog.
 
+    Depending on settings.COMMENT_ENTITY_GROUPS, new comments are either
+    stored as children of their Post (so that a post's comments can be read
+    with a strongly consistent ancestor query) or as root entities that are
+    associated with their Post by post_id alone. post_id is populated in
+    either case, and a post's comments are read by post_id until
+    settings.COMMENT_ANCESTOR_QUERIES is enabled (see settings.py).
+
     Attributes:
         content: The copy for a blog post
         submitted: The submission datetime for a blog post. Set automatically
@@ -12,8 +23,178 @@ class Comment(db.Model):
         submitter: The username of the user that posted the comment
         post_id: The identifier for the post that this comment is associated
             with
+        updated: The datetime at which this comment was last put. Used to
+            validate cached copies of its post's page
     """
     content = db.TextProperty()
     submitted = db.DateTimeProperty(auto_now_add=True)
     submitter = db.StringProperty()
     post_id = db.IntegerProperty()
+    updated = db.DateTimeProperty(auto_now=True, indexed=False)
+
+    @staticmethod
+    def post_key(post_id):
+        """
+        Build the key of the Post that a comment belongs to
+
+        Args:
+            post_id: The identifier for the post, as an int or str
+
+        Returns:
+            An ndb.Key for the Post
+        """
+        return db.Key('Post', int(post_id))
+
+    @classmethod
+    def create(cls, post_id, **kwargs):
+        """
+        Instantiate (but do not put) a new comment on a post, keyed according
+        to settings.COMMENT_ENTITY_GROUPS
+
+        Args:
+            post_id: The identifier for the post, as an int or str
+            kwargs: Any further property values for the comment
+
+        Returns:
+            A new Comment
+        """
+        if settings.COMMENT_ENTITY_GROUPS:
+            kwargs['parent'] = cls.post_key(post_id)
+        return cls(post_id=int(post_id), **kwargs)
+
+    @classmethod
+    def get_for_post(cls, post_id, comment_id):
+        """
+        Retrieve a comment on a post
+
+        Comments that have not been migrated to the current schema are found
+        with a second lookup, so both schemas can be read mid-migration
+
+        Args:
+            post_id: The identifier for the post, as an int or str
+            comment_id: The identifier for the comment, as an int or str
+
+        Returns:
+            The Comment, or None if it does not exist
+        """
+        child_key = db.Key(cls, int(comment_id), parent=cls.post_key(post_id))
+        root_key = db.Key(cls, int(comment_id))
+        if settings.COMMENT_ENTITY_GROUPS:
+            return child_key.get() or root_key.get()
+        return root_key.get() or child_key.get()
+
+    @classmethod
+    def query_for_post(cls, post_id):
+        """
+        Build a query for the comments on a post
+
+        With settings.COMMENT_ANCESTOR_QUERIES this is a strongly consistent
+        ancestor query, which finds only comments stored as children of the
+        Post; otherwise it is an eventually consistent query on post_id,
+        which finds comments stored under either schema
+
+        Args:
+            post_id: The identifier for the post, as an int or str
+
+        Returns:
+            An unordered ndb.Query
+        """
+        if settings.COMMENT_ANCESTOR_QUERIES:
+            return cls.query(ancestor=cls.post_key(post_id))
+        return cls.query(cls.post_id == int(post_id))
+
+
+@db.transactional(xg=True)
+def add_comment(post_id, **kwargs):
+    """
+    Put a new comment on a post, and count it in the post's comment_count and
+    last_activity within the same transaction
+
+    Args:
+        post_id: The identifier for the post, as an int or str
+        kwargs: Any further property values for the comment
+
+    Returns:
+        The new Comment, or None if the post does not exist
+    """
+    post = Post.get_by_id(int(post_id))
+    if not post:
+        return None
+
+    comment = Comment.create(post_id, **kwargs)
+    comment.put()
+    post.comment_count += 1
+    post.last_activity = datetime.utcnow()
+    post.put()
+    return comment
+
+
+@db.transactional(xg=True)
+def remove_comment(comment):
+    """
+    Delete a comment, and discount it from its post's comment_count within
+    the same transaction
+
+    Args:
+        comment: The Comment to delete, as already loaded by the caller
+    """
+    post = Post.get_by_id(comment.post_id)
+    comment.key.delete()
+    if post:
+        post.comment_count = max(post.comment_count - 1, 0)
+        post.put()
+
+
+@db.transactional
+def delete_post(post):
+    """
+    Delete a post, and schedule /tasks/delete-comments to delete its
+    comments, likes and like counter shards in the background. The task is
+    enqueued transactionally, so it runs if and only if the post is deleted
+
+    Args:
+        post: The Post to delete
+    """
+    post.key.delete()
+    taskqueue.add(url='/tasks/delete-comments',
+                  params={'post_id': post.key.integer_id()},
+                  transactional=True)
+
+
+def reparent_comments(comments):
+    """
+    Move root comments under their Post, keeping their identifiers (and so
+    their URLs) unchanged. Comments that are already children are skipped.
+
+    The new entities are written before the old ones are deleted, so
+    re-running a batch that was interrupted part way through is harmless
+
+    Args:
+        comments: A list of Comments
+
+    Returns:
+        The number of comments that were moved
+    """
+    roots = [comment for comment in comments if comment.key.parent() is None]
+    children = [Comment(parent=Comment.post_key(comment.post_id),
+                        id=comment.key.id(),
+                        **comment.to_dict())
+                for comment in roots]
+    db.put_multi(children)
+    db.delete_multi([comment.key for comment in roots])
+    return len(roots)
+
+
+def recount_comments(post):
+    """
+    Recompute a post's comment_count and last_activity from its comments.
+    Does not put the post
+
+    Args:
+        post: The Post to recount
+    """
+    comments = Comment.query_for_post(post.key.integer_id())
+    post.comment_count = comments.count()
+    latest = comments.order(-Comment.submitted).get(projection=[
+        Comment.submitted])
+    post.last_activity = latest.submitted if latest else post.submitted
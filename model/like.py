@@ -0,0 +1,252 @@
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb as db
+import random
+import time
+import settings
+
+
+class Like(db.Model):
+    """
+    Models a user's like of a blog post
+
+    Each Like is its own root entity, keyed "user_id:post_id", so that liking
+    a post never writes to the post's entity group and whether a user has
+    liked a post can be checked with a single lookup
+
+    Attributes:
+        user_id: The username of the user that liked the post
+        post_id: The identifier for the post that was liked
+        submitted: The datetime at which the post was liked
+    """
+    user_id = db.StringProperty()
+    post_id = db.IntegerProperty()
+    submitted = db.DateTimeProperty(auto_now_add=True)
+
+    @classmethod
+    def key_for(cls, user_id, post_id):
+        """
+        Build the key of a user's like of a post
+
+        Args:
+            user_id: The username of the user
+            post_id: The identifier for the post, as an int or str
+
+        Returns:
+            An ndb.Key for the Like
+        """
+        return db.Key(cls, '%s:%d' % (user_id, int(post_id)))
+
+
+class LikeCounterShard(db.Model):
+    """
+    Models one shard of a post's like counter
+
+    A post's like count is the sum of its settings.LIKE_COUNTER_SHARDS
+    shards, each keyed "post_id:shard". Likes update a randomly chosen shard,
+    so concurrent likes of a popular post rarely contend for the same entity
+
+    Attributes:
+        count: This shard's share of the count. A single shard may be negative
+            when likes and unlikes landed on different shards
+        updated: The datetime at which this shard was last put, so that
+            /tasks/rescore-hot can find the posts whose likes have changed
+    """
+    count = db.IntegerProperty(default=0, indexed=False)
+    updated = db.DateTimeProperty(auto_now=True)
+
+    @classmethod
+    def keys_for(cls, post_id):
+        """
+        Returns:
+            The keys of every shard of a post's like counter
+        """
+        return [db.Key(cls, '%d:%d' % (int(post_id), shard))
+                for shard in range(settings.LIKE_COUNTER_SHARDS)]
+
+    @staticmethod
+    def post_id_for(shard_key):
+        """
+        Args:
+            shard_key: The key of a LikeCounterShard
+
+        Returns:
+            The identifier for the post that the shard counts likes of, as
+            an int
+        """
+        return int(shard_key.id().split(':')[0])
+
+
+def _count_cache_key(post_id):
+    return 'like-count:%d' % int(post_id)
+
+
+@db.tasklet
+def counted_likes_async(post_id, use_cache=True):
+    """
+    Sum a post's like counter shards, without waiting for the post itself.
+    Likes still held in the post's legacy liked_by list are not included
+
+    Args:
+        post_id: The identifier for the post, as an int or str
+        use_cache: If False, always sum the counter shards from the datastore
+
+    Returns:
+        A Future for the sum, as an int
+    """
+    context = db.get_context()
+    cache_key = _count_cache_key(post_id)
+    count = (yield context.memcache_get(cache_key)) if use_cache else None
+    if count is None:
+        shards = yield db.get_multi_async(LikeCounterShard.keys_for(post_id))
+        count = sum(shard.count for shard in shards if shard)
+        yield context.memcache_add(cache_key, count,
+                                   time=settings.LIKE_COUNT_CACHE_SECONDS)
+    raise db.Return(count)
+
+
+def like_count(post, use_cache=True):
+    """
+    Count the likes of a post, not including the implicit like of its author
+
+    Args:
+        post: The Post to count likes for
+        use_cache: If False, always sum the counter shards from the datastore
+
+    Returns:
+        The number of users that have liked the post
+    """
+    count = counted_likes_async(post.key.integer_id(), use_cache).get_result()
+
+    # Likes from before likes were stored as Like entities are counted until
+    # /tasks/migrate-likes moves them into the counter
+    return count + len(post.liked_by)
+
+
+def user_has_liked(user_id, post):
+    """
+    Indicates whether a user has liked a post
+
+    Args:
+        user_id: The username of the user
+        post: The Post
+
+    Returns:
+        True if the user has liked the post; False otherwise
+    """
+    return (user_id in post.liked_by or
+            Like.key_for(user_id, post.key.integer_id()).get() is not None)
+
+
+@db.transactional(xg=True)
+def _toggle_like(user_id, post_id):
+    like_key = Like.key_for(user_id, post_id)
+    shard_key = random.choice(LikeCounterShard.keys_for(post_id))
+    like, shard = db.get_multi([like_key, shard_key])
+    shard = shard or LikeCounterShard(key=shard_key)
+
+    if like:
+        like_key.delete()
+        shard.count -= 1
+    else:
+        Like(key=like_key, user_id=user_id, post_id=post_id).put()
+        shard.count += 1
+    shard.put()
+
+    return not like
+
+
+@db.transactional
+def _remove_legacy_like(user_id, post_key):
+    post = post_key.get()
+    if not post or user_id not in post.liked_by:
+        return False
+
+    post.liked_by.remove(user_id)
+    post.put()
+    return True
+
+
+def toggle_like(user_id, post):
+    """
+    Like a post on behalf of a user, or withdraw the user's like if they have
+    already liked it
+
+    Args:
+        user_id: The username of the user
+        post: The Post to like or unlike
+
+    Returns:
+        True if the post is now liked by the user; False otherwise
+    """
+    # Likes held in the legacy liked_by list are withdrawn from it, unless
+    # they have been migrated since the post was read
+    if user_id in post.liked_by and _remove_legacy_like(user_id, post.key):
+        return False
+
+    liked = _toggle_like(user_id, post.key.integer_id())
+    memcache.delete(_count_cache_key(post.key.integer_id()))
+    return liked
+
+
+def schedule_like_fold(post_id):
+    """
+    Schedule /tasks/fold-likes to copy a post's like count into Post.likes
+
+    At most one fold is scheduled per post per settings.LIKE_FOLD_SECONDS, and
+    it runs at the end of that period, so a burst of likes costs one write to
+    the post rather than one write per like
+
+    Args:
+        post_id: The identifier for the post, as an int or str
+    """
+    period = int(time.time()) // settings.LIKE_FOLD_SECONDS
+    try:
+        taskqueue.add(name='fold-likes-%d-%d' % (int(post_id), period),
+                      url='/tasks/fold-likes',
+                      params={'post_id': int(post_id)},
+                      countdown=settings.LIKE_FOLD_SECONDS)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+
+# A cross-group transaction may write to at most 25 entity groups: the post,
+# one of its counter shards and this many Likes
+_LEGACY_LIKES_PER_TRANSACTION = 23
+
+
+@db.transactional(xg=True)
+def _move_legacy_likes(post_key):
+    post = post_key.get()
+    if not post or not post.liked_by:
+        return False
+
+    post_id = post_key.integer_id()
+    user_ids = post.liked_by[:_LEGACY_LIKES_PER_TRANSACTION]
+    shard_key = LikeCounterShard.keys_for(post_id)[0]
+    shard = shard_key.get() or LikeCounterShard(key=shard_key)
+    shard.count += len(user_ids)
+    del post.liked_by[:len(user_ids)]
+    db.put_multi([shard, post] +
+                 [Like(key=Like.key_for(user_id, post_id),
+                       user_id=user_id, post_id=post_id)
+                  for user_id in user_ids])
+    return bool(post.liked_by)
+
+
+def migrate_legacy_likes(post):
+    """
+    Move the likes recorded in a post's legacy liked_by list into Like
+    entities and the post's sharded like counter. Each transaction moves up
+    to _LEGACY_LIKES_PER_TRANSACTION likes, creating their Like entities
+    along with the count, so the migration is safe to re-run or interrupt
+
+    Args:
+        post: The Post to migrate
+    """
+    if not post.liked_by:
+        return
+
+    while _move_legacy_likes(post.key):
+        pass
+    memcache.delete(_count_cache_key(post.key.integer_id()))
@@ -1,4 +1,59 @@
+import math
+from datetime import datetime
 from google.appengine.ext import ndb as db
+from util.jinja_filters import trim_to_two_sentences
+import settings
+
+# The maximum length of a post's excerpt, in characters. Keeps the (indexed)
+# excerpt well inside the datastore's 1500 byte limit for indexed strings
+EXCERPT_LENGTH = 300
+
+
+def excerpt_for(content):
+    """
+    Summarise a post's content for listings: its first three sentences,
+    truncated to EXCERPT_LENGTH characters
+
+    Args:
+        content: The content of a post
+
+    Returns:
+        The excerpt, as a string
+    """
+    excerpt = trim_to_two_sentences(content or '')
+    if len(excerpt) > EXCERPT_LENGTH:
+        excerpt = excerpt[:EXCERPT_LENGTH - 3].rsplit(' ', 1)[0] + '...'
+    return excerpt
+
+
+# The time from which hot scores measure a post's age. Any fixed time will do
+HOT_EPOCH = datetime(2016, 1, 1)
+
+
+def hot_score(likes, comment_count, submitted):
+    """
+    Score a post for the 'hot' ordering, which balances popularity against
+    age: a post needs ten times the engagement of a post submitted
+    settings.HOT_SCORE_SECONDS later to rank above it. Engagement counts each
+    like once and each comment settings.HOT_COMMENT_WEIGHT times
+
+    Scores grow with submission time rather than shrinking with age, so a
+    post's score only has to change when its likes or comments do, and the
+    scores of posts that have not been touched in a long time stay comparable
+    with those of new ones
+
+    Args:
+        likes: The post's likes, including its author's
+        comment_count: The number of comments on the post
+        submitted: The post's submission datetime
+
+    Returns:
+        The score, as a float
+    """
+    engagement = ((likes or 0) +
+                  settings.HOT_COMMENT_WEIGHT * (comment_count or 0))
+    age = (submitted - HOT_EPOCH).total_seconds()
+    return math.log10(max(engagement, 1)) + age / settings.HOT_SCORE_SECONDS
 
 
 class Post(db.Model):
@@ -11,13 +66,91 @@ class Post(db.Model):
         submitted: The submission datetime. Automatically set on insert, but
             not affected on update
         submitter: The username for the user that posted this Post
-        liked_by: A repeated field comprising user_ids for users that have
-            liked this post
-        likes: A computed property equivalent to len(liked_by) + 1
+        liked_by: Legacy. User_ids for users that liked this post before
+            likes were stored as separate Like entities (see model.like).
+            No longer appended to; emptied by /tasks/migrate-likes
+        likes: The number of users that have liked this post, plus one for
+            the author. Folded in from the post's sharded like counter shortly
+            after each like, so that the front page can be ordered by it
+        excerpt: A short summary of content (see excerpt_for). Maintained
+            automatically whenever the post is put, so that listings can
+            use a projection query rather than loading content
+        comment_count: The number of comments on this post. Maintained
+            transactionally as comments are added and removed
+        last_activity: The datetime of the post's submission or of its most
+            recent comment, whichever is later
+        updated: The datetime at which this post was last put, for any
+            reason. Used to validate cached copies of the post's page, and
+            as the updated date of the post's feed entries
+        hot_score: The post's score for the 'hot' ordering (see hot_score).
+            Maintained automatically whenever the post is put, and
+            periodically reconciled with the post's like counter by
+            /tasks/rescore-hot
     """
     title = db.StringProperty()
     content = db.TextProperty()
     submitted = db.DateTimeProperty(auto_now_add=True)
     submitter = db.StringProperty()
     liked_by = db.StringProperty(repeated=True)
-    likes = db.ComputedProperty(lambda self: len(self.liked_by) + 1)
+    likes = db.IntegerProperty(default=1)
+    excerpt = db.StringProperty()
+    comment_count = db.IntegerProperty(default=0)
+    last_activity = db.DateTimeProperty(auto_now_add=True)
+    updated = db.DateTimeProperty(auto_now=True)
+    hot_score = db.FloatProperty()
+
+    # The properties that listings of posts display, for projection queries
+    SUMMARY_PROPERTIES = ('likes', 'submitted', 'title', 'submitter',
+                          'excerpt', 'comment_count', 'last_activity')
+
+    # The properties that feed entries display, for projection queries
+    FEED_PROPERTIES = ('submitted', 'updated', 'title', 'submitter',
+                       'excerpt')
+
+    @classmethod
+    def query_for_submitter(cls, user_id, properties=SUMMARY_PROPERTIES):
+        """
+        Build a projection query for the summaries of one user's posts.
+        submitter is not projected (properties filtered by equality cannot
+        be), so it is not set on the results
+
+        Args:
+            user_id: The username of the author
+            properties: The names of the properties to project. Defaults to
+                SUMMARY_PROPERTIES
+
+        Returns:
+            An unordered ndb.Query
+        """
+        return cls.query(cls.submitter == user_id, projection=[
+            name for name in properties if name != 'submitter'])
+
+    def _pre_put_hook(self):
+        self.excerpt = excerpt_for(self.content)
+        # submitted is not set until after this hook on a post's first put
+        self.hot_score = hot_score(self.likes, self.comment_count,
+                                   self.submitted or datetime.utcnow())
+
+
+@db.transactional
+def update_post(post_key, author=None, **values):
+    """
+    Set some of a post's properties, and put it. The post is re-read within
+    the transaction, so that writes made to its other properties since a copy
+    of it was read elsewhere are not reverted
+
+    Args:
+        post_key: The ndb.Key of the Post
+        author: If given, the username of the user that must have submitted
+            the post for it to be updated
+        values: The new values of the properties to set, if any
+
+    Returns:
+        The Post, updated unless it was not submitted by author, or None if
+        it does not exist
+    """
+    post = post_key.get()
+    if post and author in (None, post.submitter):
+        post.populate(**values)
+        post.put()
+    return post
@@ -0,0 +1,186 @@
+"""
+A full-text index over posts and their comments, stored in the datastore.
+
+Each post, and each comment, is indexed as a SearchDocument whose repeated
+tokens property holds the distinct words of its text. The datastore's index
+on tokens is then the inverted index (token -> documents), and a search for
+several words is a query with an equality filter per word, answered by a
+merge join.
+
+Results are ordered by a static rank rather than by relevance to the query,
+so that they can be paged with cursors: posts rank by their likes, ahead of
+comments, and ties are listed newest first.
+
+The index is maintained incrementally by the handlers that write posts and
+comments; /tasks/reindex-posts and /tasks/reindex-comments rebuild it
+"""
+
+import re
+from google.appengine.ext import ndb as db
+from model.post import excerpt_for
+
+# Words that are too common to be worth indexing
+STOP_WORDS = frozenset("""
+    a an and are as at be but by for from has have in is it its of on or that
+    the this to was were will with
+""".split())
+
+# The maximum number of distinct tokens indexed per document, and of words
+# used from a query
+MAX_DOCUMENT_TOKENS = 1000
+MAX_QUERY_TOKENS = 5
+
+# Longer words are not indexed (indexed strings are limited to 1500 bytes)
+MAX_TOKEN_LENGTH = 100
+
+
+def tokenize(text):
+    """
+    Split text into the distinct, lower-cased words that are indexed
+
+    Args:
+        text: The text, as a str or unicode
+
+    Returns:
+        A list of tokens, in order of first appearance
+    """
+    tokens = []
+    seen = set()
+    for word in re.findall(r'\w+', (text or '').lower(), re.UNICODE):
+        if (word not in seen and word not in STOP_WORDS and
+                len(word) <= MAX_TOKEN_LENGTH):
+            seen.add(word)
+            tokens.append(word)
+    return tokens
+
+
+class SearchDocument(db.Model):
+    """
+    Models the indexed text of a post or comment
+
+    Keyed "post:<post_id>" or "comment:<post_id>:<comment_id>"
+
+    Attributes:
+        tokens: The distinct words of the text (see tokenize)
+        rank: The document's static rank: a post's likes, or 0 for comments.
+            Results are listed highest first
+        post_id: The identifier of the post, or of the post commented on
+        comment_id: The identifier of the comment, or None for posts
+        snippet: A short summary of the text, for listing in results
+        submitter: The username of the author
+        submitted: The submission datetime of the post or comment
+    """
+    tokens = db.StringProperty(repeated=True)
+    rank = db.IntegerProperty()
+    post_id = db.IntegerProperty()
+    comment_id = db.IntegerProperty(indexed=False)
+    snippet = db.TextProperty()
+    submitter = db.StringProperty(indexed=False)
+    submitted = db.DateTimeProperty()
+
+    @classmethod
+    def key_for_post(cls, post_id):
+        return db.Key(cls, 'post:%d' % int(post_id))
+
+    @classmethod
+    def key_for_comment(cls, post_id, comment_id):
+        return db.Key(cls, 'comment:%d:%d' % (int(post_id), int(comment_id)))
+
+
+def _document_for_post(post):
+    return SearchDocument(
+        key=SearchDocument.key_for_post(post.key.integer_id()),
+        tokens=tokenize((post.title or '') + ' ' + (post.content or ''))[
+            :MAX_DOCUMENT_TOKENS],
+        rank=post.likes or 0,
+        post_id=post.key.integer_id(),
+        snippet=excerpt_for(post.content),
+        submitter=post.submitter,
+        submitted=post.submitted)
+
+
+def _document_for_comment(comment):
+    return SearchDocument(
+        key=SearchDocument.key_for_comment(comment.post_id,
+                                           comment.key.integer_id()),
+        tokens=tokenize(comment.content)[:MAX_DOCUMENT_TOKENS],
+        rank=0,
+        post_id=comment.post_id,
+        comment_id=comment.key.integer_id(),
+        snippet=excerpt_for(comment.content),
+        submitter=comment.submitter,
+        submitted=comment.submitted)
+
+
+def index_posts(posts):
+    """
+    Add posts to the index, or bring their documents up to date
+
+    Args:
+        posts: A list of Posts
+    """
+    db.put_multi([_document_for_post(post) for post in posts])
+
+
+def index_comments(comments):
+    """
+    Add comments to the index, or bring their documents up to date
+
+    Args:
+        comments: A list of Comments
+    """
+    db.put_multi([_document_for_comment(comment) for comment in comments])
+
+
+def unindex_post(post_id):
+    """
+    Remove a post from the index. The documents of its comments are removed
+    as the comments themselves are deleted
+
+    Args:
+        post_id: The identifier for the post, as an int or str
+    """
+    SearchDocument.key_for_post(post_id).delete()
+
+
+def unindex_comment(comment):
+    """
+    Remove a comment from the index
+
+    Args:
+        comment: The Comment
+    """
+    SearchDocument.key_for_comment(comment.post_id,
+                                   comment.key.integer_id()).delete()
+
+
+def unindex_comment_keys(post_id, comment_keys):
+    """
+    Remove several comments on a post from the index, without loading them
+
+    Args:
+        post_id: The identifier for the post, as an int or str
+        comment_keys: The keys of the Comments
+    """
+    db.delete_multi([SearchDocument.key_for_comment(post_id, key.integer_id())
+                     for key in comment_keys])
+
+
+def search_query(text):
+    """
+    Build a query for the documents that contain every word of some text
+
+    Args:
+        text: The text searched for
+
+    Returns:
+        An ndb.Query ordered by rank, or None if the text has no indexed
+        words
+    """
+    tokens = tokenize(text)[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return None
+    query = SearchDocument.query()
+    for token in tokens:
+        query = query.filter(SearchDocument.tokens == token)
+    return query.order(-SearchDocument.rank, -SearchDocument.submitted)
@@ -0,0 +1,342 @@
+"""
+Bulk export and import of the blog's data as JSON Lines.
+
+Each line holds one entity:
+
+    {"key": ["Post", 5, "Comment", 7], "properties": {...}}
+
+where key is the entity's flattened key path, and datetimes are written in
+ISO 8601 format.
+
+Transfers run as TransferJobs, a step at a time on the task queue, so that
+no single request has to handle the whole dataset. The data itself is kept
+in TransferChunks, children of the job, of at most CHUNK_BYTES each:
+
+    - An export step reads one cursor-batched page of one kind, appends its
+      lines to the job as new chunks, and records the cursor. Once every kind
+      in EXPORT_MODELS has been read, the chunks are downloaded in order
+    - An import is uploaded as chunks, and each import step puts one chunk's
+      entities in put_multi batches, recording its progress after each batch
+
+Each step's progress is written in the same transaction as its chunks (or
+after its batch has been put), so a step that is retried resumes from its
+last checkpoint rather than repeating or skipping data. Imported entities
+keep their keys, so the integer ids among them are reserved with the id
+allocator, which would otherwise hand them out again to new entities
+"""
+
+import json
+from datetime import datetime
+from google.appengine.ext import ndb as db
+from model.comment import Comment
+from model.like import Like, LikeCounterShard
+from model.post import Post
+from model.user import PasswordHash, PasswordProperty, User
+
+# The kinds that are exported, in the order that they are exported (and so
+# imported). Likes and like counter shards are included so that imported
+# posts keep their like counts
+EXPORT_MODELS = [User, Post, Comment, Like, LikeCounterShard]
+
+# The maximum size of a chunk's data, leaving room under the datastore's 1MB
+# entity limit
+CHUNK_BYTES = 900 * 1000
+
+# The number of entities read per export step, and put per import batch
+EXPORT_BATCH_SIZE = 200
+IMPORT_BATCH_SIZE = 500
+
+_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+_EXPORT_MODELS_BY_KIND = dict((model._get_kind(), model)
+                              for model in EXPORT_MODELS)
+
+
+class TransferJob(db.Model):
+    """
+    Models an export or import of the blog's data
+
+    Attributes:
+        direction: 'export' or 'import'
+        status: 'running' or 'done'
+        chunks: The number of TransferChunks that the job holds
+        entities: The number of entities exported or imported so far
+        model_index: For exports, the index in EXPORT_MODELS of the kind
+            being read
+        cursor: For exports, a url-safe cursor marking where the next page
+            of that kind starts
+        next_chunk: For imports, the number of the chunk being imported
+        next_line: For imports, the number of lines of that chunk already
+            imported
+        started: The datetime at which the job was created
+        updated: The datetime at which the job last made progress
+    """
+    direction = db.StringProperty(choices=['export', 'import'])
+    status = db.StringProperty(default='running')
+    chunks = db.IntegerProperty(default=0, indexed=False)
+    entities = db.IntegerProperty(default=0, indexed=False)
+    model_index = db.IntegerProperty(default=0, indexed=False)
+    cursor = db.StringProperty(indexed=False)
+    next_chunk = db.IntegerProperty(default=1, indexed=False)
+    next_line = db.IntegerProperty(default=0, indexed=False)
+    started = db.DateTimeProperty(auto_now_add=True)
+    updated = db.DateTimeProperty(auto_now=True, indexed=False)
+
+    def chunk_key(self, number):
+        """
+        Args:
+            number: The chunk's number, counting from 1
+
+        Returns:
+            The key of one of the job's TransferChunks
+        """
+        return db.Key(TransferChunk, number, parent=self.key)
+
+    def to_status(self):
+        """
+        Returns:
+            A summary of the job's progress, as a dict
+        """
+        return {'id': self.key.integer_id(),
+                'direction': self.direction,
+                'status': self.status,
+                'entities': self.entities,
+                'chunks': self.chunks}
+
+
+class TransferChunk(db.Model):
+    """
+    Models part of a transfer's data: a run of complete JSON lines
+
+    Keyed by its number within the job, counting from 1
+
+    Attributes:
+        data: The lines, including each line's terminating newline
+    """
+    data = db.TextProperty()
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.strftime(_DATETIME_FORMAT)
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+def serialize(entity):
+    """
+    Args:
+        entity: An entity of one of EXPORT_MODELS
+
+    Returns:
+        The entity as a line of JSON, without a terminating newline
+    """
+    return json.dumps({'key': entity.key.flat(),
+                       'properties': entity.to_dict()},
+                      default=_encode_value, sort_keys=True)
+
+
+def deserialize(line):
+    """
+    Args:
+        line: A line of JSON, as written by serialize
+
+    Returns:
+        The entity the line describes (not yet put)
+    """
+    record = json.loads(line)
+    key = db.Key(flat=record['key'])
+    model = _EXPORT_MODELS_BY_KIND.get(key.kind())
+    if model is None:
+        raise ValueError('%s entities cannot be imported' % key.kind())
+
+    values = {}
+    for name, value in record['properties'].items():
+        prop = model._properties.get(name)
+        if value is not None and isinstance(prop, db.DateTimeProperty):
+            value = datetime.strptime(value, _DATETIME_FORMAT)
+        elif value is not None and isinstance(prop, PasswordProperty):
+            # Stored passwords are already hashed
+            value = PasswordHash(value)
+        values[name] = value
+    return model(key=key, **values)
+
+
+def _split_into_chunks(lines):
+    # Group lines (each with its newline) into runs of at most CHUNK_BYTES
+    chunks = []
+    current = []
+    size = 0
+    for line in lines:
+        line_size = len(line.encode('utf-8'))
+        if current and size + line_size > CHUNK_BYTES:
+            chunks.append(u''.join(current))
+            current = []
+            size = 0
+        current.append(line)
+        size += line_size
+    if current:
+        chunks.append(u''.join(current))
+    return chunks
+
+
+def start_export():
+    """
+    Returns:
+        A new, running export TransferJob
+    """
+    job = TransferJob(direction='export')
+    job.put()
+    return job
+
+
+def export_step(job_id):
+    """
+    Export the next page of entities of a running export
+
+    Args:
+        job_id: The identifier of the TransferJob
+
+    Returns:
+        True if the job has more to export; False otherwise
+    """
+    job = TransferJob.get_by_id(int(job_id))
+    if not job or job.status != 'running':
+        return False
+
+    model = EXPORT_MODELS[job.model_index]
+    cursor = db.Cursor(urlsafe=job.cursor) if job.cursor else None
+    entities, next_cursor, more = model.query().fetch_page(
+        EXPORT_BATCH_SIZE, start_cursor=cursor)
+    chunks = _split_into_chunks(
+        [unicode(serialize(entity)) + u'\n' for entity in entities])
+
+    @db.transactional
+    def checkpoint():
+        current = job.key.get()
+        if current.model_index != job.model_index or \
+                current.cursor != job.cursor:
+            # A retried step that has already been recorded
+            return current
+        db.put_multi([TransferChunk(key=current.chunk_key(current.chunks + n),
+                                    data=data)
+                      for n, data in enumerate(chunks, 1)])
+        current.chunks += len(chunks)
+        current.entities += len(entities)
+        if more and next_cursor:
+            current.cursor = next_cursor.urlsafe()
+        else:
+            current.model_index += 1
+            current.cursor = None
+            if current.model_index == len(EXPORT_MODELS):
+                current.status = 'done'
+        current.put()
+        return current
+
+    return checkpoint().status == 'running'
+
+
+def iter_export(job):
+    """
+    Read a finished export's data a chunk at a time, so that it can be
+    streamed without holding the whole export in memory
+
+    Args:
+        job: The TransferJob
+
+    Returns:
+        An iterator over the export's data, as UTF-8 encoded strs
+    """
+    next_chunk = None
+    for number in range(1, job.chunks + 1):
+        chunk = next_chunk.get_result() if next_chunk else \
+            job.chunk_key(number).get()
+        # Fetch the following chunk while this one is sent
+        next_chunk = (job.chunk_key(number + 1).get_async()
+                      if number < job.chunks else None)
+        yield chunk.data.encode('utf-8')
+
+
+def start_import(source):
+    """
+    Store uploaded JSON Lines as a new import TransferJob
+
+    Args:
+        source: A file-like object to read the lines from
+
+    Returns:
+        The new, running import TransferJob
+    """
+    job = TransferJob(direction='import')
+    job.put()
+
+    # Lines are read and stored a chunk at a time
+    pending = []
+    size = 0
+    for line in source:
+        line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        if not line.endswith(u'\n'):
+            line += u'\n'
+        pending.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            job.chunks = _put_chunks(job, pending)
+            pending = []
+            size = 0
+    job.chunks = _put_chunks(job, pending)
+    job.put()
+    return job
+
+
+def _put_chunks(job, lines):
+    chunks = _split_into_chunks(lines)
+    db.put_multi([TransferChunk(key=job.chunk_key(job.chunks + n), data=data)
+                  for n, data in enumerate(chunks, 1)])
+    return job.chunks + len(chunks)
+
+
+def _reserve_ids(entities):
+    # Reserve, per kind and parent, every id up to the largest imported
+    largest = {}
+    for entity in entities:
+        key = entity.key
+        if key.integer_id() is not None:
+            group = (type(entity), key.parent())
+            largest[group] = max(largest.get(group, 0), key.integer_id())
+    for (model, parent), max_id in largest.items():
+        model.allocate_ids(max=max_id, parent=parent)
+
+
+def import_step(job_id):
+    """
+    Import the next chunk of a running import, in put_multi batches
+
+    Args:
+        job_id: The identifier of the TransferJob
+
+    Returns:
+        True if the job has more to import; False otherwise
+    """
+    job = TransferJob.get_by_id(int(job_id))
+    if not job or job.status != 'running':
+        return False
+
+    if job.next_chunk <= job.chunks:
+        chunk = job.chunk_key(job.next_chunk).get()
+        lines = chunk.data.rstrip(u'\n').split(u'\n')
+        while job.next_line < len(lines):
+            batch = lines[job.next_line:job.next_line + IMPORT_BATCH_SIZE]
+            entities = [deserialize(line) for line in batch]
+            db.put_multi(entities)
+            _reserve_ids(entities)
+            job.next_line += len(batch)
+            job.entities += len(batch)
+            job.put()
+        job.next_chunk += 1
+        job.next_line = 0
+
+    if job.next_chunk > job.chunks:
+        job.status = 'done'
+    job.put()
+    return job.status == 'running'
@@ -21,10 +21,20 @@ def check_password(username, password):
     return False
 
 
+class PasswordHash(str):
+    """
+    A password that has already been salted and hashed, as it is stored
+    """
+
+
 class PasswordProperty(db.StringProperty):
     """
     A PasswordProperty obfuscates a password so that that password may
     be stored securely.
+
+    Values read back from the datastore are PasswordHashes, which are stored
+    as they are, so that re-putting a User (or importing one) does not hash
+    its password twice
     """
 
     def _validate(self, value):
@@ -32,10 +42,12 @@ class PasswordProperty(db.StringProperty):
             raise TypeError('expected a string, got %s' % repr(value))
 
     def _to_base_type(self, value):
+        if isinstance(value, PasswordHash):
+            return str(value)
         return sha512(value + salt).hexdigest()
 
     def _from_base_type(self, value):
-        return value
+        return PasswordHash(value)
 
 
 class User(db.Model):
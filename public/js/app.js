@@ -1 +1,10 @@
 $(document).foundation()
+
+// Load further pages of comments in place, rather than navigating to them
+$(document).on('click', '.more-comments-link', function (event) {
+    var link = $(this);
+    event.preventDefault();
+    $.get(link.data('fragment'), function (html) {
+        link.closest('.more-comments').replaceWith(html);
+    });
+});
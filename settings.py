@@ -0,0 +1,92 @@
+"""
+Application-wide settings for the blog
+"""
+import os
+
+# True when running under the development server
+DEVELOPMENT = os.environ.get('SERVER_SOFTWARE', '').startswith('Development')
+
+# The number of posts listed on each page of the front page
+FRONT_PAGE_SIZE = 10
+
+# How long a rendered page of the front page may be cached in memcache. Writes
+# invalidate the cache explicitly, so this only bounds how long orphaned
+# renderings linger
+FRONT_PAGE_CACHE_SECONDS = 60 * 60
+
+# How long listings rendered soon after a write may be cached instead. They are
+# read with eventually consistent queries, which may lag the write that
+# invalidated the cache, so a rendering that misses it must not stick for long
+RECENT_WRITE_CACHE_SECONDS = 30
+
+# The number of posts or comments listed on each page of an author page
+AUTHOR_PAGE_SIZE = 10
+
+# How long a rendered page of an author page may be cached in memcache. Writes
+# invalidate the cache explicitly, so this only bounds how long orphaned
+# renderings linger
+AUTHOR_PAGE_CACHE_SECONDS = 60 * 60
+
+# How hot scores weigh age against engagement: a post needs ten times the
+# engagement of one submitted HOT_SCORE_SECONDS later to rank above it on the
+# 'hot' front page. A comment counts as HOT_COMMENT_WEIGHT likes
+HOT_SCORE_SECONDS = 12 * 60 * 60
+HOT_COMMENT_WEIGHT = 2
+
+# How recently a post must have been liked or unliked for /tasks/rescore-hot
+# (run by cron) to reconcile its hot score with its like counter
+HOT_RESCORE_WINDOW_SECONDS = 2 * 24 * 60 * 60
+
+# Comments are moved into their Post's entity group in three steps:
+# 1. Enable COMMENT_ENTITY_GROUPS, so that new comments are stored as
+#    children of their Post
+# 2. Run the comment migration task (/tasks/migrate-comments) to completion,
+#    so that comments written as root entities are re-parented
+# 3. Enable COMMENT_ANCESTOR_QUERIES, so that a post's comments are read with
+#    strongly consistent ancestor queries
+# Until the last step comments are read by post_id, which finds them under
+# either schema
+COMMENT_ENTITY_GROUPS = False
+COMMENT_ANCESTOR_QUERIES = False
+
+# The number of shards in each post's like counter. More shards allow more
+# concurrent likes of one post, at the cost of a larger read to count them
+LIKE_COUNTER_SHARDS = 20
+
+# How long a post's like count may be cached in memcache
+LIKE_COUNT_CACHE_SECONDS = 60
+
+# How often, at most, a post's like count is folded into Post.likes (which
+# orders the front page)
+LIKE_FOLD_SECONDS = 60
+
+# The number of comments shown on each page of a post's comments
+COMMENTS_PAGE_SIZE = 50
+
+# If True, every request is timed by phase and reported in Server-Timing
+# headers and a JSON log line (see util.instrumentation)
+INSTRUMENTATION = False
+
+# If True, requests can be profiled with cProfile (see util.profiling).
+# Profiling is requested by administrators, or by requests that carry
+# PROFILING_SECRET, and routes listed in PROFILING_SAMPLE_RATES (by route
+# template) are also profiled once in every N requests
+PROFILING = False
+PROFILING_SECRET = None
+PROFILING_SAMPLE_RATES = {}
+
+# How long profiles are kept in memcache
+PROFILE_CACHE_SECONDS = 60 * 60
+
+# The number of results shown on each page of search results
+SEARCH_PAGE_SIZE = 20
+
+# The number of posts listed in each Atom feed
+FEED_SIZE = 20
+
+# How long a rendered feed may be cached in memcache. Writes invalidate the
+# cache explicitly, so this only bounds how long orphaned feeds linger
+FEED_CACHE_SECONDS = 60 * 60
+
+# The largest page that API clients can request with the 'limit' parameter
+API_MAX_PAGE_SIZE = 100
@@ -6,6 +6,7 @@ In particular, this test suite tests:
     - Editing posts
     - Deleting posts
     - Liking posts
+    - Ranking posts by hotness
 
 Paths for signed in and sign out users, and authorship, are tested in each case
 
@@ -13,11 +14,14 @@ Paths for signed in and sign out users, and authorship, are tested in each case
 
 import webtest
 import unittest
+from datetime import datetime, timedelta
 from google.appengine.ext import testbed
 from main import app
+from model.like import Like
 from model.post import Post
 from model.user import User
 from util.auth import create_user_cookie
+from task_helpers import run_queued_tasks
 
 
 class TestAdvancedBlogFeatures(unittest.TestCase):
@@ -28,6 +32,7 @@ class TestAdvancedBlogFeatures(unittest.TestCase):
         self.testbed.activate()
         self.testbed.init_datastore_v3_stub()
         self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
 
         # Set up some initial users
         valid_user = User(id="Valid User", password="password")
@@ -301,3 +306,91 @@ class TestAdvancedBlogFeatures(unittest.TestCase):
         re_like_response = unlike_response.click(description="Like").follow()
         re_like_counter = re_like_response.html.select('.post-likes')[0].get_text()
         self.assertTrue(int(re_like_counter) == int(like_counter) + 1)
+
+    def testLikeIsStoredOutsideThePost(self):
+        post_id = self.initial_post_to_like_key.integer_id()
+        self.testapp.set_cookie('user', create_user_cookie('Valid Liker'))
+        self.testapp.request('/posts/%d/like' % post_id)
+
+        self.assertIsNotNone(Like.key_for('Valid Liker', post_id).get())
+        post = Post.get_by_id(post_id)
+        self.assertEqual(post.liked_by, [])
+
+        # The front page ordering catches up once the fold task has run
+        self.assertEqual(post.likes, 1)
+        run_queued_tasks(self.testbed, self.testapp)
+        self.assertEqual(Post.get_by_id(post_id).likes, 2)
+
+    def testLegacyLikesAreMigrated(self):
+        post_id = self.initial_post_to_like_key.integer_id()
+        post = Post.get_by_id(post_id)
+        post.liked_by = ["Valid Liker", "Valid User"]
+        post.put()
+
+        self.testapp.get('/tasks/migrate-likes')
+        run_queued_tasks(self.testbed, self.testapp)
+
+        post = Post.get_by_id(post_id)
+        self.assertEqual(post.liked_by, [])
+        self.assertIsNotNone(Like.key_for('Valid Liker', post_id).get())
+
+        # The migrated like is still counted, and can be withdrawn
+        self.testapp.set_cookie('user', create_user_cookie('Valid Liker'))
+        response = self.testapp.request('/posts/%d' % post_id)
+        self.assertEqual(response.html.select('.post-likes')[0].get_text(),
+                         "3")
+        response = response.click(description="Unlike").follow()
+        self.assertEqual(response.html.select('.post-likes')[0].get_text(),
+                         "2")
+
+    def testManyLegacyLikesAreMigrated(self):
+        post_id = self.initial_post_to_like_key.integer_id()
+        post = Post.get_by_id(post_id)
+        post.liked_by = ["Liker %d" % n for n in range(30)]
+        post.put()
+
+        # More likes than one cross-group transaction can write
+        self.testapp.get('/tasks/migrate-likes')
+        run_queued_tasks(self.testbed, self.testapp)
+
+        self.assertEqual(Post.get_by_id(post_id).liked_by, [])
+        self.assertEqual(Like.query(Like.post_id == post_id).count(), 30)
+        response = self.testapp.request('/posts/%d' % post_id)
+        self.assertEqual(response.html.select('.post-likes')[0].get_text(),
+                         "31")
+
+    def testHotOrderingFavoursNewerPosts(self):
+        old_post_id = Post(title="Old favourite", content="Some content",
+                           submitter="Valid User", likes=20,
+                           submitted=datetime.utcnow() - timedelta(days=3)
+                           ).put().integer_id()
+        new_post_id = self.initial_post_key.integer_id()
+
+        def listed(url):
+            response = self.testapp.request(url)
+            return [int(post['id']) for post in response.html.select(".post")]
+
+        self.assertEqual(listed("/")[0], old_post_id)
+        hot = listed("/?sort=hot")
+        self.assertLess(hot.index(new_post_id), hot.index(old_post_id))
+
+    def testRescoringCatchesUpUnfoldedLikes(self):
+        # The post has not been commented on recently; liking it does not
+        # change its last activity
+        post_id = self.initial_post_to_like_key.integer_id()
+        post = Post.get_by_id(post_id)
+        post.last_activity = datetime.utcnow() - timedelta(days=30)
+        post.put()
+        score = post.hot_score
+        self.testapp.set_cookie('user', create_user_cookie('Valid Liker'))
+        self.testapp.request('/posts/%d/like' % post_id)
+
+        # Drop the scheduled fold, as if it had been lost
+        self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME).FlushQueue(
+            'default')
+        self.testapp.get('/tasks/rescore-hot')
+        run_queued_tasks(self.testbed, self.testapp)
+
+        post = Post.get_by_id(post_id)
+        self.assertEqual(post.likes, 2)
+        self.assertGreater(post.hot_score, score)
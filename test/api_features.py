@@ -0,0 +1,115 @@
+"""
+Test suite for testing the JSON API of a blog.
+
+In particular, this test suite tests:
+
+    - Listing posts, with cursors and field selection
+    - Retrieving a post, its comments and its likes
+    - Answering conditional requests with 304
+    - Answering bad requests with JSON errors
+
+"""
+
+import webtest
+import unittest
+from google.appengine.ext import testbed
+from main import app
+from util.auth import create_user_cookie
+
+
+class TestApiFeatures(unittest.TestCase):
+
+    def setUp(self):
+        self.testapp = webtest.TestApp(app)
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+        self.testapp.set_cookie('user', create_user_cookie('Author'))
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def createPost(self, title, content):
+        response = self.testapp.post('/posts', {'title': title,
+                                                'content': content})
+        return int(response.location.rsplit('/', 1)[1])
+
+    def testPostsArePagedWithCursors(self):
+        for n in range(3):
+            self.createPost('Post %d' % n, 'Content %d.' % n)
+
+        response = self.testapp.get('/api/v1/posts',
+                                    {'limit': 2, 'fields': 'title'})
+        self.assertEqual(response.content_type, 'application/json')
+        first = response.json
+        self.assertEqual(len(first['posts']), 2)
+        self.assertEqual(first['posts'][0].keys(), ['title'])
+
+        second = self.testapp.get('/api/v1/posts', {
+            'limit': 2, 'fields': 'title', 'cursor': first['next']}).json
+        self.assertEqual(len(second['posts']), 1)
+        self.assertIsNone(second['next'])
+        self.assertEqual(
+            sorted(post['title']
+                   for post in first['posts'] + second['posts']),
+            ['Post 0', 'Post 1', 'Post 2'])
+
+    def testListingsOnlyIncludeContentWhenAskedFor(self):
+        self.createPost('Title', 'The whole content.')
+        summary = self.testapp.get('/api/v1/posts').json['posts'][0]
+        self.assertNotIn('content', summary)
+        self.assertEqual(summary['submitter'], 'Author')
+
+        full = self.testapp.get('/api/v1/posts', {
+            'fields': 'id,content', 'sort': 'discussed'}).json['posts'][0]
+        self.assertEqual(full['content'], 'The whole content.')
+
+    def testListingsFollowWrites(self):
+        post_id = self.createPost('Original', 'Content.')
+        self.testapp.get('/api/v1/posts')
+        self.testapp.post('/posts/%d/edit' % post_id,
+                          {'title': 'Edited', 'content': 'Content.'})
+        posts = self.testapp.get('/api/v1/posts').json['posts']
+        self.assertEqual([post['title'] for post in posts], ['Edited'])
+
+    def testPostCommentsAndLikes(self):
+        post_id = self.createPost('Title', 'Content.')
+        self.testapp.post('/posts/%d/comments' % post_id,
+                          {'content': 'A comment'})
+
+        post = self.testapp.get('/api/v1/posts/%d' % post_id,
+                                {'fields': 'id,content'}).json
+        self.assertEqual(post, {'id': post_id, 'content': 'Content.'})
+
+        comments = self.testapp.get(
+            '/api/v1/posts/%d/comments' % post_id).json['comments']
+        self.assertEqual([comment['content'] for comment in comments],
+                         ['A comment'])
+
+        self.testapp.set_cookie('user', create_user_cookie('Reader'))
+        self.testapp.get('/posts/%d/like' % post_id)
+        likes = self.testapp.get('/api/v1/posts/%d/likes' % post_id).json
+        self.assertEqual(likes, {'post_id': post_id, 'likes': 2,
+                                 'liked': True})
+        self.testapp.reset()
+        likes = self.testapp.get('/api/v1/posts/%d/likes' % post_id).json
+        self.assertIsNone(likes['liked'])
+
+    def testUnchangedResponsesAreNotModified(self):
+        post_id = self.createPost('Title', 'Content.')
+        for url in ['/api/v1/posts', '/api/v1/posts/%d' % post_id,
+                    '/api/v1/posts/%d/comments' % post_id]:
+            etag = self.testapp.get(url).headers['ETag']
+            self.testapp.get(url, headers={'If-None-Match': etag},
+                             status=304)
+
+    def testBadRequestsAreAnsweredWithJsonErrors(self):
+        response = self.testapp.get('/api/v1/posts', {'fields': 'secret'},
+                                    status=400)
+        self.assertIn('secret', response.json['error'])
+        self.testapp.get('/api/v1/posts', {'limit': '0'}, status=400)
+        self.testapp.get('/api/v1/posts', {'sort': 'random'}, status=400)
+        response = self.testapp.get('/api/v1/posts/1', status=404)
+        self.assertEqual(response.content_type, 'application/json')
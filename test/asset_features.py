@@ -0,0 +1,78 @@
+"""
+Test suite for testing how a blog's static assets are served.
+
+In particular, this test suite tests:
+
+    - Pages loading each bundle of stylesheets and scripts
+    - Building bundles into fingerprinted files
+
+"""
+
+import os
+import shutil
+import tempfile
+import webtest
+import unittest
+from google.appengine.ext import testbed
+from main import app
+import util.assets as assets
+
+
+class TestAssetFeatures(unittest.TestCase):
+
+    def setUp(self):
+        self.testapp = webtest.TestApp(app)
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.manifest = assets._manifest
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        assets._manifest = self.manifest
+        shutil.rmtree(self.out_dir)
+        self.testbed.deactivate()
+
+    def testPagesLoadEachBundlesSourcesWithoutAManifest(self):
+        assets._manifest = None
+        response = self.testapp.get("/")
+        stylesheets = [link['href'] for link in response.html.select('link[rel=stylesheet]')]
+        scripts = [script['src'] for script in response.html.select('script')]
+        self.assertEqual(stylesheets, assets.assets('app.css'))
+        self.assertEqual(scripts, assets.assets('app.js'))
+        for url in stylesheets + scripts:
+            self.assertTrue(os.path.exists(os.path.join(
+                assets.public_dir, url[len('/public/'):])))
+
+    def testBuiltBundlesAreFingerprinted(self):
+        manifest = assets.build(self.out_dir,
+                                os.path.join(self.out_dir, 'manifest.json'))
+        self.assertEqual(sorted(manifest), ['app.css', 'app.js'])
+
+        # Scripts are included verbatim, or as their vendored minified build
+        with open(os.path.join(self.out_dir, manifest['app.js'])) as script:
+            content = script.read()
+        with open(os.path.join(assets.public_dir, 'js/app.js')) as source:
+            self.assertIn(source.read(), content)
+        with open(os.path.join(assets.public_dir,
+                               'js/vendor/foundation.min.js')) as source:
+            self.assertIn(source.read().strip(), content)
+        self.assertFalse(os.path.exists(os.path.join(
+            self.out_dir, manifest['app.js'] + '.gz')))
+
+        # Rebuilding unchanged sources produces the same file names
+        self.assertEqual(assets.build(self.out_dir,
+                                      os.path.join(self.out_dir, 'm.json')),
+                         manifest)
+
+        assets._manifest = manifest
+        response = self.testapp.get("/")
+        self.assertEqual([script['src']
+                          for script in response.html.select('script')],
+                         ['/public/build/' + manifest['app.js']])
+
+    def testMinificationKeepsCode(self):
+        self.assertEqual(assets.minify_css("/* comment */\na  b {\n"
+                                           "  color: red;\n}\n"),
+                         "a b{color: red}\n")
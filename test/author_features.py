@@ -0,0 +1,116 @@
+"""
+Test suite for testing the author pages of a blog.
+
+In particular, this test suite tests:
+
+    - Listing one user's posts and comments, newest first
+    - Not finding the pages of users who don't exist
+    - Paginating author pages
+    - Keeping cached author pages up to date as posts and comments are written
+
+"""
+
+import webtest
+import unittest
+from google.appengine.ext import testbed
+from main import app
+from model.user import User
+from util.auth import create_user_cookie
+from task_helpers import run_queued_tasks
+import settings
+
+
+class TestAuthorFeatures(unittest.TestCase):
+
+    def setUp(self):
+        self.testapp = webtest.TestApp(app)
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+        self.author_page_size = settings.AUTHOR_PAGE_SIZE
+        for username in ['Author', 'Other']:
+            self.testapp.post('/users/new', {'username': username,
+                                             'password': 'password'})
+
+    def tearDown(self):
+        settings.AUTHOR_PAGE_SIZE = self.author_page_size
+        self.testbed.deactivate()
+
+    def signIn(self, username):
+        self.testapp.set_cookie('user', create_user_cookie(username))
+
+    def createPost(self, title, username='Author'):
+        self.signIn(username)
+        response = self.testapp.post('/posts', {'title': title,
+                                                'content': 'Content.'})
+        return int(response.location.rsplit('/', 1)[1])
+
+    def listed(self, url):
+        response = self.testapp.get(url)
+        return [element.get_text().strip() for element in
+                response.html.select('.title-anchor, .comment-content')]
+
+    def testAuthorPageListsOnlyTheirPostsNewestFirst(self):
+        self.createPost('First')
+        self.createPost('Theirs', 'Other')
+        self.createPost('Second')
+        self.assertEqual(self.listed('/users/Author'), ['Second', 'First'])
+        self.testapp.get('/users/Nobody', status=404)
+
+    def testDeletedAuthorsPageIsNotFoundEvenWhenRevalidated(self):
+        self.createPost('First')
+        etag = self.testapp.get('/users/Author').headers['ETag']
+        User.get_by_id('Author').key.delete()
+        self.testapp.get('/users/Author', headers={'If-None-Match': etag},
+                         status=404)
+
+    def testAuthorPageListsTheirComments(self):
+        post_id = self.createPost('Post', 'Other')
+        self.signIn('Author')
+        self.testapp.post('/posts/%d/comments' % post_id,
+                          {'content': 'My comment'})
+        self.assertEqual(self.listed('/users/Author?show=comments'),
+                         ['My comment'])
+        self.assertEqual(self.listed('/users/Other?show=comments'), [])
+
+    def testAuthorPagesArePaginated(self):
+        settings.AUTHOR_PAGE_SIZE = 2
+        for n in range(3):
+            self.createPost('Post %d' % n)
+
+        response = self.testapp.get('/users/Author')
+        self.assertEqual(len(response.html.select('.title-anchor')), 2)
+        response = self.testapp.get(
+            str(response.html.select('.page-next')[0]['href']))
+        self.assertEqual([link.get_text() for link in
+                          response.html.select('.title-anchor')], ['Post 0'])
+        response = self.testapp.get(
+            str(response.html.select('.page-prev')[0]['href']))
+        self.assertEqual([link.get_text() for link in
+                          response.html.select('.title-anchor')],
+                         ['Post 2', 'Post 1'])
+
+    def testAuthorPagesFollowWrites(self):
+        post_id = self.createPost('Original')
+        self.signIn('Other')
+        self.testapp.post('/posts/%d/comments' % post_id,
+                          {'content': 'A comment'})
+        self.assertEqual(self.listed('/users/Author'), ['Original'])
+        self.assertEqual(self.listed('/users/Other?show=comments'),
+                         ['A comment'])
+
+        self.signIn('Author')
+        self.testapp.post('/posts/%d/edit' % post_id,
+                          {'title': 'Edited', 'content': 'Content.'})
+        self.assertEqual(self.listed('/users/Author'), ['Edited'])
+
+        # Deleting a post refreshes the pages of those who commented on it
+        # once its comments have been deleted
+        self.testapp.get('/posts/%d/delete' % post_id)
+        self.assertEqual(self.listed('/users/Author'), [])
+        self.assertEqual(self.listed('/users/Other?show=comments'),
+                         ['A comment'])
+        run_queued_tasks(self.testbed, self.testapp)
+        self.assertEqual(self.listed('/users/Other?show=comments'), [])
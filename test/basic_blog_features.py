@@ -9,10 +9,12 @@ Paths for signed in and sign out users are tested
 
 """
 
+import webob
 import webtest
 import unittest
 from google.appengine.ext import testbed
 from main import app
+from handler.posts import PostHandler
 from model.post import Post
 from util.auth import create_user_cookie
 
@@ -42,6 +44,93 @@ class TestBasicBlogFeatures(unittest.TestCase):
         posts = response.html.find_all('div', {'class': 'post'})
         self.assertEquals(len(posts), 1)
 
+    # The front page lists FRONT_PAGE_SIZE posts at a time, with links to
+    # step forwards and backwards through the remaining posts
+    def testFrontPageIsPaginated(self):
+        import settings
+        for i in range(settings.FRONT_PAGE_SIZE):
+            Post(title="Test %d" % i, content="Some content",
+                 submitter="Me").put()
+
+        first_page = self.testapp.get("/")
+        posts = first_page.html.find_all('div', {'class': 'post'})
+        self.assertEqual(len(posts), settings.FRONT_PAGE_SIZE)
+        self.assertEqual(len(first_page.html.select('.page-prev')), 0)
+
+        next_href = first_page.html.select('.page-next')[0].get('href')
+        second_page = self.testapp.get(next_href)
+        posts = second_page.html.find_all('div', {'class': 'post'})
+        self.assertEqual(len(posts), 1)
+        self.assertEqual(len(second_page.html.select('.page-next')), 0)
+
+        prev_href = second_page.html.select('.page-prev')[0].get('href')
+        previous_page = self.testapp.get(prev_href)
+        self.assertEqual(
+            [post['id'] for post in previous_page.html.select('.post')],
+            [post['id'] for post in first_page.html.select('.post')])
+
+    # A malformed cursor falls back to the first page
+    def testFrontPageIgnoresMalformedCursor(self):
+        response = self.testapp.get("/?cursor=junk")
+        self.assertEqual(response.status_int, 200)
+        posts = response.html.find_all('div', {'class': 'post'})
+        self.assertEqual(len(posts), 1)
+
+    # The rendered front page is cached until a post is written through the
+    # application
+    def testFrontPageIsCachedUntilAPostIsWritten(self):
+        response = self.testapp.get("/")
+        self.assertEqual(len(response.html.select('.post')), 1)
+
+        # A post written behind the application's back is not listed...
+        Post(title="Uncached", content="Some content", submitter="Me").put()
+        response = self.testapp.get("/")
+        self.assertEqual(len(response.html.select('.post')), 1)
+
+        # ...until a write through the application invalidates the cache
+        self.testapp.set_cookie('user', create_user_cookie('user'))
+        self.testapp.post('/posts', {'title': 'New', 'content': 'Content'})
+        response = self.testapp.get("/")
+        self.assertEqual(len(response.html.select('.post')), 3)
+
+    # A page rendered just after a write may be read from a query that does
+    # not reflect it yet, so it is only cached briefly
+    def testFrontPageIsCachedBrieflyAfterAWrite(self):
+        import settings
+        import time
+        from google.appengine.api import api_base_pb, apiproxy_stub_map
+        from google.appengine.api.memcache import memcache_stub_service_pb
+
+        def set_memcache_clock(seconds):
+            request = memcache_stub_service_pb.SetClockRequest()
+            request.set_clock_time_milliseconds(int(seconds * 1000))
+            apiproxy_stub_map.MakeSyncCall('memcache', 'SetClock', request,
+                                           api_base_pb.VoidProto())
+
+        now = time.time()
+        set_memcache_clock(now)
+
+        self.testapp.set_cookie('user', create_user_cookie('user'))
+        self.testapp.post('/posts', {'title': 'New', 'content': 'Content'})
+        response = self.testapp.get("/")
+        self.assertEqual(len(response.html.select('.post')), 2)
+
+        # Stands in for a write that the query had not caught up with
+        Post(title="Lagging", content="Some content", submitter="Me").put()
+        now += settings.RECENT_WRITE_CACHE_SECONDS + 1
+        set_memcache_clock(now)
+        response = self.testapp.get("/", headers={
+            'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(len(response.html.select('.post')), 3)
+
+        # Once the write has settled, renderings are cached for longer
+        Post(title="Uncached", content="Some content", submitter="Me").put()
+        now += settings.RECENT_WRITE_CACHE_SECONDS + 1
+        set_memcache_clock(now)
+        response = self.testapp.get("/")
+        self.assertEqual(len(response.html.select('.post')), 3)
+
     # The <div class="post"> element contains data for title, content, votes
     # submitter, submitted datetime, and a link to the post's entry
     def testPostElementStructure(self):
@@ -67,6 +156,24 @@ class TestBasicBlogFeatures(unittest.TestCase):
                          datetime.datetime.utcnow().date().isoformat())
         self.assertTrue(post_content, "Some content")
 
+    # The front page shows a precomputed excerpt of each post's content
+    def testFrontPageShowsPostExcerpts(self):
+        from model.post import EXCERPT_LENGTH
+        long_post = Post(title="Long", submitter="Me",
+                         content="One. Two. Three. Four. Five.")
+        long_post_id = long_post.put().id()
+        self.assertEqual(long_post.excerpt, "One.  Two.  Three...")
+
+        wordy_post = Post(title="Wordy", submitter="Me",
+                          content="word " * EXCERPT_LENGTH)
+        wordy_post.put()
+        self.assertLessEqual(len(wordy_post.excerpt), EXCERPT_LENGTH)
+
+        response = self.testapp.get("/")
+        post = response.html.find(id=long_post_id)
+        self.assertEqual(post.select('.content')[0].get_text(),
+                         "One.  Two.  Three...")
+
     # posts/new renders a form for submitting new posts
     def testThereIsAFormForSubmittingNewPosts(self):
 
@@ -151,3 +258,52 @@ class TestBasicBlogFeatures(unittest.TestCase):
     def testBlogPosts404ForInvalidIdentifier(self):
         response = self.testapp.get("/posts/junk", status=404)
         self.assertEqual(response.status_int, 404)
+
+    # Clients that send back the ETag of an unchanged page are told that it
+    # has not been modified
+    def testFrontPageHonoursIfNoneMatch(self):
+        etag = self.testapp.get("/").headers['ETag']
+        response = self.testapp.get("/", headers={'If-None-Match': etag},
+                                    status=304)
+        self.assertEqual(response.body, '')
+
+        # Signing in changes the page...
+        self.testapp.set_cookie('user', create_user_cookie('user'))
+        self.testapp.get("/", headers={'If-None-Match': etag}, status=200)
+
+        # ...as does writing a post
+        etag = self.testapp.get("/").headers['ETag']
+        self.testapp.post('/posts', {'title': 'New', 'content': 'Content'})
+        self.testapp.get("/", headers={'If-None-Match': etag}, status=200)
+
+    def testPostPageHonoursConditionalHeaders(self):
+        url = "/posts/%d" % self.initial_post_key.id()
+        response = self.testapp.get(url)
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+        self.testapp.get(url, headers={'If-None-Match': etag}, status=304)
+        self.testapp.get(url, headers={'If-Modified-Since': last_modified},
+                         status=304)
+
+        # Editing the post changes the page
+        self.testapp.set_cookie('user', create_user_cookie('Me'))
+        self.testapp.post(url + '/edit', {'title': 'Edited',
+                                          'content': 'Edited'})
+        self.testapp.get(url, headers={'If-None-Match': etag}, status=200)
+
+    # Post pages are streamed in several chunks, starting with the top of the
+    # page, and are identical to pages rendered in one piece
+    def testPostPageIsStreamed(self):
+        url = "/posts/%d" % self.initial_post_key.id()
+        status, headers, app_iter = webob.Request.blank(url).call_application(
+            app)
+        chunks = list(app_iter)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(chunks[0].startswith('<!DOCTYPE html>'))
+
+        PostHandler.stream_response = False
+        try:
+            rendered = self.testapp.get(url).body
+        finally:
+            PostHandler.stream_response = True
+        self.assertEqual(''.join(chunks), rendered)
@@ -15,10 +15,14 @@ import webtest
 import unittest
 from google.appengine.ext import testbed
 from main import app
+from handler.tasks import DeleteCommentsHandler
 from model.comment import Comment
+from model.like import Like, LikeCounterShard, toggle_like
 from model.post import Post
 from model.user import User
 from util.auth import create_user_cookie
+from task_helpers import run_queued_tasks
+import settings
 
 
 def establish_users_and_post_with_comments():
@@ -50,10 +54,15 @@ class TestCommentFeatures(unittest.TestCase):
         self.testbed.activate()
         self.testbed.init_datastore_v3_stub()
         self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+        self.comments_page_size = settings.COMMENTS_PAGE_SIZE
         self.test_post_id, self.comment_ids = \
             establish_users_and_post_with_comments()
 
     def tearDown(self):
+        settings.COMMENT_ENTITY_GROUPS = False
+        settings.COMMENT_ANCESTOR_QUERIES = False
+        settings.COMMENTS_PAGE_SIZE = self.comments_page_size
         self.testbed.deactivate()
 
     def testCommentsAreListed(self):
@@ -169,3 +178,133 @@ class TestCommentFeatures(unittest.TestCase):
 
         comments = delete_redirect.html.select('.comment')
         self.assertEqual(len(comments), 3)
+
+    def testNewCommentsAreChildrenOfTheirPostInEntityGroupMode(self):
+        settings.COMMENT_ENTITY_GROUPS = True
+        self.testapp.set_cookie('user', create_user_cookie('Test_User_01'))
+        self.testapp.post("/posts/%d/comments" % self.test_post_id,
+                          {'content': 'New content'})
+
+        comments = Comment.query(
+            ancestor=Comment.post_key(self.test_post_id)).fetch()
+        self.assertEqual([comment.content for comment in comments],
+                         ["New content"])
+
+    def testUnmigratedCommentsAreServedUntilAncestorQueriesAreEnabled(self):
+        settings.COMMENT_ENTITY_GROUPS = True
+        self.testapp.set_cookie('user', create_user_cookie('Test_User_01'))
+        self.testapp.post("/posts/%d/comments" % self.test_post_id,
+                          {'content': 'New content'})
+
+        response = self.testapp.request("/posts/%d" % self.test_post_id)
+        self.assertEqual(len(response.html.select(".comment")),
+                         len(self.comment_ids) + 1)
+
+        # Deleting the post deletes both the root and the child comments
+        self.testapp.request("/posts/%d/delete" % self.test_post_id)
+        run_queued_tasks(self.testbed, self.testapp)
+        self.assertEqual(Comment.query().count(), 0)
+
+    def testMigratedCommentsAreServedInEntityGroupMode(self):
+        self.testapp.get("/tasks/migrate-comments")
+        run_queued_tasks(self.testbed, self.testapp)
+
+        for comment in Comment.query():
+            self.assertEqual(comment.key.parent(),
+                             Comment.post_key(self.test_post_id))
+
+        settings.COMMENT_ENTITY_GROUPS = True
+        settings.COMMENT_ANCESTOR_QUERIES = True
+        response = self.testapp.request("/posts/%d" % self.test_post_id)
+        self.assertEqual([int(comment['id'])
+                          for comment in response.html.select(".comment")],
+                         self.comment_ids)
+
+        # Migrated comments keep their URLs
+        self.testapp.set_cookie('user', create_user_cookie('Test_User_01'))
+        self.testapp.request("/posts/%d/comments/%d/delete" %
+                             (self.test_post_id, self.comment_ids[0]))
+        self.assertIsNone(Comment.get_for_post(self.test_post_id,
+                                               self.comment_ids[0]))
+
+    def testDeletingPostDeletesItsCommentsAndLikes(self):
+        toggle_like('Test_User_02', Post.get_by_id(self.test_post_id))
+        self.testapp.set_cookie('user', create_user_cookie('Test_User_01'))
+        self.testapp.request("/posts/%d/delete" % self.test_post_id)
+        self.assertIsNone(Post.get_by_id(self.test_post_id))
+
+        # The comments are deleted in the background, a batch at a time,
+        # followed by the likes
+        DeleteCommentsHandler.batch_size = 2
+        try:
+            self.assertEqual(run_queued_tasks(self.testbed, self.testapp), 3)
+        finally:
+            DeleteCommentsHandler.batch_size = 500
+        self.assertEqual(Comment.query().count(), 0)
+        self.assertEqual(Like.query().count(), 0)
+        self.assertEqual(LikeCounterShard.query().count(), 0)
+
+    def testCommentsArePaginated(self):
+        settings.COMMENTS_PAGE_SIZE = 2
+        response = self.testapp.request("/posts/%d" % self.test_post_id)
+        comments = response.html.select(".comment")
+        self.assertEqual([int(comment['id']) for comment in comments],
+                         self.comment_ids[:2])
+
+        # The remaining comments are served as a fragment for the page to
+        # append...
+        more_link = response.html.select(".more-comments-link")[0]
+        fragment = self.testapp.request(str(more_link['data-fragment']))
+        comments = fragment.html.select(".comment")
+        self.assertEqual([int(comment['id']) for comment in comments],
+                         self.comment_ids[2:])
+        self.assertEqual(len(fragment.html.select(".more-comments-link")), 0)
+
+        # ...or as a page of their own, without scripting
+        next_page = self.testapp.request(str(more_link['href']))
+        comments = next_page.html.select(".comment")
+        self.assertEqual([int(comment['id']) for comment in comments],
+                         self.comment_ids[2:])
+
+    def testEditPageListsCommentsFromTheEditedComment(self):
+        self.testapp.set_cookie('user', create_user_cookie('Test_User_02'))
+        response = self.testapp.request(
+            "/posts/%d/comments/%d" % (self.test_post_id, self.comment_ids[1]))
+        self.assertEqual(len(response.html.select(".editable-comment")), 1)
+        self.assertEqual(len(response.html.select(".uneditable-comment")), 1)
+
+    def testPostsCountTheirComments(self):
+        self.testapp.get("/tasks/backfill-comment-stats")
+        run_queued_tasks(self.testbed, self.testapp)
+        self.assertEqual(Post.get_by_id(self.test_post_id).comment_count, 3)
+
+        self.testapp.set_cookie('user', create_user_cookie('Test_User_01'))
+        self.testapp.post("/posts/%d/comments" % self.test_post_id,
+                          {'content': 'New content'})
+        response = self.testapp.request("/")
+        self.assertEqual(response.html.select(".comment-count")[0].get_text(),
+                         "4 comments")
+
+        self.testapp.request("/posts/%d/comments/%d/delete" %
+                             (self.test_post_id, self.comment_ids[0]))
+        self.assertEqual(Post.get_by_id(self.test_post_id).comment_count, 3)
+
+    def testFrontPageCanBeSortedByDiscussionAndActivity(self):
+        quiet_post_id = Post(title="Quiet", submitter="Test_User_02",
+                             content="Quiet", likes=5).put().integer_id()
+        self.testapp.get("/tasks/backfill-comment-stats")
+        run_queued_tasks(self.testbed, self.testapp)
+
+        def listed(url):
+            response = self.testapp.request(url)
+            return [int(post['id']) for post in response.html.select(".post")]
+
+        self.assertEqual(listed("/"), [quiet_post_id, self.test_post_id])
+        self.assertEqual(listed("/?sort=discussed"),
+                         [self.test_post_id, quiet_post_id])
+
+        self.testapp.set_cookie('user', create_user_cookie('Test_User_01'))
+        self.testapp.post("/posts/%d/comments" % quiet_post_id,
+                          {'content': 'New content'})
+        self.assertEqual(listed("/?sort=active"),
+                         [quiet_post_id, self.test_post_id])
@@ -0,0 +1,116 @@
+"""
+Test suite for testing the Atom feeds of a blog.
+
+In particular, this test suite tests:
+
+    - Listing the newest posts, of every user or of one user
+    - Dating each entry by its post's latest write
+    - Keeping cached feeds up to date as posts are written
+    - Answering conditional requests for unchanged feeds with 304
+
+"""
+
+import webtest
+import unittest
+from datetime import datetime
+from xml.etree import ElementTree
+from google.appengine.ext import testbed
+from main import app
+from model.post import Post
+from util.auth import create_user_cookie
+import settings
+
+
+class TestFeedFeatures(unittest.TestCase):
+
+    def setUp(self):
+        self.testapp = webtest.TestApp(app)
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+        self.feed_size = settings.FEED_SIZE
+        self.testapp.post('/users/new', {'username': 'Author',
+                                         'password': 'password'})
+        self.testapp.post('/users/new', {'username': 'Other',
+                                         'password': 'password'})
+
+    def tearDown(self):
+        settings.FEED_SIZE = self.feed_size
+        self.testbed.deactivate()
+
+    def createPost(self, title, content, user='Author'):
+        self.testapp.set_cookie('user', create_user_cookie(user))
+        response = self.testapp.post('/posts', {'title': title,
+                                                'content': content})
+        self.testapp.reset()
+        return int(response.location.rsplit('/', 1)[1])
+
+    def entryTitles(self, url='/feed.atom'):
+        response = self.testapp.get(url)
+        self.assertEqual(response.content_type, 'application/atom+xml')
+        feed = ElementTree.fromstring(response.body)
+        return [title.text for title in feed.findall(
+            '{http://www.w3.org/2005/Atom}entry/'
+            '{http://www.w3.org/2005/Atom}title')]
+
+    def testFeedListsNewestPosts(self):
+        settings.FEED_SIZE = 2
+        self.createPost('First', 'One.')
+        self.createPost('Second', 'Two.', user='Other')
+        self.createPost('Third & last', 'Three.')
+        self.assertEqual(self.entryTitles(), ['Third & last', 'Second'])
+
+    def testAuthorFeedListsOnlyTheirPosts(self):
+        self.createPost('Mine', 'One.')
+        self.createPost('Theirs', 'Two.', user='Other')
+        self.assertEqual(self.entryTitles('/users/Author/feed.atom'),
+                         ['Mine'])
+        self.testapp.get('/users/Nobody/feed.atom', status=404)
+
+    def testFeedFollowsWrites(self):
+        post_id = self.createPost('Original', 'One.')
+        self.assertEqual(self.entryTitles(), ['Original'])
+
+        self.testapp.set_cookie('user', create_user_cookie('Author'))
+        self.testapp.post('/posts/%d/edit' % post_id,
+                          {'title': 'Edited', 'content': 'One.'})
+        self.assertEqual(self.entryTitles(), ['Edited'])
+        self.assertEqual(self.entryTitles('/users/Author/feed.atom'),
+                         ['Edited'])
+
+        self.testapp.get('/posts/%d/delete' % post_id)
+        self.assertEqual(self.entryTitles(), [])
+
+    def testEntriesAreDatedByTheirLatestWrite(self):
+        post = Post(title="Old", content="Old.", submitter="Author",
+                    submitted=datetime(2016, 1, 1))
+        post.put()
+        for url in ('/feed.atom', '/users/Author/feed.atom'):
+            feed = ElementTree.fromstring(self.testapp.get(url).body)
+            entry = feed.find('{http://www.w3.org/2005/Atom}entry')
+            self.assertEqual(
+                entry.find('{http://www.w3.org/2005/Atom}published').text,
+                '2016-01-01T00:00:00Z')
+            self.assertEqual(
+                entry.find('{http://www.w3.org/2005/Atom}updated').text,
+                post.updated.strftime('%Y-%m-%dT%H:%M:%SZ'))
+
+    def testUnchangedFeedIsNotModified(self):
+        self.createPost('First', 'One.')
+        response = self.testapp.get('/feed.atom')
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+
+        self.testapp.get('/feed.atom', headers={'If-None-Match': etag},
+                         status=304)
+        self.testapp.get('/feed.atom',
+                         headers={'If-Modified-Since': last_modified},
+                         status=304)
+
+        self.createPost('Second', 'Two.')
+        response = self.testapp.get('/feed.atom',
+                                    headers={'If-None-Match': etag})
+        self.assertEqual(response.status_int, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
@@ -0,0 +1,90 @@
+"""
+Test suite for testing the per-request performance instrumentation.
+
+In particular, this test suite tests that instrumented requests:
+
+    - Report their phases in a Server-Timing header
+    - Are logged as JSON, keyed by route
+
+"""
+
+import json
+import logging
+import webapp2
+import webtest
+import unittest
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+from main import app
+from model.post import Post
+from model.user import User
+from util.auth import create_user_cookie
+from util.instrumentation import instrument
+
+
+class LogCapture(logging.Handler):
+    """
+    A logging handler that keeps the messages it is sent
+    """
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestInstrumentationFeatures(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        # The RPC hooks are installed on the testbed's apiproxy
+        self.testapp = webtest.TestApp(instrument(app))
+
+        self.log = LogCapture()
+        self.log_level = logging.getLogger().level
+        logging.getLogger().addHandler(self.log)
+        logging.getLogger().setLevel(logging.INFO)
+
+        User(id="Author", password="password").put()
+        self.post_id = Post(title="Test", content="Test",
+                            submitter="Author").put().integer_id()
+        ndb.get_context().clear_cache()
+
+    def tearDown(self):
+        logging.getLogger().removeHandler(self.log)
+        logging.getLogger().setLevel(self.log_level)
+        app.router.set_dispatcher(webapp2.Router.default_dispatcher)
+        self.testbed.deactivate()
+
+    def testResponsesCarryServerTiming(self):
+        self.testapp.set_cookie('user', create_user_cookie('Author'))
+        response = self.testapp.get('/posts/%d/edit' % self.post_id)
+        metrics = [metric.split(';')[0] for metric in
+                   response.headers['Server-Timing'].split(', ')]
+        for metric in ('checks', 'datastore', 'render', 'total'):
+            self.assertIn(metric, metrics)
+
+    def testRequestsAreLoggedByRoute(self):
+        self.testapp.get('/posts/%d' % self.post_id)
+        records = [json.loads(message) for message in self.log.messages
+                   if message.startswith('{')]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['route'], '/posts/<post_id:\\d+>')
+        self.assertEqual(records[0]['handler'], 'PostHandler')
+        self.assertEqual(records[0]['status'], 200)
+        self.assertGreater(records[0]['datastore'], 0)
+        self.assertIn('body_ms', records[0])
+
+    def testStreamedRenderTimeIsLogged(self):
+        response = self.testapp.get('/posts/%d' % self.post_id)
+        metrics = [metric.split(';')[0] for metric in
+                   response.headers['Server-Timing'].split(', ')]
+        self.assertNotIn('render', metrics)
+        records = [json.loads(message) for message in self.log.messages
+                   if message.startswith('{')]
+        self.assertGreater(records[0]['render_ms'], 0)
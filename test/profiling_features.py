@@ -0,0 +1,99 @@
+"""
+Test suite for testing on-demand profiling of requests.
+
+In particular, this test suite tests that:
+
+    - Only administrators and holders of the secret can request profiles
+    - Sampled routes are profiled without being asked, and matched once
+    - Profiles can be listed and downloaded
+
+"""
+
+import marshal
+import webapp2
+import webtest
+import unittest
+from google.appengine.ext import testbed
+from main import app
+from model.post import Post
+from util.profiling import profiled
+import settings
+
+
+class TestProfilingFeatures(unittest.TestCase):
+
+    def setUp(self):
+        self.testapp = webtest.TestApp(app)
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_user_stub()
+
+        app.router.set_dispatcher(profiled(app.router.dispatch))
+        settings.PROFILING_SECRET = 'secret'
+        self.post_url = '/posts/%d' % Post(
+            title="Test", content="Test", submitter="Author").put().id()
+
+    def tearDown(self):
+        app.router.set_dispatcher(webapp2.Router.default_dispatcher)
+        app.router.set_matcher(webapp2.Router.default_matcher)
+        settings.PROFILING_SECRET = None
+        settings.PROFILING_SAMPLE_RATES = {}
+        self.testbed.deactivate()
+
+    def testProfilesRequireAdministratorOrSecret(self):
+        response = self.testapp.get(self.post_url + '?_profile=1')
+        self.assertNotIn('X-Profile-Id', response.headers)
+
+        response = self.testapp.get(self.post_url + '?_profile=1',
+                                    headers={'X-Profile-Secret': 'wrong'})
+        self.assertNotIn('X-Profile-Id', response.headers)
+
+        response = self.testapp.get(self.post_url,
+                                    headers={'X-Profile': '1',
+                                             'X-Profile-Secret': 'secret'})
+        self.assertIn('X-Profile-Id', response.headers)
+
+        self.testbed.setup_env(user_is_admin='1', overwrite=True)
+        response = self.testapp.get(self.post_url + '?_profile=1')
+        self.assertIn('X-Profile-Id', response.headers)
+
+    def testSampledRoutesAreProfiled(self):
+        settings.PROFILING_SAMPLE_RATES = {'/posts/<post_id:\\d+>': 1}
+        self.assertIn('X-Profile-Id',
+                      self.testapp.get(self.post_url).headers)
+        self.assertNotIn('X-Profile-Id', self.testapp.get('/').headers)
+
+    def testSampledRequestsAreMatchedOnce(self):
+        matched = []
+
+        def matcher(router, request):
+            matched.append(request.path)
+            return webapp2.Router.default_matcher(router, request)
+        app.router.set_dispatcher(webapp2.Router.default_dispatcher)
+        app.router.set_matcher(matcher)
+        app.router.set_dispatcher(profiled(app.router.dispatch))
+
+        settings.PROFILING_SAMPLE_RATES = {'/posts/<post_id:\\d+>': 1}
+        self.testapp.get(self.post_url)
+        self.assertEqual(matched, [self.post_url])
+
+    def testProfilesCanBeDownloaded(self):
+        response = self.testapp.get(self.post_url + '?_profile=1',
+                                    headers={'X-Profile-Secret': 'secret'})
+        profile_id = response.headers['X-Profile-Id']
+
+        profiles = self.testapp.get('/admin/profiles').json
+        self.assertEqual(profiles[0]['id'], profile_id)
+        self.assertEqual(profiles[0]['route'], '/posts/<post_id:\\d+>')
+
+        download = self.testapp.get('/admin/profiles/%s' % profile_id)
+        stats = marshal.loads(download.body)
+        self.assertTrue(any(filename.endswith('posts.py') and
+                            function == 'load_post_page'
+                            for filename, line, function in stats))
+
+        report = self.testapp.get('/admin/profiles/%s?format=text' %
+                                  profile_id)
+        self.assertIn('function calls', report.body)
@@ -0,0 +1,142 @@
+"""
+Test suite for testing the datastore cost of each route.
+
+In particular, this test suite tests that:
+
+    - Each route looks up the Post and Comment it concerns at most once
+    - The post page batches its lookups, rather than making one RPC each
+
+ndb's in-context and memcache caches are disabled so that every lookup the
+application makes reaches the datastore stub and is counted
+
+"""
+
+import webtest
+import unittest
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+from main import app
+from model.comment import Comment
+from model.post import Post
+from model.user import User
+from util.auth import create_user_cookie
+
+
+class DatastoreGetCounter(object):
+    """
+    An apiproxy hook that tallies the keys looked up by datastore Get RPCs,
+    by kind, and the datastore RPCs made, by call
+    """
+
+    def __init__(self):
+        self.lookups = {}
+        self.rpcs = {}
+
+    def count(self, service, call, request, response):
+        self.rpcs[call] = self.rpcs.get(call, 0) + 1
+        if call == 'Get':
+            for key in request.key_list():
+                kind = key.path().element_list()[-1].type()
+                self.lookups[kind] = self.lookups.get(kind, 0) + 1
+
+    def reset(self):
+        self.lookups = {}
+        self.rpcs = {}
+
+
+class TestRequestCost(unittest.TestCase):
+
+    def setUp(self):
+        self.testapp = webtest.TestApp(app)
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+
+        context = ndb.get_context()
+        context.set_cache_policy(False)
+        context.set_memcache_policy(False)
+
+        self.counter = DatastoreGetCounter()
+        apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+            'datastore_get_counter', self.counter.count, 'datastore_v3')
+
+        User(id="Author", password="password").put()
+        User(id="Reader", password="password").put()
+        self.post_id = Post(title="Test", content="Test",
+                            submitter="Author").put().integer_id()
+        self.comment_id = Comment(content="Test", submitter="Author",
+                                  post_id=self.post_id).put().integer_id()
+        self.counter.reset()
+
+    def tearDown(self):
+        context = ndb.get_context()
+        context.set_cache_policy(None)
+        context.set_memcache_policy(None)
+        self.testbed.deactivate()
+
+    def assertLookupsAtMostOnce(self):
+        for kind in ('Post', 'Comment'):
+            self.assertLessEqual(self.counter.lookups.get(kind, 0), 1,
+                                 '%s looked up %d times' %
+                                 (kind, self.counter.lookups.get(kind, 0)))
+
+    def testPostPageLooksUpPostOnce(self):
+        self.testapp.set_cookie('user', create_user_cookie('Reader'))
+        self.testapp.get('/posts/%d' % self.post_id)
+        self.assertEqual(self.counter.lookups.get('Post'), 1)
+
+    def testPostPageBatchesItsLookups(self):
+        self.testapp.set_cookie('user', create_user_cookie('Reader'))
+        self.testapp.get('/posts/%d' % self.post_id)
+
+        # With the like count cached, the post and the viewer's like are
+        # looked up in a single Get, alongside the query for the comments
+        self.counter.reset()
+        self.testapp.get('/posts/%d' % self.post_id)
+        self.assertEqual(self.counter.rpcs, {'Get': 1, 'RunQuery': 1})
+        self.assertEqual(self.counter.lookups, {'Post': 1, 'Like': 1})
+
+    def testEditPostLooksUpPostOnce(self):
+        self.testapp.set_cookie('user', create_user_cookie('Author'))
+        self.testapp.get('/posts/%d/edit' % self.post_id)
+        self.assertEqual(self.counter.lookups.get('Post'), 1)
+
+        self.counter.reset()
+        self.testapp.post('/posts/%d/edit' % self.post_id,
+                          {'title': 'Edited', 'content': 'Edited'})
+        self.assertEqual(self.counter.lookups.get('Post'), 1)
+
+    def testDeletePostLooksUpPostOnce(self):
+        self.testapp.set_cookie('user', create_user_cookie('Author'))
+        self.testapp.get('/posts/%d/delete' % self.post_id)
+        self.assertLookupsAtMostOnce()
+
+    def testLikePostLooksUpPostOnce(self):
+        self.testapp.set_cookie('user', create_user_cookie('Reader'))
+        self.testapp.get('/posts/%d/like' % self.post_id)
+        self.assertLookupsAtMostOnce()
+
+    def testCreateCommentLooksUpPostOnce(self):
+        self.testapp.set_cookie('user', create_user_cookie('Reader'))
+        self.testapp.post('/posts/%d/comments' % self.post_id,
+                          {'content': 'New'})
+        self.assertLookupsAtMostOnce()
+
+    def testEditCommentLooksUpEntitiesOnce(self):
+        url = '/posts/%d/comments/%d' % (self.post_id, self.comment_id)
+        self.testapp.set_cookie('user', create_user_cookie('Author'))
+        self.testapp.get(url)
+        self.assertLookupsAtMostOnce()
+
+        self.counter.reset()
+        self.testapp.post(url, {'content': 'Edited'})
+        self.assertEqual(self.counter.lookups.get('Comment'), 1)
+
+    def testDeleteCommentLooksUpCommentOnce(self):
+        self.testapp.set_cookie('user', create_user_cookie('Author'))
+        self.testapp.get('/posts/%d/comments/%d/delete' %
+                         (self.post_id, self.comment_id))
+        self.assertEqual(self.counter.lookups.get('Comment'), 1)
@@ -0,0 +1,102 @@
+"""
+Test suite for testing the search features of a blog.
+
+In particular, this test suite tests:
+
+    - Searching posts and comments
+    - Keeping the index up to date as posts and comments are written
+    - Rebuilding the index
+
+"""
+
+import webtest
+import unittest
+from google.appengine.ext import testbed
+from main import app
+from model.post import Post
+from model.comment import Comment
+from model.search import SearchDocument
+from util.auth import create_user_cookie
+from task_helpers import run_queued_tasks
+import settings
+
+
+class TestSearchFeatures(unittest.TestCase):
+
+    def setUp(self):
+        self.testapp = webtest.TestApp(app)
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+        self.search_page_size = settings.SEARCH_PAGE_SIZE
+        self.testapp.set_cookie('user', create_user_cookie('Author'))
+
+    def tearDown(self):
+        settings.SEARCH_PAGE_SIZE = self.search_page_size
+        self.testbed.deactivate()
+
+    def createPost(self, title, content):
+        response = self.testapp.post('/posts', {'title': title,
+                                                'content': content})
+        return int(response.location.rsplit('/', 1)[1])
+
+    def search(self, text):
+        response = self.testapp.get('/search', {'q': text})
+        return [str(link['href'])
+                for link in response.html.select('.result-link')]
+
+    def testPostsAreFoundByTitleAndContent(self):
+        post_id = self.createPost('Zebra sightings', 'Stripes everywhere.')
+        self.createPost('Unrelated', 'Nothing to see.')
+        self.assertEqual(self.search('zebra'), ['/posts/%d' % post_id])
+        self.assertEqual(self.search('Stripes'), ['/posts/%d' % post_id])
+        self.assertEqual(self.search('zebra stripes'),
+                         ['/posts/%d' % post_id])
+        self.assertEqual(self.search('zebra nothing'), [])
+
+    def testIndexFollowsEditsAndDeletes(self):
+        post_id = self.createPost('Zebra', 'Stripes')
+        url = '/posts/%d' % post_id
+        self.testapp.post(url + '/edit', {'title': 'Giraffe',
+                                          'content': 'Spots'})
+        self.assertEqual(self.search('zebra'), [])
+        self.assertEqual(self.search('giraffe'), [url])
+
+        self.testapp.post(url + '/comments', {'content': 'Giraffes rule'})
+        comment_id = Comment.query().get().key.integer_id()
+        self.assertEqual(self.search('rule'), ['%s#%d' % (url, comment_id)])
+
+        self.testapp.post('%s/comments/%d/edit' % (url, comment_id),
+                          {'content': 'Okapis rule'})
+        self.assertEqual(self.search('okapis'), ['%s#%d' % (url, comment_id)])
+
+        self.testapp.get(url + '/delete')
+        self.assertEqual(self.search('giraffe'), [])
+        self.assertEqual(self.search('okapis'), [])
+        run_queued_tasks(self.testbed, self.testapp)
+        self.assertEqual(SearchDocument.query().count(), 0)
+
+    def testResultsAreRankedAndPaged(self):
+        settings.SEARCH_PAGE_SIZE = 1
+        quiet_id = self.createPost('Zebra', 'Quiet')
+        popular_id = Post(title='Zebra', content='Popular', submitter='Me',
+                          likes=10).put().integer_id()
+        self.testapp.get('/tasks/reindex-posts')
+        run_queued_tasks(self.testbed, self.testapp)
+
+        response = self.testapp.get('/search', {'q': 'zebra'})
+        self.assertEqual(response.html.select('.result-link')[0]['href'],
+                         '/posts/%d' % popular_id)
+        response = self.testapp.get(
+            str(response.html.select('.page-next')[0]['href']))
+        self.assertEqual(response.html.select('.result-link')[0]['href'],
+                         '/posts/%d' % quiet_id)
+        self.assertEqual(len(response.html.select('.page-next')), 0)
+
+    def testPostsWithoutTitlesAreIndexed(self):
+        post_id = Post(content='Untitled zebra', submitter='Me').put().id()
+        self.testapp.get('/tasks/reindex-posts')
+        run_queued_tasks(self.testbed, self.testapp)
+        self.assertEqual(self.search('zebra'), ['/posts/%d' % post_id])
@@ -0,0 +1,32 @@
+"""
+Helpers for running the tasks that the application enqueues, for test suites
+that initialise the task queue stub
+"""
+
+from google.appengine.ext import testbed
+
+
+def run_queued_tasks(test_testbed, testapp):
+    """
+    Run every task in the default queue against the application, including
+    any tasks that those tasks enqueue, until the queue is empty
+
+    Args:
+        test_testbed: An activated Testbed with the task queue stub initialised
+        testapp: The webtest.TestApp to run the tasks against
+
+    Returns:
+        The number of tasks that were run
+    """
+    taskqueue_stub = test_testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+    run = 0
+    tasks = taskqueue_stub.get_filtered_tasks()
+    while tasks:
+        taskqueue_stub.FlushQueue('default')
+        for task in tasks:
+            testapp.post(task.url, task.payload,
+                         headers={'Content-Type':
+                                  'application/x-www-form-urlencoded'})
+            run += 1
+        tasks = taskqueue_stub.get_filtered_tasks()
+    return run
@@ -0,0 +1,150 @@
+"""
+Test suite for testing bulk export and import of a blog's data.
+
+In particular, this test suite tests that:
+
+    - An export can be downloaded as JSON Lines
+    - Importing an export restores every entity, including users' passwords
+    - Imported ids are never allocated to new entities
+    - Imported posts are listed and searchable once the import is done
+
+"""
+
+import json
+import webtest
+import unittest
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+from main import app
+from model.comment import Comment
+from model.like import toggle_like
+from model.post import Post
+from model.user import User
+from task_helpers import run_queued_tasks
+import model.transfer as transfer
+
+
+class TestTransferFeatures(unittest.TestCase):
+
+    def setUp(self):
+        self.testapp = webtest.TestApp(app)
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+
+        # Small batches and chunks, so that transfers take several steps
+        self.sizes = (transfer.CHUNK_BYTES, transfer.EXPORT_BATCH_SIZE,
+                      transfer.IMPORT_BATCH_SIZE)
+        transfer.CHUNK_BYTES = 500
+        transfer.EXPORT_BATCH_SIZE = 2
+        transfer.IMPORT_BATCH_SIZE = 2
+
+        User(id="Author", password="password").put()
+        User(id="Reader", password="password").put()
+        for n in range(3):
+            post = Post(title=u"Post \u2116%d" % n, content="Content",
+                        submitter="Author", liked_by=["Legacy"])
+            post.put()
+            Comment.create(post.key.integer_id(), content="Comment",
+                           submitter="Reader").put()
+            toggle_like("Reader", post)
+
+    def tearDown(self):
+        (transfer.CHUNK_BYTES, transfer.EXPORT_BATCH_SIZE,
+         transfer.IMPORT_BATCH_SIZE) = self.sizes
+        self.testbed.deactivate()
+
+    def snapshot(self):
+        ndb.get_context().clear_cache()
+        return dict((entity.key, entity.to_dict(exclude=['updated']))
+                    for model in transfer.EXPORT_MODELS
+                    for entity in model.query())
+
+    def export(self):
+        job = self.testapp.post('/admin/export', status=202).json
+        run_queued_tasks(self.testbed, self.testapp)
+        status = self.testapp.get('/admin/transfers/%d' % job['id']).json
+        self.assertEqual(status['status'], 'done')
+        self.assertGreater(status['chunks'], 1)
+        return self.testapp.get('/admin/transfers/%d/download' % job['id'])
+
+    def testExportIsJSONLines(self):
+        lines = self.export().body.splitlines()
+        self.assertEqual(len(lines), len(self.snapshot()))
+        kinds = [json.loads(line)['key'][-2] for line in lines]
+        self.assertEqual(kinds, sorted(kinds, key=[
+            model._get_kind() for model in transfer.EXPORT_MODELS].index))
+
+    def testImportRestoresExport(self):
+        before = self.snapshot()
+        export = self.export().body
+        ndb.delete_multi(before.keys())
+        self.assertEqual(self.snapshot(), {})
+
+        job = self.testapp.post('/admin/import',
+                                upload_files=[('file', 'export.jsonl',
+                                               export)],
+                                status=202).json
+        run_queued_tasks(self.testbed, self.testapp)
+        self.assertEqual(
+            self.testapp.get('/admin/transfers/%d' % job['id']).json,
+            dict(job, status='done', entities=len(before)))
+        self.assertEqual(self.snapshot(), before)
+
+        # Passwords are imported as they were stored, not hashed again
+        response = self.testapp.post('/users/in', {'username': 'Reader',
+                                                   'password': 'password'})
+        self.assertEqual(response.location, 'http://localhost/users/welcome')
+
+    def testImportResumesFromItsCheckpoint(self):
+        export = self.export().body
+        job = transfer.start_import(iter(export.splitlines(True)))
+        job.next_line = 1
+        job.put()
+        ndb.delete_multi(self.snapshot().keys())
+
+        while transfer.import_step(job.key.integer_id()):
+            pass
+        self.assertIsNone(User.get_by_id('Author'))
+        self.assertIsNotNone(User.get_by_id('Reader'))
+
+    def testImportedIdsAreReserved(self):
+        # A fresh datastore that allocates ids in sequence, from 1
+        self.testbed.init_datastore_v3_stub(
+            auto_id_policy=datastore_stub_util.SEQUENTIAL)
+        lines = [transfer.serialize(Post(id=n, title="Imported",
+                                         content="Content",
+                                         submitter="Author")) + '\n'
+                 for n in range(1, 4)]
+        job = transfer.start_import(iter(lines))
+        while transfer.import_step(job.key.integer_id()):
+            pass
+
+        new_id = Post(title="New", content="Content",
+                      submitter="Author").put().integer_id()
+        self.assertGreater(new_id, 3)
+        self.assertEqual(Post.get_by_id(1).title, "Imported")
+
+    def testImportedPostsAreListedAndSearchable(self):
+        post = Post(id=1000, title="Imported", content="Imported content",
+                    submitter="Author")
+        post.put()
+        line = transfer.serialize(post)
+        post.key.delete()
+        self.assertNotIn("Imported", self.testapp.get('/').body)
+
+        self.testapp.post('/admin/import',
+                          upload_files=[('file', 'export.jsonl', line)],
+                          status=202)
+        run_queued_tasks(self.testbed, self.testapp)
+
+        self.assertIn("Imported", self.testapp.get('/').body)
+        self.assertIn("Imported", self.testapp.get('/feed.atom').body)
+        self.assertIn("Imported", self.testapp.get('/users/Author').body)
+        response = self.testapp.get('/search', {'q': 'imported'})
+        self.assertEqual([str(link['href'])
+                          for link in response.html.select('.result-link')],
+                         ['/posts/1000'])
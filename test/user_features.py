@@ -87,6 +87,14 @@ class TestUserFeatures(unittest.TestCase):
         username_error_elements = form_response.html.select('.username-error')
         self.assertTrue(len(username_error_elements) > 0)
 
+    def testUserCannotCreateAccountWithReservedUsername(self):
+        for username in ('new', 'in', 'out', 'welcome'):
+            form_response = self.signUpNewUserWithUsername(username)
+            username_error_elements = form_response.html.select(
+                '.username-error')
+            self.assertTrue(len(username_error_elements) > 0)
+            self.assertIsNone(User.get_by_id(username))
+
     def testUserCanSignInWithCorrectCredentials(self):
         sign_in_response = self.testapp.request("/users/in")
         form = sign_in_response.form
@@ -113,3 +121,15 @@ class TestUserFeatures(unittest.TestCase):
         self.assertIsNone(user_cookie)
         redirect_response = redirect.follow()
         self.assertEqual(redirect_response.request.path, '/users/in')
+
+    def testMalformedCookieIsTreatedAsSignedOut(self):
+        for cookie in ("junk", "Test|junk_mac", "|"):
+            self.testapp.set_cookie('user', cookie)
+
+            response = self.testapp.get("/")
+            self.assertEqual(response.status_int, 200)
+            self.assertIsNotNone(response.html.find('a', href='/users/in'))
+
+            response = self.testapp.get("/posts/new")
+            self.assertEqual(response.status_int, 302)
+            self.assertEqual(response.follow().request.path, "/users/in")
@@ -0,0 +1,63 @@
+"""
+Test suite for testing how new instances of the blog start.
+
+In particular, this test suite tests:
+
+    - Warming up an instance
+    - Measuring cold starts
+    - Keeping cold starts within their budget (only when
+      CHECK_COLD_START_BUDGET is set in the environment, since timings vary
+      between machines)
+
+"""
+
+import os
+import webtest
+import unittest
+from google.appengine.api import memcache
+from google.appengine.ext import testbed
+from bench import startup
+from handler.posts import FRONT_PAGE_NAMESPACE
+from main import app
+from model.post import Post
+from util.templates import template_names
+import util.cache as cache
+
+
+class TestWarmupFeatures(unittest.TestCase):
+
+    def setUp(self):
+        self.testapp = webtest.TestApp(app)
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def testWarmupLoadsTemplatesAndPrimesCaches(self):
+        Post(title="Title", content="Content", submitter="Author").put()
+        response = self.testapp.get('/_ah/warmup')
+        self.assertIn('Loaded %d templates' % len(template_names()),
+                      response.body)
+        self.assertIn('/ 200', response.body)
+        self.assertIn('/feed.atom 200', response.body)
+
+        # The front page's listing is already cached for the first visitor
+        key = cache.versioned_key(FRONT_PAGE_NAMESPACE, 'top', '', False)
+        self.assertIn('Title', memcache.get(key))
+
+    def testColdStartIsMeasuredByPhase(self):
+        results = startup.measure(runs=1)
+        self.assertEqual([name for name, ms in results['phases']],
+                         [name for name, modules in startup.STARTUP_PHASES] +
+                         ['load templates'])
+
+    @unittest.skipUnless(os.environ.get('CHECK_COLD_START_BUDGET'),
+                         'set CHECK_COLD_START_BUDGET to time cold starts')
+    def testColdStartIsWithinBudget(self):
+        results = startup.measure(runs=3)
+        self.assertLessEqual(results['total_ms'], startup.BUDGET_MS,
+                             results['phases'])
@@ -1,5 +1,21 @@
 import webapp2
-from util.auth import validate_user_cookie
+from util.auth import get_identity
+from util.cache import digest
+from util.instrumentation import timed
+
+
+def _timed_chunks(stream):
+    # Renders a template stream a chunk at a time as the body is sent, timing
+    # each chunk as part of the render phase. This happens after the response
+    # headers are sent, so it is reported in the request's log line rather
+    # than in its Server-Timing header
+    iterator = iter(stream)
+    while True:
+        with timed('render'):
+            chunk = next(iterator, None)
+        if chunk is None:
+            return
+        yield chunk.encode('utf-8')
 
 
 class AuthAwareRequestHandler(webapp2.RequestHandler):
@@ -8,7 +24,76 @@ class AuthAwareRequestHandler(webapp2.RequestHandler):
     that augments any template data with a 'signed_in' key-value that indicates
     whether a user is currently signed in.
 
+    The current user is available as the identity property, which is shared
+    with the decorators in util.auth_decorators
+
+    Handlers that can tell cheaply whether a page has changed call
+    not_modified before rendering, so that clients holding an up to date copy
+    are answered with 304 Not Modified instead
+
+    Handlers that set stream_response have their pages streamed: rather than
+    rendering the whole page before responding, write hands the server an
+    iterator that renders the page a few template fragments at a time, so
+    the top of the page can be sent while the rest is still being rendered.
+    Rendering then happens after the handler returns, so errors in the
+    template can no longer be answered with an error page. (The App Engine
+    production front end buffers whole responses, so streaming there saves
+    only the memory of the page being held as one string)
+
     """
+    stream_response = False
+
+    @property
+    def identity(self):
+        """
+        The Identity of the user making this request
+        """
+        return get_identity(self.request)
+
+    def not_modified(self, validators, last_modified=None):
+        """
+        Set the response's validators, and check them against the request's
+        If-None-Match and If-Modified-Since headers. If-Modified-Since is only
+        consulted when If-None-Match is absent
+
+        Args:
+            validators: A sequence of values that together identify this
+                version of the response, including anything about the viewer
+                that changes what is rendered. They are summarized as a weak
+                ETag
+            last_modified: The naive UTC datetime at which the response last
+                changed, or None if it is not known
+
+        Returns:
+            True if the client's copy is current, in which case the response
+            has been made a 304 and the handler should return without
+            rendering; False otherwise
+        """
+        etag = '"%s"' % digest(*validators)
+        self.response.headers['ETag'] = 'W/' + etag
+        self.response.headers['Vary'] = 'Cookie'
+        self.response.headers['Cache-Control'] = 'no-cache'
+        if last_modified:
+            self.response.last_modified = last_modified
+
+        if_none_match = self.request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # Weak comparison: the W/ prefix is ignored on either side
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            fresh = '*' in tags or any(
+                (tag[2:] if tag.startswith('W/') else tag) == etag
+                for tag in tags)
+        else:
+            if_modified_since = self.request.if_modified_since
+            fresh = (last_modified is not None and
+                     if_modified_since is not None and
+                     last_modified.replace(microsecond=0) <=
+                     if_modified_since.replace(tzinfo=None))
+
+        if fresh:
+            self.response.status = 304
+            del self.response.headers['Content-Type']
+        return fresh
 
     def write(self, template, context={}):
         """
@@ -18,7 +103,12 @@ class AuthAwareRequestHandler(webapp2.RequestHandler):
             template: The Jinja2 template to render
             context: A dictionary of variables to render in the Jinja2 template
         """
-        cookie = self.request.cookies.get('user')
-        signed_in = validate_user_cookie(cookie)
-        context['signed_in'] = signed_in
-        self.response.out.write(template.render(context=context))
\ No newline at end of file
+        context['signed_in'] = self.identity.signed_in
+        if self.stream_response:
+            stream = template.stream(context=context)
+            stream.enable_buffering()
+            self.response.app_iter = _timed_chunks(stream)
+        else:
+            with timed('render'):
+                page = template.render(context=context)
+            self.response.out.write(page)
@@ -0,0 +1,131 @@
+"""
+Bundling and fingerprinting of the application's static assets.
+
+Running this module (e.g. `python -m util.assets`) before deploying builds
+each of BUNDLES into public/build/: the bundle's files are concatenated into a
+single file named after a hash of its contents, and the name of each built
+file is recorded in asset_manifest.json. Stylesheets are minified; scripts are
+not, but a library's own minified build (e.g. js/vendor/foundation.min.js) is
+used in place of its source wherever one is vendored alongside it. App Engine
+compresses static files itself, so no compressed copies are built. Because a
+built file's name changes whenever its content does, app.yaml can serve
+public/build/ with far-future, immutable caching.
+
+Templates refer to bundles through the assets() global rather than by path.
+Under the development server, or when no manifest has been built, it returns
+the bundle's unbuilt source files instead
+"""
+
+import json
+import os
+import re
+from hashlib import md5
+import settings
+
+public_dir = os.path.join(os.path.dirname(__file__), '../public')
+build_dir = os.path.join(public_dir, 'build')
+manifest_path = os.path.join(os.path.dirname(__file__),
+                             '../asset_manifest.json')
+
+# Each bundle's name, and the files under public/ that it concatenates, in
+# order
+BUNDLES = [
+    ('app.css', ['css/foundation.css',
+                 'css/app.css']),
+    ('app.js', ['js/vendor/jquery.js',
+                'js/vendor/what-input.js',
+                'js/vendor/foundation.js',
+                'js/app.js']),
+]
+
+
+def _read_manifest(path):
+    try:
+        with open(path) as manifest:
+            return json.load(manifest)
+    except (IOError, ValueError):
+        return None
+
+
+_manifest = _read_manifest(manifest_path)
+
+
+def assets(bundle):
+    """
+    List the URLs that a page should load for a bundle
+
+    Args:
+        bundle: The name of one of BUNDLES, e.g. 'app.css'
+
+    Returns:
+        A list of URLs: the bundle's built file if a manifest has been built,
+        otherwise each of its source files
+    """
+    if _manifest and bundle in _manifest and not settings.DEVELOPMENT:
+        return ['/public/build/' + _manifest[bundle]]
+    return ['/public/' + path for path in dict(BUNDLES)[bundle]]
+
+
+def minify_css(source):
+    """
+    Strip comments (other than /*! license comments) and insignificant
+    whitespace from a stylesheet
+
+    Args:
+        source: The stylesheet, as a str
+
+    Returns:
+        The minified stylesheet
+    """
+    source = re.sub(r'/\*(?!!).*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r' ?([{};,]) ?', r'\1', source)
+    return source.replace(';}', '}').strip() + '\n'
+
+
+def _source_for(path):
+    # Prefer a library's own minified build where one is distributed
+    root, extension = os.path.splitext(path)
+    minified = os.path.join(public_dir, root + '.min' + extension)
+    if os.path.exists(minified):
+        with open(minified) as source:
+            return source.read().strip() + '\n'
+
+    with open(os.path.join(public_dir, path)) as source:
+        content = source.read()
+    return minify_css(content) if extension == '.css' else content
+
+
+def build(out_dir=build_dir, out_manifest=manifest_path):
+    """
+    Build every bundle into out_dir, and record the built files in a manifest
+
+    Args:
+        out_dir: The directory to write built files to
+        out_manifest: The path to write the manifest to
+
+    Returns:
+        The manifest, as a dict of bundle names to built file names
+    """
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    manifest = {}
+    for bundle, paths in BUNDLES:
+        separator = ';\n' if bundle.endswith('.js') else '\n'
+        content = separator.join(_source_for(path) for path in paths)
+        name, extension = os.path.splitext(bundle)
+        built = '%s-%s%s' % (name, md5(content).hexdigest()[:12], extension)
+
+        with open(os.path.join(out_dir, built), 'wb') as out:
+            out.write(content)
+        manifest[bundle] = built
+
+    with open(out_manifest, 'w') as out:
+        json.dump(manifest, out, indent=2, sort_keys=True)
+    return manifest
+
+
+# If assets.py is running as the main module, build every bundle
+if __name__ == "__main__":
+    build()
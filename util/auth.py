@@ -17,6 +17,8 @@ def hmac(data):
         A message authentication code, as a string
     """
     hmac_secret = '$2a$12$4HrCZYbcfR9ebUQ5gWUNb.'
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
     return md5(data + hmac_secret).hexdigest()
 
 
@@ -35,6 +37,26 @@ def validate_mac(data, their_mac):
     return our_mac == their_mac
 
 
+def parse_user_cookie(cookie):
+    """
+    Extracts the username from a user's cookie, validating its MAC
+
+    Args:
+        cookie: A cookie of the form "username|MAC"
+
+    Returns:
+        The username if the cookie is well formed and hash(username) == MAC;
+        None otherwise
+    """
+    if not cookie or '|' not in cookie:
+        return None
+
+    user, _, mac = cookie.rpartition('|')
+    if user and validate_mac(user, mac):
+        return user
+    return None
+
+
 def validate_user_cookie(cookie):
     """
     Validates the MAC of a user's cookie
@@ -45,12 +67,7 @@ def validate_user_cookie(cookie):
     Returns:
         True if hash(value) == MAC; False otherwise
     """
-
-    if cookie:
-        user, mac = cookie.split('|')
-        return validate_mac(user, mac)
-
-    return False
+    return parse_user_cookie(cookie) is not None
 
 
 def create_user_cookie(user):
@@ -66,9 +83,48 @@ def create_user_cookie(user):
     return "%s|%s" % (user, hmac(user))
 
 
+class Identity(object):
+    """
+    The identity of the user making a request, as established by the request's
+    'user' cookie
+
+    Attributes:
+        user_id: The username of the signed in user, or None if the request
+            has no valid 'user' cookie
+    """
+
+    def __init__(self, user_id=None):
+        self.user_id = user_id
+
+    @property
+    def signed_in(self):
+        return self.user_id is not None
+
+
+def get_identity(request):
+    """
+    Retrieve the identity of the user making a request. The 'user' cookie is
+    parsed and validated on first use, and the result is reused for the rest
+    of the request
+
+    Args:
+        request: A webapp2.Request
+
+    Returns:
+        An Identity
+    """
+    identity = request.registry.get('identity')
+    if identity is None:
+        identity = Identity(parse_user_cookie(request.cookies.get('user')))
+        request.registry['identity'] = identity
+    return identity
+
+
 # If auth.py is running as the main module, check that the cookie validation
 # functions are invertible
 if __name__ == "__main__":
 
     assert validate_user_cookie(create_user_cookie('user')) is True
     assert validate_user_cookie("junk_user|junk_mac") is False
+    assert validate_user_cookie("junk") is False
+    assert parse_user_cookie(create_user_cookie('a|b')) == 'a|b'
@@ -1,10 +1,42 @@
 """
 Decorator functions for aborting or redirecting responses depending on the
 state of the user's authentication
+
+Decorators that need a Post or Comment load it once per request and hand it
+down the decorator chain in kwargs['post'] or kwargs['comment'], so that
+stacked decorators and the decorated handler share a single datastore lookup
 """
 from model.post import Post
 from model.comment import Comment
-from util.auth import validate_user_cookie
+from util.auth import get_identity
+from util.instrumentation import timed
+
+
+def _load_post(kwargs):
+    """
+    Retrieve the Post identified by kwargs['post_id'], loading it from the
+    datastore only if no earlier decorator has already done so
+
+    Returns:
+        The Post, or None if it does not exist
+    """
+    if 'post' not in kwargs:
+        kwargs['post'] = Post.get_by_id(int(kwargs['post_id']))
+    return kwargs['post']
+
+
+def _load_comment(kwargs):
+    """
+    Retrieve the Comment identified by kwargs['comment_id'], loading it from
+    the datastore only if no earlier decorator has already done so
+
+    Returns:
+        The Comment, or None if it does not exist
+    """
+    if 'comment' not in kwargs:
+        kwargs['comment'] = Comment.get_for_post(kwargs['post_id'],
+                                                 kwargs['comment_id'])
+    return kwargs['comment']
 
 
 def user_is_post_author(fn, invert=False):
@@ -25,8 +57,8 @@ def user_is_post_author(fn, invert=False):
     def redirect_if_not_author(*args, **kwargs):
         self = args[0]
         user_id = kwargs['user_id']
-        post_id = kwargs['post_id']
-        post = Post().get_by_id(int(post_id))
+        with timed('checks'):
+            post = _load_post(kwargs)
 
         is_author = (post.submitter == user_id)
 
@@ -62,8 +94,8 @@ def user_is_comment_author(fn):
     def redirect_if_not_author(*args, **kwargs):
         self = args[0]
         user_id = kwargs['user_id']
-        comment_id = kwargs['comment_id']
-        comment = Comment().get_by_id(int(comment_id))
+        with timed('checks'):
+            comment = _load_comment(kwargs)
 
         if comment and comment.submitter == user_id:
             # Call the decorated function
@@ -98,9 +130,10 @@ def user_is_signed_in(fn):
 
     def redirect_if_not_signed_in(*args, **kwargs):
         self = args[0]
-        cookie = self.request.cookies.get('user')
-        if validate_user_cookie(cookie):
-            kwargs['user_id'] = self.request.cookies.get('user').split("|")[0]
+        with timed('checks'):
+            identity = get_identity(self.request)
+        if identity.signed_in:
+            kwargs['user_id'] = identity.user_id
             fn(self, **kwargs)
         else:
             self.redirect('/users/in')
@@ -114,12 +147,13 @@ def post_exists(fn):
     request in the case where a Post with a given post_id actually exists.
 
     If a Post does not exist, the application will trigger a 404 response.
+    Otherwise, the Post is passed on in kwargs['post'].
 
     """
     def error_if_post_does_not_exist(*args, **kwargs):
         self = args[0]
-        post_id = kwargs['post_id']
-        post = Post.get_by_id(int(post_id))
+        with timed('checks'):
+            post = _load_post(kwargs)
 
         if post:
             fn(self, **kwargs)
@@ -136,14 +170,15 @@ def comment_exists(fn):
     exists.
 
     If a Comment does not exist, the application will trigger a 404 response.
+    Otherwise, the Comment is passed on in kwargs['comment'].
 
     """
     def error_if_comment_does_not_exist(*args, **kwargs):
         self = args[0]
-        post_id = kwargs['comment_id']
-        post = Comment.get_by_id(int(post_id))
+        with timed('checks'):
+            comment = _load_comment(kwargs)
 
-        if post:
+        if comment:
             fn(self, **kwargs)
         else:
             self.abort(404)
@@ -0,0 +1,105 @@
+"""
+Helpers for caching rendered content in memcache.
+
+Cached entries are grouped into namespaces, each of which has a version number
+stored in memcache. A write invalidates a whole namespace at once by bumping
+its version, orphaning every entry that was keyed with the previous version.
+Listings are read with eventually consistent queries, so a page rendered just
+after a bump may not yet reflect the write; recently_bumped lets callers cache
+such pages only briefly
+"""
+import time
+from hashlib import md5
+from google.appengine.api import memcache
+import settings
+
+
+def _version_key(namespace):
+    return 'version:%s' % namespace
+
+
+def _bumped_key(namespace):
+    return 'bumped:%s' % namespace
+
+
+def _initial_version():
+    # Versions are seeded from the clock so that a namespace whose version has
+    # been evicted from memcache never reuses a number from before the eviction
+    return int(time.time() * 1000)
+
+
+def get_version(namespace):
+    """
+    Retrieve the current version of a namespace, creating it if necessary
+
+    Args:
+        namespace: The name of the namespace, as a str
+
+    Returns:
+        The namespace's version, as an int
+    """
+    version = memcache.get(_version_key(namespace))
+    if version is None:
+        version = memcache.incr(_version_key(namespace),
+                                initial_value=_initial_version())
+    return version
+
+
+def bump_version(namespace):
+    """
+    Invalidate every entry cached in a namespace
+
+    Args:
+        namespace: The name of the namespace, as a str
+    """
+    memcache.incr(_version_key(namespace), initial_value=_initial_version())
+    memcache.set(_bumped_key(namespace), True,
+                 time=settings.RECENT_WRITE_CACHE_SECONDS)
+
+
+def recently_bumped(*namespaces):
+    """
+    Check whether any of some namespaces was invalidated so recently that
+    queries may not yet reflect the write that invalidated it
+
+    Args:
+        namespaces: The names of the namespaces, as strs
+
+    Returns:
+        True if any of the namespaces was bumped within the last
+        settings.RECENT_WRITE_CACHE_SECONDS, in which case anything rendered
+        from a query should only be cached for that long
+    """
+    return bool(memcache.get_multi([_bumped_key(namespace)
+                                    for namespace in namespaces]))
+
+
+def digest(*parts):
+    """
+    Summarize some values as a short fixed-length str
+
+    Args:
+        parts: The values to summarize. unicode values are encoded as UTF-8;
+            anything else is converted with str
+
+    Returns:
+        A hex digest that changes whenever any of the parts change
+    """
+    return md5('\0'.join(part.encode('utf-8') if isinstance(part, unicode)
+                          else str(part) for part in parts)).hexdigest()
+
+
+def versioned_key(namespace, *parts):
+    """
+    Build a memcache key for an entry in a namespace
+
+    Args:
+        namespace: The name of the namespace, as a str
+        parts: Any further strs that identify the entry within the namespace
+
+    Returns:
+        A memcache key that is only valid until the namespace's version is
+        next bumped
+    """
+    return '%s:%d:%s' % (namespace, get_version(namespace) or 0,
+                         digest(*parts))
@@ -0,0 +1,262 @@
+"""
+Per-request performance instrumentation.
+
+When settings.INSTRUMENTATION is on, main.app is wrapped with instrument(),
+which times each request and the phases within it:
+
+    - checks: the decorators in util.auth_decorators
+    - datastore: datastore RPCs (count and total time)
+    - memcache: memcache RPCs (count, hits, misses and total time)
+    - render: template rendering
+    - body: producing the body after the handler returns (i.e. streaming)
+
+Phases can overlap (a check that loads a post spends its datastore time in
+both checks and datastore), and concurrent RPCs are each timed in full.
+
+Each response carries the timings in a Server-Timing header, and each
+request is logged as a single JSON line keyed by its route's template. A
+streamed page is rendered (and its body produced) after its headers are sent,
+so its render and body times appear only in the log line; its Server-Timing
+header has neither.
+
+When instrumentation is off nothing is wrapped or hooked, and timed() is a
+shared no-op
+"""
+
+import json
+import logging
+import threading
+import time
+from google.appengine.api import apiproxy_stub_map
+
+_local = threading.local()
+
+
+class RequestTimings(object):
+    """
+    The timings collected for one request
+
+    Attributes:
+        start: The time at which the request began
+        route: The template of the route that handled the request, or None
+        handler: The name of the handler class, or None
+        phases: A dict of phase names to total seconds
+        counts: A dict of counter names (e.g. 'datastore', 'memcache_hits')
+            to totals
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self.route = None
+        self.handler = None
+        self.phases = {}
+        self.counts = {}
+        self._pending = {}
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    def count(self, name, amount=1):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def server_timing(self):
+        """
+        Returns:
+            The timings so far, as the value of a Server-Timing header
+        """
+        metrics = []
+        for phase, seconds in sorted(self.phases.items()):
+            metric = '%s;dur=%.1f' % (phase, seconds * 1000)
+            if phase == 'datastore':
+                metric += ';desc="%d RPCs"' % self.counts.get('datastore', 0)
+            elif phase == 'memcache':
+                metric += ';desc="%d hits, %d misses"' % (
+                    self.counts.get('memcache_hits', 0),
+                    self.counts.get('memcache_misses', 0))
+            metrics.append(metric)
+        metrics.append('total;dur=%.1f' % ((time.time() - self.start) * 1000))
+        return ', '.join(metrics)
+
+    def log_record(self, status):
+        """
+        Returns:
+            The timings, as a dict for a structured log line
+        """
+        record = {'route': self.route,
+                  'handler': self.handler,
+                  'status': status,
+                  'total_ms': round((time.time() - self.start) * 1000, 1)}
+        for phase, seconds in self.phases.items():
+            record['%s_ms' % phase] = round(seconds * 1000, 1)
+        record.update(self.counts)
+        return record
+
+
+def current():
+    """
+    Returns:
+        The RequestTimings of the request being handled by this thread, or
+        None if instrumentation is off
+    """
+    return getattr(_local, 'timings', None)
+
+
+class _Timer(object):
+
+    def __init__(self, timings, phase):
+        self.timings = timings
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *exc_info):
+        self.timings.add(self.phase, time.time() - self.start)
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_null_timer = _NullTimer()
+
+
+def timed(phase):
+    """
+    Time a block of code as part of a phase of the current request, e.g.
+
+        with timed('render'):
+            ...
+
+    Args:
+        phase: The name of the phase
+
+    Returns:
+        A context manager
+    """
+    timings = current()
+    if timings is None:
+        return _null_timer
+    return _Timer(timings, phase)
+
+
+def _before_rpc(service, call, request, response):
+    timings = current()
+    if timings is not None:
+        timings._pending[id(request)] = time.time()
+
+
+def _after_rpc(service, call, request, response):
+    timings = current()
+    if timings is None:
+        return
+    start = timings._pending.pop(id(request), None)
+    if start is None:
+        return
+
+    phase = 'datastore' if service == 'datastore_v3' else service
+    timings.add(phase, time.time() - start)
+    timings.count(phase)
+    if service == 'memcache' and call == 'Get':
+        hits = response.item_size()
+        timings.count('memcache_hits', hits)
+        timings.count('memcache_misses', request.key_size() - hits)
+
+
+def _instrumented_dispatcher(dispatch):
+    # Wraps a router's (bound) dispatch method, recording the route that the
+    # router matched
+    def dispatcher(router, request, response):
+        try:
+            return dispatch(request, response)
+        finally:
+            timings = current()
+            route = getattr(request, 'route', None)
+            if timings is not None and route is not None:
+                timings.route = route.template
+                timings.handler = getattr(route.handler, '__name__',
+                                          str(route.handler))
+    return dispatcher
+
+
+class _LoggedAppIter(object):
+    # Wraps a response's body iterator, so that time spent producing a
+    # streamed body is counted, and the request is logged once it is sent
+
+    def __init__(self, app_iter, timings, status):
+        self.app_iter = app_iter
+        self.timings = timings
+        self.status = status
+
+    def __iter__(self):
+        iterator = iter(self.app_iter)
+        while True:
+            _local.timings = self.timings
+            start = time.time()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.timings.add('body', time.time() - start)
+            yield chunk
+
+    def close(self):
+        if hasattr(self.app_iter, 'close'):
+            self.app_iter.close()
+        logging.info(json.dumps(self.timings.log_record(self.status[0]),
+                                sort_keys=True))
+        _local.timings = None
+
+
+class InstrumentationMiddleware(object):
+    """
+    WSGI middleware that collects RequestTimings for each request. Any other
+    attribute (e.g. router) is looked up on the wrapped application
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __getattr__(self, name):
+        return getattr(self.app, name)
+
+    def __call__(self, environ, start_response):
+        timings = RequestTimings()
+        _local.timings = timings
+        status = [None]
+
+        def instrumented_start_response(status_line, headers, exc_info=None):
+            status[0] = int(status_line.split(' ', 1)[0])
+            headers.append(('Server-Timing', timings.server_timing()))
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            app_iter = self.app(environ, instrumented_start_response)
+        except Exception:
+            _local.timings = None
+            raise
+        return _LoggedAppIter(app_iter, timings, status)
+
+
+def instrument(app):
+    """
+    Instrument a webapp2.WSGIApplication. Installs the apiproxy hooks that
+    time RPCs (once per process), and records each request's route
+
+    Args:
+        app: The WSGIApplication
+
+    Returns:
+        The WSGI application to serve in its place
+    """
+    apiproxy = apiproxy_stub_map.apiproxy
+    apiproxy.GetPreCallHooks().Append('instrumentation', _before_rpc)
+    apiproxy.GetPostCallHooks().Append('instrumentation', _after_rpc)
+    app.router.set_dispatcher(_instrumented_dispatcher(app.router.dispatch))
+    return InstrumentationMiddleware(app)
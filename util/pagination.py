@@ -0,0 +1,95 @@
+"""
+Helpers for paging through ndb queries with opaque, url-safe cursors.
+
+Pages are addressed by a cursor rather than by an offset, so fetching page N
+costs the same as fetching the first page
+"""
+from google.appengine.api import datastore_errors
+from google.appengine.ext import ndb as db
+
+
+class Page(object):
+    """
+    A single page of query results
+
+    Attributes:
+        items: The entities on this page, in display order
+        next_cursor: A url-safe cursor for the following page, or None if this
+            is the last page
+        prev_cursor: A url-safe cursor for the preceding page, or None if this
+            is the first page. The preceding page must be requested backwards
+            (i.e. with the 'dir=prev' parameter)
+    """
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+def _urlsafe(cursor):
+    return cursor.urlsafe() if cursor else None
+
+
+@db.tasklet
+def fetch_next_page_async(query, page_size, urlsafe_cursor=None):
+    """
+    Fetch a page of results from a query, for callers that only ever step
+    forwards (so Page.prev_cursor is never set)
+
+    Args:
+        query: The ndb query to page through
+        page_size: The maximum number of entities on a page
+        urlsafe_cursor: A url-safe cursor marking where the page starts, as
+            issued in Page.next_cursor
+
+    Returns:
+        A Future for a Page. A missing or malformed cursor yields the first
+        page
+    """
+    try:
+        cursor = db.Cursor(urlsafe=urlsafe_cursor) if urlsafe_cursor else None
+        items, end, more = yield query.fetch_page_async(page_size,
+                                                        start_cursor=cursor)
+    except (datastore_errors.BadValueError, datastore_errors.BadRequestError):
+        if not urlsafe_cursor:
+            raise
+        items, end, more = yield query.fetch_page_async(page_size)
+
+    raise db.Return(Page(items, _urlsafe(end) if more else None))
+
+
+def fetch_page(query, reverse_query, page_size, urlsafe_cursor=None,
+               backwards=False):
+    """
+    Fetch a page of results from a query
+
+    Args:
+        query: The ndb query to page through
+        reverse_query: The same query with each sort order inverted. Used to
+            step backwards from a cursor
+        page_size: The maximum number of entities on a page
+        urlsafe_cursor: A url-safe cursor marking where the page starts, as
+            issued in Page.next_cursor or Page.prev_cursor
+        backwards: If True, fetch the page that precedes urlsafe_cursor
+
+    Returns:
+        A Page. A missing or malformed cursor yields the first page
+    """
+    try:
+        cursor = db.Cursor(urlsafe=urlsafe_cursor) if urlsafe_cursor else None
+
+        if cursor and backwards:
+            items, end, more = reverse_query.fetch_page(
+                page_size, start_cursor=cursor.reversed())
+            items.reverse()
+            prev_cursor = end.reversed() if more and end else None
+            return Page(items, _urlsafe(cursor), _urlsafe(prev_cursor))
+
+        items, end, more = query.fetch_page(page_size, start_cursor=cursor)
+        return Page(items, _urlsafe(end) if more else None, _urlsafe(cursor))
+
+    except (datastore_errors.BadValueError, datastore_errors.BadRequestError):
+        if urlsafe_cursor:
+            return fetch_page(query, reverse_query, page_size)
+        raise
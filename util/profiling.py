@@ -0,0 +1,200 @@
+"""
+On-demand cProfile profiling of individual requests.
+
+When settings.PROFILING is on, main.app's router dispatch is wrapped with
+profiled(). A request is then run under cProfile if either:
+
+    - It asks to be, with the query parameter _profile=1 or the header
+      X-Profile: 1, and it comes from an administrator (as signed in to App
+      Engine) or carries settings.PROFILING_SECRET in an X-Profile-Secret
+      header
+    - It is sampled: a route listed in settings.PROFILING_SAMPLE_RATES is
+      profiled once in every N requests, on average
+
+Profiles are stored in memcache for settings.PROFILE_CACHE_SECONDS, and the
+id of a request's profile is returned in its X-Profile-Id header. They can
+be listed at /admin/profiles and downloaded (in the format that pstats
+loads) from /admin/profiles/<id>
+"""
+
+import cProfile
+import marshal
+import pstats
+import random
+import time
+import uuid
+import zlib
+from StringIO import StringIO
+from google.appengine.api import memcache
+from google.appengine.api import users
+import settings
+
+try:
+    from hmac import compare_digest
+except ImportError:
+    # hmac.compare_digest is only in Python 2.7.7 and later
+    def compare_digest(a, b):
+        result = len(a) ^ len(b)
+        for x, y in zip(a, b):
+            result |= ord(x) ^ ord(y)
+        return result == 0
+
+_INDEX_KEY = 'profiles'
+
+# The number of profiles listed at /admin/profiles
+INDEX_SIZE = 50
+
+
+def _profile_key(profile_id):
+    return 'profile:%s' % profile_id
+
+
+def _requested(request):
+    if (request.GET.get('_profile') != '1' and
+            request.headers.get('X-Profile') != '1'):
+        return False
+    if users.is_current_user_admin():
+        return True
+    secret = request.headers.get('X-Profile-Secret')
+    return bool(settings.PROFILING_SECRET and secret and
+                compare_digest(str(secret), str(settings.PROFILING_SECRET)))
+
+
+def _sampled(router, request):
+    if not settings.PROFILING_SAMPLE_RATES:
+        return False
+    # The match is recorded on the request, as the dispatcher records it, so
+    # that _remembered_matcher can hand it back when the request is dispatched
+    request.route, request.route_args, request.route_kwargs = \
+        router.match(request)
+    rate = settings.PROFILING_SAMPLE_RATES.get(request.route.template)
+    return bool(rate) and random.random() * rate < 1
+
+
+def _remembered_matcher(match):
+    # Wraps a router's (bound) match method, so that a request whose route
+    # has already been recorded is not matched against every route again
+    def matcher(router, request):
+        if request.route is not None:
+            return request.route, request.route_args, request.route_kwargs
+        return match(request)
+    return matcher
+
+
+def save_profile(profiler, route, url, seconds):
+    """
+    Store a finished profile in memcache, and list it in the index of recent
+    profiles
+
+    Args:
+        profiler: The cProfile.Profile that ran the request
+        route: The template of the request's route
+        url: The request's URL
+        seconds: The request's wall time while profiled
+
+    Returns:
+        The new profile's id
+    """
+    profiler.create_stats()
+    profile_id = uuid.uuid4().hex
+    memcache.set(_profile_key(profile_id),
+                 zlib.compress(marshal.dumps(profiler.stats)),
+                 time=settings.PROFILE_CACHE_SECONDS)
+
+    index = memcache.get(_INDEX_KEY) or []
+    index.insert(0, {'id': profile_id, 'route': route, 'url': url,
+                     'ms': round(seconds * 1000, 1), 'at': time.time()})
+    memcache.set(_INDEX_KEY, index[:INDEX_SIZE],
+                 time=settings.PROFILE_CACHE_SECONDS)
+    return profile_id
+
+
+def recent_profiles():
+    """
+    Returns:
+        A list of dicts describing the most recent profiles, newest first.
+        Profiles that have since been evicted from memcache may be listed
+    """
+    return memcache.get(_INDEX_KEY) or []
+
+
+def load_profile(profile_id):
+    """
+    Retrieve a stored profile
+
+    Args:
+        profile_id: The profile's id
+
+    Returns:
+        The profile in pstats' marshalled format, as a str, or None if it has
+        expired
+    """
+    data = memcache.get(_profile_key(profile_id))
+    return zlib.decompress(data) if data is not None else None
+
+
+class _LoadedProfile(object):
+    # Presents stored stats as a finished profiler, which pstats can load
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def format_profile(data, sort='cumulative', limit=50):
+    """
+    Render a stored profile as a pstats report
+
+    Args:
+        data: The profile, as returned by load_profile
+        sort: The pstats sort key
+        limit: The number of functions to report
+
+    Returns:
+        The report, as a str
+    """
+    out = StringIO()
+    stats = pstats.Stats(_LoadedProfile(marshal.loads(data)), stream=out)
+    stats.sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def profiled(dispatch):
+    """
+    Wrap a router's dispatch method so that requested or sampled requests are
+    profiled
+
+    Args:
+        dispatch: The router's current (bound) dispatch method. The router's
+            matcher is also wrapped, so that a request matched to decide
+            whether to sample it is not matched again to dispatch it
+
+    Returns:
+        A dispatcher function, for Router.set_dispatcher
+    """
+    router = dispatch.__self__
+    router.set_matcher(_remembered_matcher(router.match))
+
+    def dispatcher(router, request, response):
+        if not (_requested(request) or _sampled(router, request)):
+            return dispatch(request, response)
+
+        def run():
+            result = dispatch(request, response)
+            # Render streamed pages within the profile
+            response.app_iter = list(response.app_iter)
+            return result
+
+        profiler = cProfile.Profile()
+        start = time.time()
+        try:
+            return profiler.runcall(run)
+        finally:
+            route = getattr(request, 'route', None)
+            profile_id = save_profile(profiler,
+                                      route.template if route else None,
+                                      request.url, time.time() - start)
+            response.headers['X-Profile-Id'] = profile_id
+    return dispatcher
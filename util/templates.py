@@ -0,0 +1,95 @@
+"""
+The Jinja environment shared by every handler.
+
+Outside the development server, templates are not checked for changes once
+loaded, and are compiled at most once per deployment:
+
+    - If the templates have been precompiled (by running this module, e.g.
+      `python -m util.templates`, before deploying), they are imported from
+      template_compiled/ rather than parsed
+    - Otherwise, compiled bytecode is shared between instances via memcache
+"""
+
+import os
+from google.appengine.api import memcache
+from jinja2 import (ChoiceLoader, Environment, FileSystemLoader,
+                    MemcachedBytecodeCache, ModuleLoader)
+from util.assets import assets
+from util.jinja_filters import post_age_formatter, trim_to_two_sentences
+import settings
+
+template_dir = os.path.join(os.path.dirname(__file__), '../template')
+compiled_template_dir = os.path.join(os.path.dirname(__file__),
+                                     '../template_compiled')
+
+
+def create_environment(loader, **options):
+    """
+    Create a Jinja environment with the application's filters and the assets
+    global installed
+
+    Args:
+        loader: The Jinja loader to load templates with
+        options: Any further keyword arguments for the Environment
+
+    Returns:
+        A jinja2.Environment
+    """
+    env = Environment(loader=loader, autoescape=True, **options)
+    env.filters['post_age'] = post_age_formatter
+    env.filters['trim'] = trim_to_two_sentences
+    env.globals['assets'] = assets
+    return env
+
+
+def _create_shared_environment():
+    if settings.DEVELOPMENT:
+        return create_environment(FileSystemLoader(template_dir))
+
+    loader = FileSystemLoader(template_dir)
+    if os.path.isdir(compiled_template_dir):
+        loader = ChoiceLoader([ModuleLoader(compiled_template_dir), loader])
+
+    bytecode_prefix = 'jinja2/%s/' % os.environ.get('CURRENT_VERSION_ID', '')
+    return create_environment(
+        loader, auto_reload=False,
+        bytecode_cache=MemcachedBytecodeCache(memcache,
+                                              prefix=bytecode_prefix))
+
+
+jinja_env = _create_shared_environment()
+
+
+def template_names():
+    """
+    Returns:
+        The name of every template in template_dir, sorted
+    """
+    return FileSystemLoader(template_dir).list_templates()
+
+
+def load_templates(env=None):
+    """
+    Load every template into a Jinja environment's template cache, so that
+    later requests for them are not held up compiling (or importing, or
+    fetching the bytecode of) them
+
+    Args:
+        env: The environment to load the templates into. Defaults to
+            jinja_env
+
+    Returns:
+        The number of templates loaded
+    """
+    env = env or jinja_env
+    names = template_names()
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+# If templates.py is running as the main module, precompile every template
+# into compiled_template_dir
+if __name__ == "__main__":
+    create_environment(FileSystemLoader(template_dir)).compile_templates(
+        compiled_template_dir, zip=None, ignore_errors=False)